@@ -1,11 +1,13 @@
-import copy
-
 import control
 import gym
 import numpy as np
-import scipy
 
+from pre_investigations.python.dare.utils.discretization import discretize
+from pre_investigations.python.dare.utils.expm_action import ExpmAction
 from pre_investigations.python.dare.utils.nodeconstructor import NodeConstructor
+from pre_investigations.python.dare.utils.reduction import get_output_indices, reduce_grid
+from pre_investigations.python.dare.utils.simulator import Simulator
+from pre_investigations.python.dare.utils.syscache import SystemCache, default_cache
 
 
 class Reward:
@@ -44,7 +46,8 @@ class Env_DARE(gym.Env):
     TIMEOUT = 1000
 
     def __init__(self, num_sources=2, num_loads=1, CM=None, ts=1e-4, parameter=None, x0=None, limits=None, refs=None,
-                 gamma=0, time_start=0):
+                 gamma=0, time_start=0, power_grid=None, sparse=False, cache=None, backend='dense',
+                 reduction=None, outputs=None):
         """
 
         :param num_sources:
@@ -57,29 +60,78 @@ class Env_DARE(gym.Env):
         :param refs:
         :param gamma:
         :param time_start:
+        :param power_grid: prebuilt node constructor (e.g. NodeConstructorCableLoads), if None a NodeConstructor is
+                           created from num_sources, num_loads, parameter and CM
+        :param sparse: if True, the system matrices are requested in sparse format from the node constructor
+        :param cache: SystemCache for the (discretized) system matrices, if None the in-memory default cache of the
+                      process is used, if False the matrices are always rebuilt
+        :param backend: 'dense' steps with the discretized (ZOH) matrices, 'krylov' advances the state with the action of
+                        the matrix exponential on the sparse system matrix, so A_d is never formed (for large grids)
+        :param reduction: if not None, the env steps a reduced model of the grid, dict with the arguments of
+                          dare.utils.reduction.reduce_grid (e.g. {'order': 10, 'method': 'balanced', 'outputs': ['u_1'],
+                          'residualize': True}), the observations (also the one of reset) are the selected outputs
+                          C_r x_r, x0 is projected onto the reduced states, which are only kept internally (only with
+                          backend 'dense')
+        :param outputs: states which are observed, given by name (see get_states of the node constructor, e.g.
+                        ['u_1', 'i_c3', 'u_l2']) or index, if None all states are observed (for a reduced model the
+                        outputs are set in reduction)
         """
 
         # toDo shift gamma to env wrapper (or kwargs?)
         super(Env_DARE, self).__init__()
 
-        power_grid = NodeConstructor(num_sources, num_loads, parameter, CM=CM)  # 2 Source with 2 connections
+        if power_grid is None:
+            power_grid = NodeConstructor(num_sources, num_loads, parameter, CM=CM)  # 2 Source with 2 connections
         # power_grid.draw_graph()
 
-        A, B, C, D = power_grid.get_sys()
-        # discretize
-        A_d = scipy.linalg.expm(A * ts)
-        A_inv = scipy.linalg.inv(A)
-        B_d = A_inv @ (A_d - np.eye(A.shape[0])) @ B
-        C_d = copy.copy(C)
+        if backend not in ['dense', 'krylov']:
+            raise ValueError(f"Expect backend to be 'dense' or 'krylov', not {backend}.")
+        self.backend = backend
+
+        if reduction is not None and backend != 'dense':
+            raise ValueError(f"Expect backend 'dense' for a reduced model, not {backend}.")
+        if reduction is not None and outputs is not None:
+            raise ValueError("Expect the outputs of a reduced model in reduction.")
+        self.reduction = None
+        self.outputs = None if outputs is None else get_output_indices(power_grid, outputs)
+
+        if reduction is not None:
+            (A_r, B_r, C_r, D_r), self.reduction = reduce_grid(power_grid, **reduction)
+            A_d, B_d = discretize(A_r, B_r, ts, 'zoh')
+            self.sys_d = control.ss(A_d, B_d, C_r, D_r, dt=True)
+            self.simulator = Simulator(A_d, B_d, C=C_r, D=D_r)
+            num_states = A_r.shape[0]
+            num_outputs = C_r.shape[0]
+        elif backend == 'krylov':
+            A, B, self.C, _ = power_grid.get_sys(sparse=True)
+            if self.outputs is not None:
+                self.C = self.C[self.outputs]
+            self.expm_action = ExpmAction(A, B, ts)
+            num_states = A.shape[0]
+            num_outputs = self.C.shape[0]
+        else:
+            # discretize (ZOH), a grid which was built before is taken from the cache
+            if cache is None:
+                cache = default_cache
+            if cache is False:
+                cache = SystemCache(maxsize=0)
+            system = cache.get_system(power_grid, ts, 'zoh', sparse=sparse)
+            A_d, B_d, C_d = system['A_d'], system['B_d'], system['C']
+            self.sys_d = control.ss(A_d, B_d, C_d, 0, dt=True)
+            self.simulator = Simulator(A_d, B_d, C=C_d, outputs=self.outputs)
+            num_states = A_d.shape[0]
+            num_outputs = C_d.shape[0] if self.outputs is None else len(self.outputs)
 
         if x0 is None:
-            self.x0 = np.zeros((A_d.shape[0],))
+            self.x0 = np.zeros((num_states,))
+        elif self.reduction is not None:
+            # x0 of the full grid projected onto the reduced states, the observations are C_r @ x0_r
+            self.x0 = self.reduction['Ti'] @ x0
         else:
             self.x0 = x0
         self.time_step_size = ts
         self.sim_time_interval = None
         self.time_start = time_start
-        self.sys_d = control.ss(A_d, B_d, C_d, 0, dt=True)
         self.v_dc = parameter['V_dc']
 
         self.number_of_steps = 0
@@ -96,8 +148,17 @@ class Env_DARE(gym.Env):
             # HINT: Currently only LC filters are considered! x is sorted depending on node constructor
             # Therefore, limits are sorted in dependence of power_grid [sources (i, v),..., transitions (i - since
             # only RL connections are considered jet)]
-            self.norm_array = np.array([self.i_lim, self.v_lim] * power_grid.num_source +
-                                       [self.i_lim] * power_grid.num_connections)
+            if hasattr(power_grid, 'get_states'):
+                # currents start with 'i', voltages with 'u'
+                self.norm_array = np.array([self.i_lim if state.startswith('i') else self.v_lim
+                                            for state in power_grid.get_states()])
+            else:
+                self.norm_array = np.array([self.i_lim, self.v_lim] * power_grid.num_source +
+                                           [self.i_lim] * power_grid.num_connections)
+            if self.reduction is not None:
+                self.norm_array = self.norm_array[self.reduction['outputs']]
+            elif self.outputs is not None:
+                self.norm_array = self.norm_array[self.outputs]
 
         self.rew = Reward(parameter, limits, self.refs, gamma)
 
@@ -110,7 +171,7 @@ class Env_DARE(gym.Env):
         self.observation_space = gym.spaces.Box(
             low=-np.inf,
             high=np.inf,
-            shape=(A.shape[0],),
+            shape=(num_outputs,),
             dtype=np.float32
         )
 
@@ -131,21 +192,16 @@ class Env_DARE(gym.Env):
             self.done = True
 
         act = action * self.v_dc
-        # actions is "doubled" since in sipy ltisys.py L.3505 last is discarded
-        # toDo more performant stepwise interaction possible?
-        T, yout, xout = control.forced_response(self.sys_d, T=self.sim_time_interval,
-                                                U=np.array([act.squeeze(), act.squeeze()]).T,
-                                                X0=self._state,
-                                                return_x=True, squeeze=True)
-
-        # get the last solution of the solver (2 are given)
-        self._state = xout[:, -1]
 
-        if self.normalize:
-            # toDo
-            obs = (yout[:, -1] / self.norm_array)
+        if self.backend == 'krylov':
+            # action held constant over the step (ZOH) like in the discretized system
+            self._state = self.expm_action.step(self._state, np.atleast_1d(act.squeeze()))
+            y = self.C @ self._state
         else:
-            obs = yout[:, -1]
+            # action held constant over the step (ZOH), state and output are new arrays, not the simulator buffers
+            self._state, y = self.simulator.step(np.atleast_1d(act.squeeze()))
+
+        obs = self._get_observation(y)
 
         reward = 5.0  # self.rew.rew_function(obs)
 
@@ -154,11 +210,28 @@ class Env_DARE(gym.Env):
     def reset(self):
         """
         Resets env to initial state x0 and starttime
-        :return: Environment State
+        :return: Observation at x0 (the selected outputs, the outputs of the reduced model with reduction)
         """
 
         self._state = self.x0
+        if self.backend == 'dense':
+            self.simulator.reset(self.x0)
+            y = self.simulator.y.copy()
+        else:
+            y = self.C @ self.x0
         self.current_timestep = self.time_start
         self.done = False
         self.number_of_steps = 0
-        return self._state
+        # the observation at x0 like in step, i.e. only the selected outputs
+        return self._get_observation(y)
+
+    def _get_observation(self, y):
+        """
+        Observation of an output
+        :param y: output of the simulated system (selected states or outputs of the reduced model)
+        :return: normalized output if normalize is True
+        """
+        if self.normalize:
+            # toDo
+            return y / self.norm_array
+        return y
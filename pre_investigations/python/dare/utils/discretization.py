@@ -0,0 +1,341 @@
+"""
+Discretization of continuous state space systems x' = A x + B u with the sampling time ts.
+
+None of the methods inverts A, so grids with a singular A (e.g. pure 'C' loads) are discretized as well.
+A and B may be dense arrays, stacks of dense systems with a leading batch axis or scipy sparse matrices.
+The discrete matrices are dense in general, so they are always returned as dense arrays.
+"""
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+
+
+def discretize(A, B, ts, method='zoh'):
+    """Discretize a continuous state space system
+
+    Args:
+        A: System matrix (..., n, n), dense or sparse
+        B: Input matrix (..., n, m), dense or sparse
+        ts: Sampling time (1,)
+        method: 'zoh' (zero-order hold), 'foh' (first-order hold) or 'tustin' (bilinear transform)
+
+    Returns:
+        'zoh', 'tustin': (A_d, B_d) with x[k+1] = A_d x[k] + B_d u[k]
+        'foh': (A_d, B_d0, B_d1) with x[k+1] = A_d x[k] + B_d0 u[k] + B_d1 u[k+1]
+    """
+
+    if method == 'zoh':
+        return zoh(A, B, ts)
+    elif method == 'foh':
+        return foh(A, B, ts)
+    elif method == 'tustin':
+        return tustin(A, B, ts)
+    else:
+        raise ValueError(f"Expect method to be 'zoh', 'foh' or 'tustin', not {method}.")
+
+
+def zoh(A, B, ts):
+    """Zero-order hold discretization
+
+    The discrete matrices are taken from the exponential of the augmented matrix
+
+        expm([[A, B], [0, 0]] * ts) = [[A_d, B_d], [0, I]]
+
+    so no inverse of A is needed. A and B can be stacks of systems with a leading batch axis (e.g. from
+    NodeConstructorCableLoads.get_sys_batch), the exponentials are then computed in one batched expm call.
+
+    Args:
+        A: System matrix (..., n, n)
+        B: Input matrix (..., n, m)
+        ts: Sampling time (1,)
+
+    Returns:
+        (A_d, B_d): Discrete system matrix (..., n, n) and input matrix (..., n, m)
+    """
+
+    expM, n, m = _augmented_expm(A, B, ts, foh=False)
+
+    return expM[..., :n, :n], expM[..., :n, n:]
+
+
+def foh(A, B, ts):
+    """First-order hold discretization
+
+    The input is interpolated linearly between the samples, so x[k+1] = A_d x[k] + B_d0 u[k] + B_d1 u[k+1].
+    The matrices are taken from the exponential of the augmented matrix
+
+        expm([[A*ts, B*ts, 0], [0, 0, I], [0, 0, 0]]) = [[A_d, B_d0 + B_d1, B_d1], [0, I, I], [0, 0, I]]
+
+    like in custom_control.forced_response. A and B can be stacks of systems with a leading batch axis.
+
+    Args:
+        A: System matrix (..., n, n)
+        B: Input matrix (..., n, m)
+        ts: Sampling time (1,)
+
+    Returns:
+        (A_d, B_d0, B_d1): Discrete system matrix (..., n, n) and input matrices of u[k] and u[k+1] (..., n, m)
+    """
+
+    expM, n, m = _augmented_expm(A, B, ts, foh=True)
+
+    B_d1 = expM[..., :n, n+m:]
+    B_d0 = expM[..., :n, n:n+m] - B_d1
+
+    return expM[..., :n, :n], B_d0, B_d1
+
+
+def tustin(A, B, ts):
+    """Bilinear (Tustin) discretization
+
+        A_d = (I - A*ts/2)^-1 (I + A*ts/2)
+        B_d = (I - A*ts/2)^-1 B*ts
+
+    (I - A*ts/2) is regular for every stable A. For sparse input it is factorized once with a sparse LU decomposition.
+
+    Args:
+        A: System matrix (..., n, n)
+        B: Input matrix (..., n, m)
+        ts: Sampling time (1,)
+
+    Returns:
+        (A_d, B_d): Discrete system matrix (..., n, n) and input matrix (..., n, m)
+    """
+
+    if scipy.sparse.issparse(A) or scipy.sparse.issparse(B):
+        A = scipy.sparse.csc_matrix(A, dtype=float)
+        B = _to_dense(B)
+        I = scipy.sparse.identity(A.shape[0], format='csc')
+
+        lu = scipy.sparse.linalg.splu((I - A * (ts/2)).tocsc())
+        A_d = lu.solve((I + A * (ts/2)).toarray())
+        B_d = lu.solve(B * ts)
+
+        return A_d, B_d
+
+    A = np.asarray(A, dtype=float)
+    B = np.asarray(B, dtype=float)
+    I = np.identity(A.shape[-1])
+
+    ima = I - A * (ts/2)
+    batch = np.broadcast_shapes(A.shape[:-2], B.shape[:-2])
+
+    rhs = np.concatenate((np.broadcast_to(I + A * (ts/2), batch + A.shape[-2:]),
+                          np.broadcast_to(B * ts, batch + B.shape[-2:])), axis=-1)
+    sol = np.linalg.solve(ima, rhs)
+
+    return sol[..., :A.shape[-1]], sol[..., A.shape[-1]:]
+
+
+def discretize_rates(A, B, ts, method='zoh'):
+    """Discretize a continuous state space system for several sampling times from one matrix exponential
+
+    Args:
+        A: System matrix (..., n, n), dense or sparse
+        B: Input matrix (..., n, m), dense or sparse
+        ts: Sampling times, the exponential is computed for the smallest one, every integer multiple of it is derived
+            by repeated squaring (list)
+        method: 'zoh', 'foh' or 'tustin' (see discretize)
+
+    Returns:
+        systems: Discrete matrices of every sampling time in the order of ts (list)
+    """
+
+    rates = MultiRate(A, B, min(ts))
+
+    return [rates.discretize(ts_k, method) for ts_k in ts]
+
+
+class MultiRate():
+    """Discrete matrices of one system for several sampling times
+
+    The exponential of the unscaled FOH augmented matrix
+
+        E(h) = expm([[A, B, 0], [0, 0, I], [0, 0, 0]] * h) = [[A_d, G1, G2], [0, I, h*I], [0, 0, I]]
+
+    maps [x(0); u(0); du] to [x(h); u(h); du] for the input u(t) = u(0) + du*t.
+
+    The exponential of a multiple is the power E(k*h) = E(h)^k, so E is computed once for the base sampling time h and
+    the exponential of every integer multiple k*h follows from the squares E(h*2^j) (binary powering, the squares are
+    kept for later calls). The ZOH
+    matrices of a rate t are (A_d, G1), the FOH ones (A_d, G1 - G2/t, G2/t), so both holds are consistent for every rate.
+
+    A sampling time which is h/k for an integer k becomes the new base (one expm), other ones are discretized on their own.
+    Build it with the smallest sampling time of a sweep (or request that one first) to get along with a single expm.
+
+    Example:
+        rates = MultiRate(A, B, 1e-6)
+        A_d, B_d = rates.discretize(1e-4)          # 1e-6 squared up, no further expm
+        A_d, B_d0, B_d1 = rates.discretize(1e-5, 'foh')
+    """
+
+    def __init__(self, A, B, ts):
+        """
+        Args:
+            A: System matrix (..., n, n), dense or sparse
+            B: Input matrix (..., n, m), dense or sparse
+            ts: Base sampling time (1,)
+        """
+
+        self.A = A
+        self.B = B
+        self.n = A.shape[-1]
+        self.m = B.shape[-1]
+
+        self._set_base(ts)
+
+    def _set_base(self, ts):
+        self.ts = ts
+        self._squares = [self._expm(ts)]
+
+    def _expm(self, ts):
+        """E(ts) from the FOH augmented matrix of _augmented_expm, whose last block column is scaled with 1/ts"""
+
+        E, n, m = _augmented_expm(self.A, self.B, ts, foh=True)
+        E[..., :, n+m:] *= ts
+        E[..., n+m:, :] /= ts
+
+        return E
+
+    def _get_multiple(self, ts):
+        """k if ts = k * base for an integer k >= 1, else None"""
+
+        k = int(round(ts / self.ts))
+
+        if k < 1 or not np.isclose(ts / self.ts, k, rtol=1e-9, atol=0):
+            return None
+
+        return k
+
+    def _get_square(self, j):
+        """E(base * 2^j)"""
+
+        while j >= len(self._squares):
+            self._squares.append(self._squares[-1] @ self._squares[-1])
+
+        return self._squares[j]
+
+    def get_exponential(self, ts):
+        """Exponential E(ts) of the unscaled augmented matrix (see class description) (..., n+2m, n+2m)"""
+
+        k = self._get_multiple(ts)
+
+        if k is None:
+            k_inv = int(round(self.ts / ts))
+            if k_inv > 1 and np.isclose(self.ts / ts, k_inv, rtol=1e-9, atol=0):
+                self._set_base(ts)
+                return self._squares[0]
+            return self._expm(ts)
+
+        E = None
+        j = 0
+        while k:
+            if k & 1:
+                E = self._get_square(j) if E is None else E @ self._get_square(j)
+            k >>= 1
+            j += 1
+
+        return E
+
+    def apply(self, ts, w):
+        """E(ts) @ w
+
+        For an integer multiple k of the base sampling time the squares are applied to w one after the other, so only
+        O(log k) matrix-vector products are needed (the squares are computed once).
+
+        Args:
+            ts: Time (1,)
+            w: Augmented vector [x; u; du], see class description (n+2m,) or (n+2m, K)
+
+        Returns:
+            E(ts) @ w
+        """
+
+        k = self._get_multiple(ts)
+
+        if k is None:
+            return self.get_exponential(ts) @ w
+
+        j = 0
+        while k:
+            if k & 1:
+                w = self._get_square(j) @ w
+            k >>= 1
+            j += 1
+
+        return w
+
+    def discretize(self, ts, method='zoh'):
+        """Discrete matrices of a sampling time
+
+        Args:
+            ts: Sampling time (1,)
+            method: 'zoh', 'foh' or 'tustin' (tustin needs no exponential and is computed directly)
+
+        Returns:
+            Discrete matrices like discretize
+        """
+
+        if method == 'tustin':
+            return tustin(self.A, self.B, ts)
+        if method not in ['zoh', 'foh']:
+            raise ValueError(f"Expect method to be 'zoh', 'foh' or 'tustin', not {method}.")
+
+        E = self.get_exponential(ts)
+        n, m = self.n, self.m
+
+        if method == 'zoh':
+            return E[..., :n, :n], E[..., :n, n:n+m]
+
+        B_d1 = E[..., :n, n+m:] / ts
+
+        return E[..., :n, :n], E[..., :n, n:n+m] - B_d1, B_d1
+
+
+def _augmented_expm(A, B, ts, foh):
+    """Exponential of the augmented ZOH or FOH matrix (see zoh and foh)
+
+    Returns:
+        (expM, n, m): Dense exponential (..., n+m, n+m) or (..., n+2m, n+2m) and the dimensions of the system
+    """
+
+    n = A.shape[-1]
+    m = B.shape[-1]
+
+    if scipy.sparse.issparse(A) or scipy.sparse.issparse(B):
+        A = scipy.sparse.csr_matrix(A, dtype=float)
+        B = scipy.sparse.csr_matrix(B, dtype=float)
+
+        if foh:
+            M = scipy.sparse.bmat([[A * ts, B * ts, None],
+                                   [None, None, scipy.sparse.identity(m)],
+                                   [scipy.sparse.csr_matrix((m, n)), None, scipy.sparse.csr_matrix((m, m))]])
+        else:
+            M = scipy.sparse.bmat([[A * ts, B * ts],
+                                   [scipy.sparse.csr_matrix((m, n)), scipy.sparse.csr_matrix((m, m))]])
+
+        return scipy.sparse.linalg.expm(M.tocsc()).toarray(), n, m
+
+    A = np.asarray(A, dtype=float)
+    B = np.asarray(B, dtype=float)
+    batch = np.broadcast_shapes(A.shape[:-2], B.shape[:-2])
+
+    size = n + 2*m if foh else n + m
+    M = np.zeros(batch + (size, size))
+    M[..., :n, :n] = A * ts
+    M[..., :n, n:n+m] = B * ts
+    if foh:
+        M[..., n:n+m, n+m:] = np.identity(m)
+
+    return scipy.linalg.expm(M), n, m
+
+
+def _to_dense(M):
+    """Dense float array of a dense or sparse matrix"""
+
+    if scipy.sparse.issparse(M):
+        return M.toarray().astype(float)
+
+    return np.asarray(M, dtype=float)
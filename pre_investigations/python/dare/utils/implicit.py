@@ -0,0 +1,96 @@
+"""
+Implicit integration of x' = A x + B u with a single sparse LU factorization.
+
+The theta method
+
+    (I - theta*h*A) x[k+1] = (I + (1-theta)*h*A) x[k] + h*B ((1-theta)*u[k] + theta*u[k+1])
+
+is the trapezoidal rule for theta = 1/2 (A-stable, second order) and the backward Euler method for theta = 1 (L-stable,
+first order, damps the fast cable modes completely). The matrix I - theta*h*A is factorized once, so a step costs a
+sparse product and two sparse triangular solves, O(nnz(L) + nnz(U)), and no dense n x n matrix is formed.
+"""
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+
+_THETA = {'trapezoidal': 0.5, 'backward_euler': 1.}
+
+
+class ImplicitStepper():
+    """Fixed step trapezoidal or backward Euler integration with a reused sparse LU factorization
+
+    Example:
+        stepper = ImplicitStepper(A, B, ts=1e-5)
+        xout = stepper.simulate(x0, U)
+    """
+
+    def __init__(self, A, B, ts, method='trapezoidal'):
+        """
+        Args:
+            A: System matrix, dense or sparse (n, n)
+            B: Input matrix, dense or sparse (n, m)
+            ts: Step size (1,)
+            method: 'trapezoidal' or 'backward_euler'
+        """
+
+        if method not in _THETA:
+            raise ValueError(f"Expect method to be 'trapezoidal' or 'backward_euler', not {method}.")
+
+        self.ts = ts
+        self.method = method
+        self.n = A.shape[0]
+
+        theta = _THETA[method]
+        A = scipy.sparse.csc_matrix(A, dtype=float)
+        B = scipy.sparse.csr_matrix(B, dtype=float)
+        identity = scipy.sparse.identity(self.n, format='csc')
+
+        # the pattern of A is symmetric (every coupling between a node and a cable appears in both equations), the
+        # minimum degree ordering of A^T + A keeps the fill-in of the factors close to nnz(A), COLAMD fills them densely
+        self.lu = scipy.sparse.linalg.splu((identity - theta * ts * A).tocsc(), permc_spec='MMD_AT_PLUS_A')
+        self.M = (identity + (1 - theta) * ts * A).tocsr()
+        self.B0 = (1 - theta) * ts * B
+        self.B1 = theta * ts * B
+
+    def step(self, x, u0, u1=None):
+        """Advance the state by one step
+
+        Args:
+            x: State (n,) or (n, K)
+            u0: Input at the start of the step (m,) or (m, K)
+            u1: Input at the end of the step, if None u0 is held (m,) or (m, K)
+
+        Returns:
+            x: State after the step (n,) or (n, K)
+        """
+
+        if u1 is None:
+            u1 = u0
+
+        return self.lu.solve(self.M @ x + self.B0 @ u0 + self.B1 @ u1)
+
+    def simulate(self, x0, U):
+        """Simulate from x0 with one input sample per step
+
+        Args:
+            x0: Initial state (n,)
+            U: Input samples (m, num_steps)
+
+        Returns:
+            xout: States at the samples (n, num_steps)
+        """
+
+        U = np.asarray(U, dtype=float)
+        num_steps = U.shape[1]
+
+        # input terms of all steps at once, the loop only solves
+        F = self.B0 @ U[:, :-1] + self.B1 @ U[:, 1:]
+
+        xout = np.empty((self.n, num_steps))
+        xout[:, 0] = x0
+        for i in range(1, num_steps):
+            xout[:, i] = self.lu.solve(self.M @ xout[:, i-1] + F[:, i-1])
+
+        return xout
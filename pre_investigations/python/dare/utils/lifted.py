@@ -0,0 +1,105 @@
+"""
+Lifted simulation of discrete state space systems in blocks of k samples.
+
+With the powers of A_d the states of the next k samples follow from the current state and the k+1 input samples of the
+block in one product
+
+    [x[1]; ...; x[k]] = A_lift x[0] + G [u[0]; ...; u[k]],     A_lift = [A_d; A_d^2; ...; A_d^k]
+
+where G is the block lower triangular Toeplitz matrix of the input responses. The input terms of all blocks are one
+matrix-matrix product before the loop, the loop does a single product with A_lift per block instead of k steps, which
+removes most of the interpreter overhead for the small grids. The flops per sample stay the same, but A_lift is k times
+larger than A_d, so for grids with more than about a hundred states a small k (or the dense stepping) is faster.
+"""
+
+import numpy as np
+
+
+class LiftedSystem():
+    """Lifted form of x[j+1] = A_d x[j] + B_d0 u[j] + B_d1 u[j+1] for blocks of k samples
+
+    Attributes:
+        A_lift: Powers A_d, ..., A_d^k stacked (k*n, n)
+        G: Input response of the block, [x[1]; ...; x[k]] = A_lift x[0] + G [u[0]; ...; u[k]] (k*n, (k+1)*m)
+    """
+
+    def __init__(self, Ad, Bd0, Bd1=None, k=16):
+        """
+        Args:
+            Ad: Discrete system matrix (n, n)
+            Bd0: Input matrix of the sample at the start of a step (n, m)
+            Bd1: Input matrix of the sample at the end of a step (FOH), if None zero (ZOH) (n, m)
+            k: Number of samples per block (1,)
+        """
+
+        if k < 1:
+            raise ValueError(f"Expect k to be at least 1, not {k}.")
+
+        Ad, Bd0 = np.asarray(Ad, dtype=float), np.asarray(Bd0, dtype=float)
+        Bd1 = np.zeros_like(Bd0) if Bd1 is None else np.asarray(Bd1, dtype=float)
+
+        self.k = k
+        self.n, self.m = Bd0.shape
+
+        powers = [np.identity(self.n)]
+        for _ in range(k):
+            powers.append(Ad @ powers[-1])
+        self.A_lift = np.concatenate(powers[1:])
+
+        # u[i] enters the step i -> i+1 with B_d0 and the step i-1 -> i with B_d1, so its block in the row of x[j] is
+        # A_d^(j-1-i) B_d0 + A_d^(j-i) B_d1 (the terms exist for i < j and 0 < i <= j)
+        PB0 = [P @ Bd0 for P in powers]
+        PB1 = [P @ Bd1 for P in powers]
+
+        n, m = self.n, self.m
+        self.G = np.zeros((k * n, (k + 1) * m))
+        for j in range(1, k + 1):
+            for i in range(j + 1):
+                block = self.G[(j - 1) * n:j * n, i * m:(i + 1) * m]
+                if i < j:
+                    block += PB0[j - 1 - i]
+                if i > 0:
+                    block += PB1[j - i]
+
+        self._Gt = np.ascontiguousarray(self.G.T)
+
+    def simulate(self, x0, U):
+        """Simulate from x0 with one input sample per step
+
+        Args:
+            x0: Initial state (n,)
+            U: Input samples (m, num_steps)
+
+        Returns:
+            xout: States at the samples (n, num_steps)
+        """
+
+        U = np.asarray(U, dtype=float)
+        num_steps = U.shape[1]
+        n, m, k = self.n, self.m, self.k
+
+        # states row wise, the rows of a block form one contiguous vector [x[1]; ...; x[k]]
+        X = np.empty((num_steps, n))
+        X[0] = x0
+
+        num_blocks = (num_steps - 1) // k
+        rest = (num_steps - 1) % k
+
+        if num_blocks > 0:
+            # input samples of every block [u[0]; ...; u[k]], neighbouring blocks share a sample
+            W = U.T[np.arange(num_blocks)[:, None] * k + np.arange(k + 1)].reshape(num_blocks, (k + 1) * m)
+            X_blocks = X[1:num_blocks * k + 1].reshape(num_blocks, k * n)
+            np.dot(W, self._Gt, out=X_blocks)
+
+            x = X[0]
+            for c in range(num_blocks):
+                X_blocks[c] += self.A_lift @ x
+                x = X_blocks[c, -n:]
+
+        if rest > 0:
+            # the leading blocks of A_lift and G are the lifted system of fewer samples
+            start = num_blocks * k
+            X[start + 1:] = (self.A_lift[:rest * n] @ X[start] +
+                             self.G[:rest * n, :(rest + 1) * m] @ U[:, start:].T.reshape(-1)).reshape(rest, n)
+
+        return X.T
@@ -0,0 +1,154 @@
+"""
+Simulation of continuous state space systems in the eigenbasis of A.
+
+With A = V diag(lambda) V^-1 the modal states z = V^-1 x are decoupled, so a step costs n complex multiplications
+instead of the dense product A_d x. The eigendecomposition is only used if the eigenvector matrix is well conditioned,
+a defective or nearly defective A has to be simulated with the dense matrices.
+"""
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+
+
+class ModalSystem():
+    """Eigendecomposition of a continuous state space system x' = A x + B u, y = C x + D u
+
+    Attributes:
+        eigenvalues: Eigenvalues of A (n,) complex
+        V: Eigenvectors of A with unit norm (n, n) complex
+        cond: 2-norm condition number of V (1,)
+        valid: True if the decomposition is used, i.e. cond <= cond_max (bool)
+        modes: Simulated modes, the real ones and one of every complex conjugated pair (n,) bool
+    """
+
+    def __init__(self, A, B, C, D=None, cond_max=1e8):
+        """
+        Args:
+            A: System matrix, dense or sparse (n, n)
+            B: Input matrix, dense or sparse (n, m)
+            C: Output matrix, dense or sparse (p, n), if None only the states can be simulated
+            D: Feedthrough matrix (p, m), if None zero
+            cond_max: Maximal condition number of the eigenvectors, the error of the modal simulation grows with
+                      cond * eps (1,)
+        """
+
+        A, B = [M.toarray() if scipy.sparse.issparse(M) else np.asarray(M, dtype=float) for M in [A, B]]
+        if C is not None:
+            C = C.toarray() if scipy.sparse.issparse(C) else np.asarray(C, dtype=float)
+            self.D = np.zeros((C.shape[0], B.shape[1])) if D is None else np.asarray(D, dtype=float)
+        self.cond_max = cond_max
+
+        self.eigenvalues, self.V = scipy.linalg.eig(A)
+        self.cond = np.linalg.cond(self.V)
+        self.valid = bool(np.isfinite(self.cond) and self.cond <= cond_max)
+
+        if self.valid:
+            # A is real, so the complex eigenvalues come in conjugated pairs with conjugated eigenvectors and modal
+            # states. Only the real modes and the first mode of every pair are simulated, the second one is covered by
+            # taking twice the real part: x = sum(Re(v*z)) over the real modes + sum(2*Re(v*z)) over the pairs
+            self.modes = self.eigenvalues.imag >= 0
+            weight = np.where(self.eigenvalues[self.modes].imag > 0, 2, 1)
+
+            # input and output matrices in modal coordinates
+            self.B_modal = np.linalg.solve(self.V, B)[self.modes]
+            self.C_modal = None if C is None else (C @ self.V[:, self.modes]) * weight
+            self.V_modal = self.V[:, self.modes] * weight
+
+    def get_discrete(self, dt, method='foh'):
+        """Per mode coefficients of the exact discretization
+
+        Args:
+            dt: Time step (1,)
+            method: 'foh', z[k+1] = a*z[k] + g0*(B_modal u[k]) + g1*(B_modal u[k+1]) or
+                    'zoh', z[k+1] = a*z[k] + g0*(B_modal u[k])
+
+        Returns:
+            (a, g0, g1): Coefficients of the simulated modes (num_modes,) complex, g1 is zero for 'zoh'
+        """
+
+        if method not in ['foh', 'zoh']:
+            raise ValueError(f"Expect method to be 'foh' or 'zoh', not {method}.")
+
+        z = self.eigenvalues[self.modes] * dt
+        phi1, phi2 = _phi(z)
+
+        a = np.exp(z)
+        if method == 'zoh':
+            return a, dt * phi1, np.zeros_like(a)
+
+        # integrals of exp(lambda*(dt-s)) with the hat functions (1 - s/dt) and s/dt over the step
+        g1 = dt * phi2
+
+        return a, dt * phi1 - g1, g1
+
+    def simulate(self, x0, U, dt, method='foh', return_x=False):
+        """Simulate from x0 with one input sample per time step
+
+        Args:
+            x0: Initial state (n,)
+            U: Input samples (m, num_steps)
+            dt: Time step (1,)
+            method: Input hold between the samples, 'foh' or 'zoh'
+            return_x: Also transform the states back, otherwise only the outputs are computed
+
+        Returns:
+            (yout, xout): Outputs (p, num_steps) and states (n, num_steps), yout is None without C and xout is None if
+                          return_x is False (and C is given)
+        """
+
+        if not self.valid:
+            raise ValueError(f"Expect the condition number of the eigenvectors to be at most {self.cond_max}, "
+                             f"but it is {self.cond}.")
+
+        U = np.asarray(U, dtype=float)
+        num_steps = U.shape[1]
+        a, g0, g1 = self.get_discrete(dt, method)
+
+        BU = self.B_modal @ U
+        F = g0[:, None] * BU[:, :-1]
+        if method == 'foh':
+            F += g1[:, None] * BU[:, 1:]
+
+        Z = np.empty((len(a), num_steps), dtype=complex)
+        Z[:, 0] = self.to_modal(x0)
+        for i in range(1, num_steps):
+            np.multiply(a, Z[:, i-1], out=Z[:, i])
+            Z[:, i] += F[:, i-1]
+
+        yout = None if self.C_modal is None else (self.C_modal @ Z).real + self.D @ U
+        xout = self.to_states(Z) if return_x or self.C_modal is None else None
+
+        return yout, xout
+
+    def to_modal(self, x):
+        """Modal states of the simulated modes z = (V^-1 x)[modes] (num_modes,) or (num_modes, K)"""
+
+        return np.linalg.solve(self.V, np.asarray(x, dtype=float))[self.modes]
+
+    def to_states(self, Z):
+        """States x of the modal states of the simulated modes (n,) or (n, K)"""
+
+        return (self.V_modal @ Z).real
+
+
+def _phi(z):
+    """phi1(z) = (exp(z) - 1)/z and phi2(z) = (exp(z) - 1 - z)/z^2, Taylor series for small |z| (no cancellation)"""
+
+    z = np.asarray(z, dtype=complex)
+    small = np.abs(z) < 0.1
+    z_large = np.where(small, 1, z)
+    exp_z = np.exp(z_large)
+
+    phi1 = (exp_z - 1) / z_large
+    phi2 = (exp_z - 1 - z_large) / z_large**2
+
+    # phi_p(z) = sum z^k / (k+p)!, the error of 12 terms is below |z|^12 / 12! < 1e-20
+    z_small = np.where(small, z, 0)
+    series1 = np.ones_like(z)
+    series2 = np.ones_like(z)
+    for k in range(12, 0, -1):
+        series1 = 1 + z_small / (k+1) * series1
+        series2 = 1 + z_small / (k+2) * series2
+
+    return np.where(small, series1, phi1), np.where(small, series2 / 2, phi2)
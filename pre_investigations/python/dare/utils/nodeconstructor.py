@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse
 import matplotlib.pyplot as plt
 import networkx as nx
 import random
@@ -347,13 +348,25 @@ class NodeConstructor():
         """
         return 0
     
-    def get_sys(self):
-        """Returns state space matrices"""
+    def get_sys(self, sparse=False):
+        """Returns state space matrices
+
+        Args:
+            sparse: If True, A, B and C are returned as scipy.sparse CSR matrices (converted from the dense blocks)
+
+        Returns:
+            (A, B, C, D): State space matrices
+        """
 
         A = self.generate_A()
         B = self.generate_B()
         C = self.generate_C()
         D = self.generate_D()
+
+        if sparse:
+            A = scipy.sparse.csr_matrix(A)
+            B = scipy.sparse.csr_matrix(B)
+            C = scipy.sparse.identity(C.shape[0], format='csr')
         return (A, B, C, D)
     
     def draw_graph(self):
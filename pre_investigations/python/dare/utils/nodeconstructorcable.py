@@ -23,7 +23,7 @@ class NodeConstructorCable():
         get_states: Function which returns a list of strings with all states for the given system
         draw_graph: Function which plots a graph based on the CM
     """
-    def __init__(self, num_source, num_load, CM=None, parameter=None, S2S_p=0.1, S2L_p=0.8):
+    def __init__(self, num_source, num_load, CM=None, parameter=None, S2S_p=0.1, S2L_p=0.8, rng=None):
         """Creates and initialize a nodeconstructor class instance.
 
         First the parameters are unpacked and then a CM is created, if not passed.
@@ -35,6 +35,7 @@ class NodeConstructorCable():
             S2S_p: Probability that a source is connected to a source (1,)
             S2L_p: Probability that a source is connected to a load (1,)
             CM: Connection Matrix specifies which objects are linked to each other via which connection (tot_ele, tot_ele)
+            rng: np.random.Generator or seed for the cable lengths, if None the global numpy RNG is used
         
         """
         self.num_source = num_source
@@ -43,6 +44,7 @@ class NodeConstructorCable():
 
         self.S2S_p = S2S_p
         self.S2L_p = S2L_p
+        self.rng = None if rng is None else np.random.default_rng(rng)
         self.cntr = 0
         self.num_connections = 0
 
@@ -218,7 +220,7 @@ class NodeConstructorCable():
     def sample_cable_para(self):
         """Sample cable parameter"""
     
-        l = np.random.randint(1, 100)
+        l = np.random.randint(1, 100) if self.rng is None else self.rng.integers(1, 100)
         # l=1
 
         Rb = 0.722
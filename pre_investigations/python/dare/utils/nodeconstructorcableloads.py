@@ -1,8 +1,12 @@
 import numpy as np
+import scipy.sparse
 import matplotlib.pyplot as plt
 import networkx as nx
 import random
 
+from .parameterstore import ParameterStore
+from .topology import generate_edges, edges_to_CM
+
 class NodeConstructorCableLoads():
     """Node Constructor implementation with cable modeling.
 
@@ -26,8 +30,10 @@ class NodeConstructorCableLoads():
         tot_ele: Total number of objects (loads + filters) in the grid (1,)
         
         parameter: Dict which includes the parameters of the components 
+        parameter_store: ParameterStore which holds the parameters of the components in arrays, parameter is a dict view of it
         S2S_p: Probability that a source is connected to a source (1,)
         S2L_p: Probability that a source is connected to a load (1,)
+        rng: np.random.Generator used to draw the random parameters
         num_connections: Number of drawn connections between all objects (1,)
         CM: Connection Matrix specifies which objects are linked to each other via which connection (tot_ele, tot_ele)
         generate_CM: Function that generates CM randomly. A connection to the network is guaranteed, so that no subnets can occur.
@@ -35,7 +41,7 @@ class NodeConstructorCableLoads():
         get_states: Function which returns a list of strings with all states for the given system
         draw_graph: Function which plots a graph based on the CM
     """
-    def __init__(self, num_source, num_loads, CM=None, parameter=None, S2S_p=0.1, S2L_p=0.8):
+    def __init__(self, num_source, num_loads, CM=None, parameter=None, S2S_p=0.1, S2L_p=0.8, rng=None):
         """Creates and initialize a nodeconstructor class instance.
 
         First the parameters are unpacked and then a CM is created, if not passed.
@@ -44,9 +50,10 @@ class NodeConstructorCableLoads():
             num_source: Number of sources in the grid (1,)
             num_loads: Number of loads in the grid (1,)
             CM: Connection Matrix specifies which objects are linked to each other via which connection (tot_ele, tot_ele)
-            parameter: Dict which includes the parameters of the components
+            parameter: Dict or ParameterStore which includes the parameters of the components
             S2S_p: Probability that a source is connected to a source (1,)
             S2L_p: Probability that a source is connected to a load (1,)
+            rng: np.random.Generator or seed used to draw the random parameters, if None a new Generator is created
         
         """
         self.num_source = num_source
@@ -55,6 +62,7 @@ class NodeConstructorCableLoads():
 
         self.S2S_p = S2S_p
         self.S2L_p = S2L_p
+        self.rng = np.random.default_rng(rng)
         self.cntr = 0
         self.num_connections = 0
 
@@ -70,121 +78,204 @@ class NodeConstructorCableLoads():
             raise f"Expect CM to be an np.ndarray or None, not {type(CM)}."
 
         # unpack parameters
-        if isinstance(parameter, dict):
-            assert len(list(parameter.keys())) == 3, f"Expect parameter to have three entries but got {len(list(parameter.keys()))}"
+        if isinstance(parameter, (dict, ParameterStore)):
+            if isinstance(parameter, dict):
+                assert len(list(parameter.keys())) == 3, f"Expect parameter to have three entries but got {len(list(parameter.keys()))}"
 
-            assert sorted(list(parameter.keys())) == sorted(['cable', 'source', 'load']), (
-                f"Expect parameter to have the three entries 'cable', 'load' and 'source' but got {sorted(list(parameter.keys()))}.")
+                assert sorted(list(parameter.keys())) == sorted(['cable', 'source', 'load']), (
+                    f"Expect parameter to have the three entries 'cable', 'load' and 'source' but got {sorted(list(parameter.keys()))}.")
         
             self.parameter = parameter
 
-            assert self.num_source == len(self.parameter['source']), (
-                f"Expect the number of sources to match the number of sources in the parameters, but got {self.num_source} and {len(self.parameter['source'])}.")
+            assert self.num_source == self.parameter_store.num_source, (
+                f"Expect the number of sources to match the number of sources in the parameters, but got {self.num_source} and {self.parameter_store.num_source}.")
             
-            assert self.num_loads == len(self.parameter['load']), (
-                f"Expect the number of loads to match the number of loads in the parameters, but got {self.num_loads} and {len(self.parameter['load'])}.")
+            assert self.num_loads == self.parameter_store.num_loads, (
+                f"Expect the number of loads to match the number of loads in the parameters, but got {self.num_loads} and {self.parameter_store.num_loads}.")
 
-            assert self.num_connections == len(self.parameter['cable']), (
-                f"Expect the number of connections to match the number of cables in the parameters, but got {self.num_connections} and {len(self.parameter['cable'])}.")
+            assert self.num_connections == self.parameter_store.num_connections, (
+                f"Expect the number of connections to match the number of cables in the parameters, but got {self.num_connections} and {self.parameter_store.num_connections}.")
 
-            self.num_LCL, self.num_LC, self.num_L = self._cntr_fltr(self.parameter['source'])
+            self.num_LCL, self.num_LC, self.num_L = self._cntr_fltr(self.parameter_store)
             
-            self.num_loads_RLC, self.num_loads_LC, self.num_loads_RL, self.num_loads_RC, self.num_loadss_L, self.num_loads_C,self.num_loads_R = self._cntr_loads(self.parameter['load'])
+            self.num_loads_RLC, self.num_loads_LC, self.num_loads_RL, self.num_loads_RC, self.num_loadss_L, self.num_loads_C,self.num_loads_R = self._cntr_loads(self.parameter_store)
 
             assert self.num_source == (self.num_LCL + self.num_LC + self.num_L), (
                 f"Expect the number of sources to be identical to the sum of the filter types, but the number of sources is {self.num_source} and the sum of the filters is {(self.num_LCL + self.num_LC + self.num_L)} .")
-            assert self.num_loads == (self.num_loads_RLC + self.num_loads_RL + self.num_loads_RC+ self.num_loads_R), (
-                f"Expect the number of loads to be identical to the sum of the load types, but the number of loads is {self.num_loads} and the sum of the loads is {(self.num_loads_RLC + self.num_loads_RL + self.num_loads_RC+ self.num_loads_R)} .")
+            assert self.num_loads == self.parameter_store.count_loads().sum(), (
+                f"Expect the number of loads to be identical to the sum of the load types, but the number of loads is {self.num_loads} and the sum of the loads is {self.parameter_store.count_loads().sum()} .")
         elif parameter == None:
             self.parameter = self.generate_parameter()
 
         else:
-            raise f"Expect parameter to be an dict or None, not {type(parameter)}."
-        
-        self.source = self.parameter['source']
-        self.cable = self.parameter['cable']
-        self.load = self.parameter['load']
+            raise ValueError(f"Expect parameter to be an dict, a ParameterStore or None, not {type(parameter)}.")
+
+    @property
+    def CM(self):
+        """Connection Matrix, assigning a new CM resets the cached adjacency index and parameter map"""
+        return self._CM
+
+    @CM.setter
+    def CM(self, CM):
+        self._CM = CM
+        self._adjacency = None
+        self._parameter_map = None
+
+    @property
+    def parameter(self):
+        """Dict view of the parameter store
+
+        The view is built on first access and cached until the store changes. Changing values in the dict has no effect on the grid, assign the dict to parameter again instead.
+        Assigning a dict or a ParameterStore (which is copied) resets the cached adjacency index and parameter map.
+        """
+        if self._parameter is None:
+            self._parameter = self.parameter_store.to_dict()
+        return self._parameter
+
+    @parameter.setter
+    def parameter(self, parameter):
+        if isinstance(parameter, ParameterStore):
+            # own copy, update_parameters and set_vector must not change the store of the caller or of other grids
+            self.parameter_store = parameter.copy()
+            self._parameter = None
+        else:
+            self.parameter_store = ParameterStore.from_dict(parameter)
+            self._parameter = parameter
+        self._adjacency = None
+        self._parameter_map = None
+
+    @property
+    def source(self):
+        return self.parameter['source']
+
+    @property
+    def cable(self):
+        return self.parameter['cable']
+
+    @property
+    def load(self):
+        return self.parameter['load']
     
-    def generate_parameter(self):
-        """Create randomly generated parameter dict
+    # Distributions of the component values per type, a tuple (low, high, scale) is drawn as
+    # np.round(uniform(low, high), 3) * scale, a number is a constant value.
+    _fltr_distribution = {'LCL': {'R': 10, 'L1': 5, 'L2': 10, 'C': 2},
+                          'LC': {'R': (0.1, 1, 1), 'L1': (2, 2.5, 1e-3), 'C': (5, 15, 1e-6)},
+                          'L': {'R': (0.1, 1, 1), 'L1': (2, 2.5, 1e-3)}}
+    _load_distribution = {'R': (10, 10000, 1), 'L': (1, 10, 1), 'C': (1, 10, 1)}
+    # cable of length l = 1
+    _cable_distribution = {'R': 0.722, 'L': 0.955*10**-3, 'C': 8*10**-9}
+
+    def generate_parameter(self, rng=None):
+        """Create randomly generated parameters
+
+        The parameters are written into a ParameterStore, its dict view contains three keys: 'source', 'cable' and 'load'. Behind each of these keys there is a list of the respective elements of the node. The list contains the parameters of the respective element at the corresponding positions.
 
-        The generated dict contains three keys: 'source', 'cable' and 'load'. Behind each of these keys there is a list of the respective elements of the node. The list contains the parameters of the respective element at the corresponding positions.
+        Args:
+            rng: np.random.Generator, if None self.rng is used
         
         Returns:
-            parameter: Dict of parameters
+            parameter: ParameterStore of parameters
         """
 
-        source_list = list()
-        cable_list = list()
-        load_list = list()
-        
-        self._get_filter_distribution()
-        self._get_load_distribution()
+        if rng is None:
+            rng = self.rng
 
-        for s in range(self.num_LCL):
-            sample = self._sample_fltr_LCL()
-            source_list.append(sample)
-        
-        for s in range(self.num_LC):
-            sample = self._sample_fltr_LC()
-            source_list.append(sample)
-        
-        for s in range(self.num_L):
-            sample = self._sample_fltr_L()
-            source_list.append(sample)
+        self._get_filter_distribution(rng)
+        self._get_load_distribution(rng)
 
-        for c in range(self.num_connections):
-            sample = self._sample_cable()
-            cable_list.append(sample)
+        fltr = np.repeat(np.arange(len(ParameterStore.FLTR_TYPES)), [self.num_LCL, self.num_LC, self.num_L])
+        impedance = np.repeat(np.arange(len(ParameterStore.LOAD_TYPES)),
+                              [self.num_loads_RLC, self.num_loads_LC, self.num_loads_RL, self.num_loadss_L,
+                               self.num_loads_RC, self.num_loads_C, self.num_loads_R])
 
-        for l in range(self.num_loads_RLC):
-            sample = self._sample_load_RLC()
-            load_list.append(sample)
-        
-        for l in range(self.num_loads_LC):
-            sample = self._sample_load_LC()
-            load_list.append(sample)
-            
-        for l in range(self.num_loads_RL):
-            sample = self._sample_load_RL()
-            load_list.append(sample)
-            
-        for l in range(self.num_loadss_L):
-            sample = self._sample_load_L()
-            load_list.append(sample)
-            
-        for l in range(self.num_loads_RC):
-            sample = self._sample_load_RC()
-            load_list.append(sample)
-            
-        for l in range(self.num_loads_C):
-            sample = self._sample_load_C()
-            load_list.append(sample)
-                    
-        for l in range(self.num_loads_R):
-            sample = self._sample_load_R()
-            load_list.append(sample)
-
-        parameter = dict()
-        parameter['source'] = source_list
-        parameter['cable'] = cable_list
-        parameter['load'] = load_list
+        parameter = ParameterStore(fltr, self.num_connections, impedance)
+
+        for block, values in self._sample_parameter(parameter, rng).items():
+            getattr(parameter, block).update(values)
     
         return parameter
 
-    def _get_filter_distribution(self):
+    def sample_parameter_vectors(self, num, rng=None):
+        """Draw num random parameter sets for the element types of this grid
+
+        The values follow the same distributions as generate_parameter. The result can be passed to get_sys_batch.
+
+        Args:
+            num: Number of parameter sets (1,)
+            rng: np.random.Generator, if None self.rng is used
+
+        Returns:
+            thetas: Parameter vectors (see get_parameter_vector) (num, len(theta))
+        """
+
+        if rng is None:
+            rng = self.rng
+
+        store = self.parameter_store
+        values = self._sample_parameter(store, rng, size=(num,))
+
+        return np.concatenate([np.stack([values[block][field] for field in fields], axis=-1).reshape(num, -1)
+                               for block, fields in (('source', store.SOURCE_FIELDS),
+                                                     ('cable', store.CABLE_FIELDS),
+                                                     ('load', store.LOAD_FIELDS))], axis=1)
+
+    def _sample_parameter(self, store, rng, size=()):
+        """Draw the component values for the element types of a store
+
+        Every field of every type is drawn in one batch.
+
+        Args:
+            store: ParameterStore which defines the element types
+            rng: np.random.Generator
+            size: Leading shape for drawing several parameter sets at once (tuple)
+
+        Returns:
+            values: Dict with the entries 'source', 'cable' and 'load', each a dict of field arrays size + (num_elements,)
+        """
+
+        size = tuple(size)
+        load_distribution = {t: {part: self._load_distribution[part] for part in t} for t in store.LOAD_TYPES}
+
+        values = dict()
+        for block, fields, types, codes, distribution in (
+                ('source', store.SOURCE_FIELDS, store.FLTR_TYPES, store.source['fltr'], self._fltr_distribution),
+                ('cable', store.CABLE_FIELDS, (None,), np.zeros(store.num_connections, dtype=np.int8), {None: self._cable_distribution}),
+                ('load', store.LOAD_FIELDS, store.LOAD_TYPES, store.load['impedance'], load_distribution)):
+
+            values[block] = dict()
+            for field in fields:
+                out = np.full(size + (len(codes),), np.nan)
+
+                for code, t in enumerate(types):
+                    mask = codes == code
+                    num = np.count_nonzero(mask)
+                    dist = distribution[t].get(field)
+
+                    if num == 0 or dist is None:
+                        continue
+                    elif isinstance(dist, tuple):
+                        low, high, scale = dist
+                        out[..., mask] = np.round(rng.uniform(low, high, size + (num,)), 3) * scale
+                    else:
+                        out[..., mask] = dist
+
+                values[block][field] = out
+
+        return values
+
+    def _get_filter_distribution(self, rng):
         """Create a distribution for the filter types"""
         
-        sample = 0.1 * self.num_source * np.random.normal(0,1)
+        sample = 0.1 * self.num_source * rng.normal(0,1)
         self.num_LC = int(np.ceil(np.clip(sample, 1, self.num_source-1)))
         self.num_LCL = self.num_source - self.num_LC
         self.num_L = 0
         pass
     
-    def _get_load_distribution(self):
+    def _get_load_distribution(self, rng):
         """Create a distribution for the load types"""
         
-        sample = np.random.dirichlet(np.ones(7))* self.num_loads
+        sample = rng.dirichlet(np.ones(7))* self.num_loads
 
         self.num_loads_R = int(np.floor(sample[0]))
         self.num_loads_C = int(np.floor(sample[1]))
@@ -195,7 +286,7 @@ class NodeConstructorCableLoads():
         self.num_loads_RLC = self.num_loads - (self.num_loads_R + self.num_loads_C + self.num_loadss_L +self.num_loads_RL + self.num_loads_RC + self.num_loads_LC)
         pass
 
-    def _cntr_fltr(self, source_list):
+    def _cntr_fltr(self, parameter_store):
         """Count the filter types
         
         Count the filter types if the parameter dict is predefined.
@@ -203,222 +294,23 @@ class NodeConstructorCableLoads():
         Returns:
             (cntr_LCL, cntr_LC, cntr_L): Number of respective filters (tuple)
         """
-    
-        cntr_LCL=0
-        cntr_LC=0
-        cntr_L=0
-        
-        for _, source in enumerate(source_list):
-            if source['fltr'] == 'LCL':
-                cntr_LCL+=1
-            elif source['fltr'] == 'LC':
-                cntr_LC+=1
-            elif source['fltr'] == 'L':
-                cntr_L+=1
+
+        cntr_LCL, cntr_LC, cntr_L = parameter_store.count_fltr().tolist()
 
         return (cntr_LCL, cntr_LC, cntr_L)
     
-    def _cntr_loads(self, load_list):
+    def _cntr_loads(self, parameter_store):
         """Count the load types
         
         Count the load types if the parameter dict is predefined.
 
         Returns:
-            (cntr_RLC, cntr_RL, cntr_RC, cntr_R): Number of respective loads (tuple)
-        """
-    
-        cntr_RLC=0
-        cntr_LC=0
-        cntr_RL=0
-        cntr_RC=0
-        cntr_L=0
-        cntr_C=0
-        cntr_R=0
-        
-        for _, load in enumerate(load_list):
-            if load['impedance'] == 'RLC':
-                cntr_RLC+=1
-            elif load['impedance'] == 'LC':
-                cntr_LC+=1
-            elif load['impedance'] == 'RL':
-                cntr_RL+=1
-            elif load['impedance'] == 'RC':
-                cntr_RC+=1
-            elif load['impedance'] == 'L':
-                cntr_L+=1
-            elif load['impedance'] == 'C':
-                cntr_C+=1
-            elif load['impedance'] == 'R':
-                cntr_R+=1
-
-        return (cntr_RLC, cntr_LC, cntr_RL, cntr_RC, cntr_L, cntr_C, cntr_R)
-    
-    def _sample_fltr_LCL(self):
-        """Sample source parameter for LCL 
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """      
-        
-        source = dict()
-        source['fltr'] = 'LCL'
-        # source['R'] = np.round_(np.random.uniform(0.1, 1), 3)
-        # source['L1'] = np.round_(np.random.uniform(2, 2.5), 3) * 1e-3
-        # source['L2'] = np.round_(np.random.uniform(2, 2.5), 3) * 1e-3
-        # source['C'] = np.round_(np.random.uniform(5, 15), 3) * 1e-6
-
-        source['R'] = 10
-        source['L1'] = 5
-        source['L2'] = 10
-        source['C'] = 2
-        
-        
-        return source
-    
-    def _sample_fltr_LC(self):
-        """Sample source parameter for LC
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-
-        source = dict()
-        source['fltr'] = 'LC'
-        source['R'] = np.round_(np.random.uniform(0.1, 1), 3)
-        source['L1'] = np.round_(np.random.uniform(2, 2.5), 3) * 1e-3
-        source['C'] = np.round_(np.random.uniform(5, 15), 3) * 1e-6
-
-        # source['R'] = 10
-        # source['L1'] = 5
-        # source['C'] = 2
-        
-        return source
-
-    
-    def _sample_fltr_L(self):
-        """Sample source parameter for L
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-
-        source = dict()
-        source['fltr'] = 'L'
-        source['R'] = np.round_(np.random.uniform(0.1, 1), 3)
-        source['L1'] = np.round_(np.random.uniform(2, 2.5), 3) * 1e-3
-        
-        return source
-    
-    def _sample_load_R(self):
-        """Sample source parameter for R
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-        
-        load = dict()
-        load['impedance']= 'R'
-        load['R'] = np.round_(np.random.uniform(10, 10000), 3)
-        
-        return load
-    
-    def _sample_load_C(self):
-        """Sample source parameter for C
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-        
-        load = dict()
-        load['impedance']= 'C'
-        load['C'] = np.round_(np.random.uniform(1, 10), 3)
-        return load
-    
-    def _sample_load_L(self):
-        """Sample source parameter for L
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-        
-        load = dict()
-        load['impedance']= 'L'
-        load['L'] = np.round_(np.random.uniform(1, 10), 3)
-        return load
-    
-    def _sample_load_RL(self):
-        """Sample source parameter for RL
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-        
-        load = dict()
-        load['impedance']= 'RL'
-        load['R'] = np.round_(np.random.uniform(10, 10000), 3)
-        load['L'] = np.round_(np.random.uniform(1, 10), 3)
-        return load
-    
-    def _sample_load_RC(self):
-        """Sample source parameter for RC
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-        
-        load = dict()
-        load['impedance']= 'RC'
-        load['R'] = np.round_(np.random.uniform(10, 10000), 3)
-        load['C'] = np.round_(np.random.uniform(1, 10), 3)
-        return load
-    
-    def _sample_load_LC(self):
-        """Sample source parameter for LC
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-        
-        load = dict()
-        load['impedance']= 'LC'
-        load['L'] = np.round_(np.random.uniform(1, 10), 3)
-        load['C'] = np.round_(np.random.uniform(1, 10), 3)
-        return load
-    
-    def _sample_load_RLC(self):
-        """Sample source parameter for RLC
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
-        """
-        
-        load = dict()
-        load['impedance']= 'RLC'
-        load['R'] = np.round_(np.random.uniform(10, 10000), 3)
-        load['L'] = np.round_(np.random.uniform(1, 10), 3)
-        load['C'] = np.round_(np.random.uniform(1, 10), 3)
-        return load
-
-    def _sample_cable(self):
-        """Sample cable parameter
-        
-        Returns:
-            source: Dict with sampled parameters (dict)
+            (cntr_RLC, cntr_LC, cntr_RL, cntr_RC, cntr_L, cntr_C, cntr_R): Number of respective loads (tuple)
         """
-    
-        # l = np.random.randint(1, 100)
-        l = 1
 
-        Rb = 0.722
-        Cb = 8*10**-9
-        Lb = 0.955*10**-3
+        cntr_RLC, cntr_LC, cntr_RL, cntr_L, cntr_RC, cntr_C, cntr_R = parameter_store.count_loads().tolist()
 
-        cable = dict()
-        cable['R'] = l * Rb
-        cable['L'] = l * Lb
-        cable['C'] = l * Cb
-
-        return cable
+        return (cntr_RLC, cntr_LC, cntr_RL, cntr_RC, cntr_L, cntr_C, cntr_R)
     
     def tobe_or_n2b(self, x, p):
         """Sets x based on p to zero or to the value of the counter and increments it."""
@@ -439,11 +331,23 @@ class NodeConstructorCableLoads():
         self.cntr += 1
         return self.cntr
     
-    def generate_CM(self):
+    def generate_CM(self, spanning_tree=False, mean_degree=None):
         """Constructs the CM
         
         Returns the constructed CM and the total number of connections.
+        With spanning_tree the connections are drawn vectorized with dare.utils.topology.generate_edges and the grid is connected by a random spanning tree instead of the repair loop below.
+
+        Args:
+            spanning_tree: Use the scalable generator (bool)
+            mean_degree: Target mean number of cables per element, only used with spanning_tree (1,)
         """
+
+        if spanning_tree:
+            edges = generate_edges(self.num_source, self.num_loads, self.S2S_p, self.S2L_p, mean_degree, self.rng)
+            self.CM = edges_to_CM(edges, self.tot_ele)
+            self.num_connections = len(edges)
+            self.cntr = self.num_connections
+            return
         
         # counting the connections 
         self.cntr = 0
@@ -531,18 +435,7 @@ class NodeConstructorCableLoads():
             A_source[2,1] = 1/parameter_i['L2']
             A_source[2,3] = -1/parameter_i['L2']
             
-            C_sum =  0
-            
-            CM_row = self.CM[source_i-1]
-            
-            indizes = list(CM_row[CM_row != 0])
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
-            
-            for _, idx in enumerate(indizes_):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
+            C_sum = self.get_adjacency()['C_node'][source_i-1]
             
             A_source[3,2] = C_sum**-1
 
@@ -552,17 +445,7 @@ class NodeConstructorCableLoads():
             A_source[0,0] = -parameter_i['R']/parameter_i['L1']
             A_source[0,1] = -1/parameter_i['L1']
             
-            C_sum =  parameter_i['C']
-            
-            CM_row = self.CM[source_i-1]
-            
-            indizes = list(CM_row[CM_row != 0])
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            
-            for _, idx in enumerate(indizes_):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
+            C_sum = self.get_adjacency()['C_node'][source_i-1]
             
             A_source[1,0] = C_sum**-1
 
@@ -610,42 +493,22 @@ class NodeConstructorCableLoads():
 
             A_col = np.zeros((4, self.num_connections))
 
-            CM_row = self.CM[source_i-1]
-
-            indizes = list(CM_row[CM_row != 0]) # get entries unequal 0
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
-
-            C_sum = 0 
+            indizes_, signs = self._get_node_cables(source_i-1)
 
-            for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
+            C_sum = self.get_adjacency()['C_node'][source_i-1]
                 
             for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
                 A_col[3,idx-1] = sign * -(C_sum**-1)
 
         elif parameter_i['fltr'] == 'LC':
 
             A_col = np.zeros((2, self.num_connections))
 
-            CM_row = self.CM[source_i-1]
-
-            indizes = list(CM_row[CM_row != 0]) # get entries unequal 0
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
-
-            C_sum = parameter_i['C']
+            indizes_, signs = self._get_node_cables(source_i-1)
 
-            for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
+            C_sum = self.get_adjacency()['C_node'][source_i-1]
             
             for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
                 A_col[1,idx-1] = sign * -(C_sum**-1)
 
         elif parameter_i['fltr'] == 'L':
@@ -664,29 +527,19 @@ class NodeConstructorCableLoads():
         if parameter_i['fltr'] == 'LCL':
 
             A_row = np.zeros((4, self.num_connections))
-            CM_col = self.CM[source_i-1]
-            
-            indizes = list(CM_col[CM_col != 0]) # get entries unequal 0
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
+
+            indizes_, signs = self._get_node_cables(source_i-1)
             
             for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
                 A_row[3,idx-1] = sign * 1/self.parameter['cable'][idx-1]['L']
 
         elif parameter_i['fltr'] == 'LC':
         
             A_row = np.zeros((2, self.num_connections))
             
-            CM_col = self.CM[source_i-1]
-            
-            indizes = list(CM_col[CM_col != 0]) # get entries unequal 0
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
+            indizes_, signs = self._get_node_cables(source_i-1)
             
             for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
                 A_row[1,idx-1] = sign * 1/self.parameter['cable'][idx-1]['L']
 
         elif parameter_i['fltr'] == 'L':
@@ -708,129 +561,41 @@ class NodeConstructorCableLoads():
     def generate_A_load_col(self, load_i):
         
         parameter_i = self.load[load_i-1]
-        
-        if parameter_i['impedance'] == 'RLC' or parameter_i['impedance'] == 'LC':
-        
-            A_load_col = np.zeros((2,self.num_connections))
 
-            CM_row = self.CM[(self.num_source-1)+load_i]
+        indizes_, signs = self._get_node_cables((self.num_source-1)+load_i)
 
-            indizes = list(CM_row[CM_row != 0]) # get entries unequal 0
-            signs = np.sign(indizes) # get signs
+        # the capacitance of all cables is used here (not only of the connected ones)
+        C_sum = self.get_adjacency()['C_col'][(self.num_source-1)+load_i]
         
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
-            C_sum = parameter_i['C']
-        
-            for _, ele in enumerate(self.parameter['cable']):
-                C_sum += ele['C'] * 0.5
-                
-
-            for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
-                A_load_col[0,idx-1] = sign * -(C_sum**-1)
-                
-                
-        elif parameter_i['impedance'] == 'RL' or parameter_i['impedance'] == 'L':
+        if parameter_i['impedance'] in ['RLC', 'LC', 'RL', 'L']:
         
             A_load_col = np.zeros((2,self.num_connections))
-
-            CM_row = self.CM[(self.num_source-1)+load_i]
-
-            indizes = list(CM_row[CM_row != 0]) # get entries unequal 0
-            signs = np.sign(indizes) # get signs
-        
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
-            C_sum = 0
-            
-            for j, ele in enumerate(self.parameter['cable']):
-                C_sum += ele['C'] * 0.5
-                
-
-            for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
-                A_load_col[0,idx-1] = sign * -(C_sum**-1)
-                
-        elif parameter_i['impedance'] == 'RC' or parameter_i['impedance'] == 'C':
-            
-            A_load_col = np.zeros((1,self.num_connections))
-
-            CM_row = self.CM[(self.num_source-1)+load_i]
-
-            indizes = list(CM_row[CM_row != 0]) # get entries unequal 0
-            signs = np.sign(indizes) # get signs
-        
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
-            C_sum = parameter_i['C']
-            
-            for j, ele in enumerate(self.parameter['cable']):
-                C_sum += ele['C'] * 0.5
-                
-
-            for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
-                A_load_col[0,idx-1] = sign * -(C_sum**-1)
                 
-        elif parameter_i['impedance'] == 'R' :
+        elif parameter_i['impedance'] in ['RC', 'C', 'R']:
             
             A_load_col = np.zeros((1,self.num_connections))
 
-            CM_row = self.CM[(self.num_source-1)+load_i]
-
-            indizes = list(CM_row[CM_row != 0]) # get entries unequal 0
-            signs = np.sign(indizes) # get signs
-        
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
-            C_sum = 0
-            
-            for j, ele in enumerate(self.parameter['cable']):
-                C_sum += ele['C'] * 0.5
-                
-
-            for _, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
-                A_load_col[0,idx-1] = sign * -(C_sum**-1)
+        for _, (idx, sign) in enumerate(zip(indizes_, signs)):
+            A_load_col[0,idx-1] = sign * -(C_sum**-1)
                 
         return A_load_col
         
     def generate_A_load_row(self, load_i):
         
         parameter_i = self.load[load_i-1]
+
+        indizes_, signs = self._get_node_cables((self.num_source-1)+load_i)
         
         if parameter_i['impedance'] == 'RLC' or parameter_i['impedance'] == 'LC' or parameter_i['impedance'] == 'RL' or parameter_i['impedance'] == 'L':
         
             A_load_row = np.zeros((self.num_connections,2))
-
-            CM_col = self.CM[(self.num_source-1)+load_i]
-
-            indizes = list(CM_col[CM_col != 0]) # get entries unequal 0
-
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-
-            for i, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
-
-                A_load_row[idx-1,0] = sign *1/self.parameter['cable'][idx-1]['L']  
                 
         elif parameter_i['impedance'] == 'RC' or parameter_i['impedance'] == 'C' or parameter_i['impedance'] == 'R':
         
             A_load_row = np.zeros((self.num_connections,1))
 
-            CM_col = self.CM[(self.num_source-1)+load_i]
-
-            indizes = list(CM_col[CM_col != 0]) # get entries unequal 0
-
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-
-            for i, (idx, sign) in enumerate(zip(indizes_, signs)):
-                idx = int(idx)
-
-                A_load_row[idx-1,0] = sign *1/self.parameter['cable'][idx-1]['L']  
+        for i, (idx, sign) in enumerate(zip(indizes_, signs)):
+            A_load_row[idx-1,0] = sign *1/self.parameter['cable'][idx-1]['L']  
     
         return A_load_row
     
@@ -840,129 +605,46 @@ class NodeConstructorCableLoads():
         """
         parameter_i = self.load[load_i-1]
 
+        C_sum = self.get_adjacency()['C_node'][(self.num_source-1)+load_i]
+
         if parameter_i['impedance'] == 'RLC':
 
             A_load = np.zeros((2,2))
             A_load[1,0] = 1/parameter_i['L']
-            
-            C_sum =  parameter_i['C']
-            
-            CM_row = self.CM[(self.num_source-1)+load_i]
-            
-            indizes = list(CM_row[CM_row != 0])
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            indizes_.astype(dtype=np.int32)
-            
-            for _, idx in enumerate(indizes_):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
-            
             A_load[0,0] = - ((parameter_i['R']) * (C_sum))**-1
             A_load[0,1] = - (C_sum)**-1
-            
         
         elif parameter_i['impedance'] == 'LC':
         
             A_load = np.zeros((2,2))
             A_load[1,0] = 1/parameter_i['L']
-            
-            C_sum =  parameter_i['C']
-            
-            CM_row = self.CM[(self.num_source-1)+load_i]
-            
-            indizes = list(CM_row[CM_row != 0])
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            
-            for _, idx in enumerate(indizes_):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
-            
             A_load[0,1] = - (C_sum)**-1
 
-
         elif parameter_i['impedance'] == 'RL':
         
             A_load = np.zeros((2,2))
             A_load[1,0] = 1/parameter_i['L']
-            
-            C_sum =  0
-            
-            CM_row = self.CM[(self.num_source-1)+load_i]
-            
-            indizes = list(CM_row[CM_row != 0])
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            
-            for _, idx in enumerate(indizes_):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
-            
             A_load[0,0] = - ((parameter_i['R']) * (C_sum))**-1
-            
             A_load[0,1] = - (C_sum)**-1
             
         elif parameter_i['impedance'] == 'L':
         
             A_load = np.zeros((2,2))
             A_load[1,0] = 1/parameter_i['L']
-            
-            C_sum =  0
-            
-            CM_row = self.CM[(self.num_source-1)+load_i]
-            
-            indizes = list(CM_row[CM_row != 0])
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            
-            for _, idx in enumerate(indizes_):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
-            
             A_load[0,1] = - (C_sum)**-1
 
-
         elif parameter_i['impedance'] == 'RC':
         
             A_load = np.zeros((1,1))
-            
-            C_sum =  parameter_i['C']
-            
-            CM_row = self.CM[(self.num_source-1)+load_i]
-            
-            indizes = list(CM_row[CM_row != 0])
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            
-            for _, idx in enumerate(indizes_):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
-            
             A_load[0,0] = - ((parameter_i['R']) * (C_sum))**-1
-            
         
         elif parameter_i['impedance'] == 'C':
         
             A_load = np.zeros((1,1))
 
-        
         elif parameter_i['impedance'] == 'R':
         
             A_load = np.zeros((1,1))
-            
-            C_sum =  0
-            
-            CM_row = self.CM[(self.num_source-1)+load_i]
-            
-            indizes = list(CM_row[CM_row != 0])
-            signs = np.sign(indizes) # get signs
-            indizes_ = indizes*signs # delet signs from indices
-            
-            for _, idx in enumerate(indizes_):
-                idx = int(idx)
-                C_sum += self.parameter['cable'][idx-1]['C'] * 0.5
-            
             A_load[0,0] = - ((parameter_i['R']) * (C_sum))**-1
         
         else:
@@ -1158,38 +840,570 @@ class NodeConstructorCableLoads():
             0: Zero vector (2*num_source+num_connections)
         """
         return 0
-    
-    def get_sys(self):
-        """Returns state space matrices"""
 
-        A = self.generate_A()
-        B = self.generate_B()
+    def _get_state_dims(self):
+        """Set the number of filter and impedance states (num_fltr, num_impedance)"""
+
+        self.num_fltr = 4*self.num_LCL + 2*self.num_LC + 2*self.num_L
+        self.num_impedance = 2* (self.num_loads_RLC+self.num_loads_LC+self.num_loads_RL+self.num_loadss_L) + self.num_loads_RC + self.num_loads_C +self.num_loads_R
+
+    def get_adjacency(self):
+        """Returns the per-node adjacency index
+
+        The index is built once from the CM and the parameters and reused by all A generators. It is reset when CM or parameter is assigned, after changing parameter values in place reset_adjacency has to be called.
+
+        Returns:
+            adjacency: Dict with the entries
+                nodes, cables, signs: Non-zero CM entries in row-major order, cables start at 0 (nnz,)
+                indptr: The entries of node i are stored at indptr[i]:indptr[i+1] (tot_ele+1,)
+                C_node: Lumped node capacitance, own capacitance plus half of the connected cables (tot_ele,)
+                C_col: Capacitance used in A_load_col, for loads own capacitance plus half of all cables (tot_ele,)
+        """
+
+        if self._adjacency is None:
+            self._adjacency = self._build_adjacency()
+
+        return self._adjacency
+
+    def reset_adjacency(self):
+        """Reset the cached adjacency index"""
+
+        self._adjacency = None
+
+    def _build_adjacency(self):
+        """Build the per-node adjacency index (see get_adjacency)"""
+
+        nodes, neighbours = np.nonzero(self.CM)
+        entries = self.CM[nodes, neighbours]
+        signs = np.sign(entries).astype(float)
+        cables = (entries*signs).astype(np.int64) - 1
+
+        indptr = np.zeros(self.tot_ele+1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(nodes, minlength=self.tot_ele))
+
+        store = self.parameter_store
+        C_cable = store.cable['C']
+
+        # own capacitance of the nodes (LCL filters end with the cable capacitances)
+        C_own = np.concatenate((np.where(store.is_fltr('LC'), store.source['C'], 0),
+                                np.where(store.has_part('C'), store.load['C'], 0)))
+
+        C_node = C_own.copy()
+        np.add.at(C_node, nodes, C_cable[cables] * 0.5) # unbuffered, keeps the summation order of the CM rows
+
+        C_col = C_node.copy()
+        C_col[self.num_source:] = self._sum_sequential(C_own[self.num_source:], C_cable * 0.5)
+
+        adjacency = dict()
+        adjacency['nodes'] = nodes
+        adjacency['cables'] = cables
+        adjacency['signs'] = signs
+        adjacency['indptr'] = indptr
+        adjacency['C_node'] = C_node
+        adjacency['C_col'] = C_col
+
+        return adjacency
+
+    def _get_node_cables(self, node_i):
+        """Get the cables connected to a node from the adjacency index
+
+        Args:
+            node_i: Index of the node in the CM (source 1 is 0, load 1 is num_source)
+
+        Returns:
+            (indizes, signs): Cable numbers (starting at 1) and the signs of the corresponding CM entries
+        """
+
+        adjacency = self.get_adjacency()
+        start, stop = adjacency['indptr'][node_i], adjacency['indptr'][node_i+1]
+
+        return adjacency['cables'][start:stop] + 1, adjacency['signs'][start:stop]
+
+    def get_incidence_matrix(self):
+        """Create the signed node-cable incidence matrix
+
+        The entry (i, c) is the sign of the CM entry of node i for cable c+1, i.e. +1 if the cable leaves the node and -1 if it ends there.
+        The rows are ordered like the CM (sources first, then loads).
+
+        Returns:
+            K: Incidence matrix in CSR format (tot_ele, num_connections)
+        """
+
+        adjacency = self.get_adjacency()
+
+        # copy, scipy may sort the indices in place
+        return scipy.sparse.csr_matrix((adjacency['signs'].copy(), adjacency['cables'].copy(), adjacency['indptr'].copy()),
+                                       shape=(self.tot_ele, self.num_connections))
+
+    def _get_source_arrays(self):
+        """Collect the source parameters in arrays
+
+        Returns:
+            (is_LCL, R, L1, L2, C): Filter type mask and parameters, L2 is nan for LC filters (num_source,)
+        """
+
+        store = self.parameter_store
+
+        if np.any(store.is_fltr('L')):
+            raise NotImplementedError
+
+        return store.is_fltr('LCL'), store.source['R'], store.source['L1'], store.source['L2'], store.source['C']
+
+    def _get_load_arrays(self):
+        """Collect the load parameters in arrays
+
+        Returns:
+            (has_R, has_L, has_C, R, L, C): Masks of the impedance parts and parameters, missing parts are nan (num_loads,)
+        """
+
+        store = self.parameter_store
+
+        return (store.has_part('R'), store.has_part('L'), store.has_part('C'),
+                store.load['R'], store.load['L'], store.load['C'])
+
+    def generate_A_sparse(self):
+        """Generate the A matrix in sparse format
+
+        Vectorized assembly of the same matrix as generate_A. The signed node-cable incidence matrix K is derived once from the CM and the coupling blocks follow from it by diagonal scalings:
+
+            A_col = -S @ diag(1/C_node) @ K
+            A_row = diag(1/L_cable) @ K.T @ S.T
+
+        where S maps every node to the state of its node voltage (for loads C_node is taken over all cables like in generate_A_load_col). The filter and load blocks are filled per type with array operations.
+        The lumped node capacitances are taken from the adjacency index and inverted with the same pow as in the per-element functions, so the result is bit-identical to generate_A.
+
+        Returns:
+            A: A matrix for state space in CSR format (num_fltr+num_connections+num_impedance, num_fltr+num_connections+num_impedance)
+        """
+        self._get_state_dims()
+        num_states = self.num_fltr + self.num_connections + self.num_impedance
+
+        adjacency = self.get_adjacency()
+        K = self.get_incidence_matrix()
+
+        R_cable = self.parameter_store.cable['R']
+        L_cable = self.parameter_store.cable['L']
+
+        is_LCL, R_src, L1_src, L2_src, C_src = self._get_source_arrays()
+        has_R, has_L, has_C, R_load, L_load, C_load = self._get_load_arrays()
+
+        # first state of every element
+        size_src = np.where(is_LCL, 4, 2)
+        start_src = np.cumsum(size_src) - size_src
+        size_load = np.where(has_L, 2, 1)
+        start_load = np.cumsum(size_load) - size_load + self.num_fltr + self.num_connections
+
+        # state of the node voltage
+        u_node = np.concatenate((start_src + size_src - 1, start_load))
+
+        C_node = adjacency['C_node']
+        C_col = adjacency['C_col']
+
+        with np.errstate(divide='ignore'): # pure C loads without cables are not used below
+            C_node_inv = np.float_power(C_node, -1)
+        C_col_inv = np.float_power(C_col, -1)
+
+        # cable and coupling blocks
+        S = scipy.sparse.csr_matrix((np.ones(self.tot_ele), (u_node, np.arange(self.tot_ele))), shape=(num_states, self.tot_ele))
+        E = scipy.sparse.csr_matrix((np.ones(self.num_connections), (self.num_fltr + np.arange(self.num_connections), np.arange(self.num_connections))),
+                                    shape=(num_states, self.num_connections))
+
+        A_col = S @ scipy.sparse.diags(-C_col_inv) @ K
+        A_row = scipy.sparse.diags(1/L_cable) @ K.T @ S.T
+        A_tran_diag = scipy.sparse.diags(-R_cable/L_cable)
+
+        A = A_col @ E.T + E @ A_row + E @ A_tran_diag @ E.T
+
+        # filter and load blocks
+        rows = list()
+        cols = list()
+        vals = list()
+
+        def add(row, col, val):
+            rows.append(row)
+            cols.append(col)
+            vals.append(val)
+
+        s = start_src
+        add(s, s, -R_src/L1_src)
+        add(s, s+1, -1/L1_src)
+        add(u_node[:self.num_source], u_node[:self.num_source]-1, C_node_inv[:self.num_source])
+
+        s = start_src[is_LCL]
+        add(s+1, s, 1/C_src[is_LCL])
+        add(s+1, s+2, -1/C_src[is_LCL])
+        add(s+2, s+1, 1/L2_src[is_LCL])
+        add(s+2, s+3, -1/L2_src[is_LCL])
+
+        C_load_inv = C_node_inv[self.num_source:]
+        s = start_load[has_R]
+        add(s, s, - np.float_power(R_load[has_R] * C_node[self.num_source:][has_R], -1))
+
+        s = start_load[has_L]
+        add(s, s+1, - C_load_inv[has_L])
+        add(s+1, s, 1/L_load[has_L])
+
+        A = A + scipy.sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(num_states, num_states))
+
+        return A.tocsr()
+
+    @staticmethod
+    def _sum_sequential(start, values, chunk=1024):
+        """Add all values one after another to each entry of start
+
+        Gives the same rounding as a Python loop `x += v`, which a pairwise np.sum does not.
+
+        Args:
+            start: Start values (n,)
+            values: Summands (m,)
+            chunk: Number of summands handled in one np.add.accumulate call
+
+        Returns:
+            acc: Sums (n,)
+        """
+
+        start = np.asarray(start, dtype=float)
+        unique, inverse = np.unique(start, return_inverse=True)
+
+        acc = unique
+        for i in range(0, len(values), chunk):
+            block = np.empty((len(acc), len(values[i:i+chunk]) + 1))
+            block[:, 0] = acc
+            block[:, 1:] = values[i:i+chunk]
+            acc = np.add.accumulate(block, axis=1)[:, -1]
+
+        return acc[inverse]
+
+    def generate_B_sparse(self):
+        """Generate the B matrix in sparse format
+
+        Same structure as generate_B.
+
+        Returns:
+            B: B matrix for state space in CSR format (num_fltr+num_connections+num_impedance, num_source)
+        """
+        self._get_state_dims()
+        num_states = self.num_fltr + self.num_connections + self.num_impedance
+
+        is_LCL, _, L1_src, _, _ = self._get_source_arrays()
+
+        size_src = np.where(is_LCL, 4, 2)
+        start_src = np.cumsum(size_src) - size_src
+
+        return scipy.sparse.csr_matrix((1/L1_src, (start_src, np.arange(self.num_source))), shape=(num_states, self.num_source))
+
+    def generate_C_sparse(self):
+        """Generate the C matrix in sparse format
+
+        Returns:
+            C: Identity matrix in CSR format (num_fltr+num_connections+num_impedance)
+        """
+        self._get_state_dims()
+        return scipy.sparse.identity(self.num_fltr + self.num_connections + self.num_impedance, format='csr')
+
+    def get_sys(self, sparse=False):
+        """Returns state space matrices
+
+        Both formats use the vectorized assembly of generate_A_sparse. generate_A and generate_B remain as the per-element reference.
+
+        Args:
+            sparse: If True, A, B and C are returned as scipy.sparse CSR matrices which are built without dense intermediates
+
+        Returns:
+            (A, B, C, D): State space matrices
+        """
+
+        A = self.generate_A_sparse()
+        B = self.generate_B_sparse()
+
+        if sparse:
+            C = self.generate_C_sparse()
+        else:
+            A = A.toarray()
+            B = B.toarray()
+            C = self.generate_C()
+        D = self.generate_D()
+        return (A, B, C, D)
+
+    def get_parameter_vector(self, parameter=None):
+        """Returns the flat parameter vector
+
+        The vector is ordered [source, cable, load], every element takes one entry per field (source: R, L1, L2, C; cable and load: R, L, C). Fields an element does not have are nan.
+
+        Args:
+            parameter: Parameter dict or ParameterStore with the same element types as this grid, if None the own parameters are used
+
+        Returns:
+            (theta, names): Parameter vector (4*num_source+3*num_connections+3*num_loads,) and the names of the entries
+        """
+
+        if parameter is None:
+            store = self.parameter_store
+        else:
+            store = parameter if isinstance(parameter, ParameterStore) else ParameterStore.from_dict(parameter)
+
+            assert np.array_equal(store.source['fltr'], self.parameter_store.source['fltr']), (
+                "Expect the parameter set to have the same filter types as the grid.")
+            assert np.array_equal(store.load['impedance'], self.parameter_store.load['impedance']), (
+                "Expect the parameter set to have the same load types as the grid.")
+            assert store.num_connections == self.num_connections, (
+                f"Expect the parameter set to have {self.num_connections} cables, but got {store.num_connections}.")
+
+        return store.get_vector(), store.get_vector_names()
+
+    def get_parameter_map(self):
+        """Returns the map from the parameter vector to the non-zero values of A and B
+
+        The sparsity pattern of A and B only depends on the CM and the element types, so it is built once. Every non-zero value is described as
+
+            value = coef * z[num] / (z[den] * z[den2])
+
+        with z = [theta, C_node, C_col, 1] (see get_parameter_vector and get_adjacency). The map is reset when CM or parameter is assigned.
+
+        Returns:
+            parameter_map: Dict with the entries
+                theta, names: Current parameter vector and its names
+                A, B: Matrices in CSR format with the fixed pattern, their data is refilled by update_parameters
+                A_coef, A_num, A_den, A_den2: Description of the non-zero values of A in CSR order (nnz,)
+                B_coef, B_num, B_den, B_den2: Description of the non-zero values of B in CSR order (nnz,)
+        """
+
+        if self._parameter_map is None:
+            self._parameter_map = self._build_parameter_map()
+
+        return self._parameter_map
+
+    def _build_parameter_map(self):
+        """Build the parameter map (see get_parameter_map)"""
+
+        self._get_state_dims()
+        num_states = self.num_fltr + self.num_connections + self.num_impedance
+
+        theta, names = self.get_parameter_vector()
+        adjacency = self.get_adjacency()
+
+        is_LCL, _, _, _, _ = self._get_source_arrays()
+        has_R, has_L, has_C, _, _, _ = self._get_load_arrays()
+
+        # position of the fields in theta
+        src_idx = 4*np.arange(self.num_source)
+        cable_idx = 4*self.num_source + 3*np.arange(self.num_connections)
+        load_idx = 4*self.num_source + 3*self.num_connections + 3*np.arange(self.num_loads)
+
+        # position of the derived quantities in z
+        C_node_idx = len(theta) + np.arange(self.tot_ele)
+        C_col_idx = len(theta) + self.tot_ele + np.arange(self.tot_ele)
+        ONE = len(theta) + 2*self.tot_ele
+
+        size_src = np.where(is_LCL, 4, 2)
+        start_src = np.cumsum(size_src) - size_src
+        size_load = np.where(has_L, 2, 1)
+        start_load = np.cumsum(size_load) - size_load + self.num_fltr + self.num_connections
+        u_node = np.concatenate((start_src + size_src - 1, start_load))
+
+        entries = list()
+
+        def add(row, col, coef, num, den, den2=ONE):
+            row, col, coef, num, den, den2 = np.broadcast_arrays(row, col, coef, num, den, den2)
+            entries.append(np.stack((row, col, num, den, den2)).astype(np.int64))
+            coefs.append(coef.astype(float))
+
+        # A
+        coefs = list()
+
+        s, p = start_src, src_idx
+        add(s, s, -1, p, p+1)
+        add(s, s+1, -1, ONE, p+1)
+        add(u_node[:self.num_source], u_node[:self.num_source]-1, 1, ONE, C_node_idx[:self.num_source])
+
+        s, p = start_src[is_LCL], src_idx[is_LCL]
+        add(s+1, s, 1, ONE, p+3)
+        add(s+1, s+2, -1, ONE, p+3)
+        add(s+2, s+1, 1, ONE, p+2)
+        add(s+2, s+3, -1, ONE, p+2)
+
+        nodes, cables, signs = adjacency['nodes'], adjacency['cables'], adjacency['signs']
+        add(u_node[nodes], self.num_fltr + cables, -signs, ONE, C_col_idx[nodes])
+        add(self.num_fltr + cables, u_node[nodes], signs, ONE, cable_idx[cables]+1)
+
+        c = self.num_fltr + np.arange(self.num_connections)
+        add(c, c, -1, cable_idx, cable_idx+1)
+
+        node = self.num_source + np.arange(self.num_loads)
+        s, p = start_load[has_R], load_idx[has_R]
+        add(s, s, -1, ONE, p, C_node_idx[node[has_R]])
+
+        s, p = start_load[has_L], load_idx[has_L]
+        add(s, s+1, -1, ONE, C_node_idx[node[has_L]])
+        add(s+1, s, 1, ONE, p+1)
+
+        A_entries = np.concatenate(entries, axis=1)
+        A_coefs = np.concatenate(coefs)
+
+        # B
+        entries = list()
+        coefs = list()
+
+        add(start_src, np.arange(self.num_source), 1, ONE, src_idx+1)
+
+        B_entries = np.concatenate(entries, axis=1)
+        B_coefs = np.concatenate(coefs)
+
+        parameter_map = dict()
+        parameter_map['theta'] = theta
+        parameter_map['names'] = names
+
+        for key, (rows, cols, num, den, den2), coef, shape in (('A', A_entries, A_coefs, (num_states, num_states)),
+                                                                 ('B', B_entries, B_coefs, (num_states, self.num_source))):
+            # sort the entries into CSR order
+            order = np.lexsort((cols, rows))
+            indptr = np.zeros(shape[0]+1, dtype=np.int64)
+            indptr[1:] = np.cumsum(np.bincount(rows, minlength=shape[0]))
+            parameter_map[key] = scipy.sparse.csr_matrix((np.zeros(len(order)), cols[order], indptr), shape=shape)
+            parameter_map[key + '_coef'] = coef[order]
+            parameter_map[key + '_num'] = num[order]
+            parameter_map[key + '_den'] = den[order]
+            parameter_map[key + '_den2'] = den2[order]
+
+        # lumped node capacitances as function of theta
+        parameter_map['C_own_idx'] = np.concatenate((src_idx + 3, load_idx + 2))
+        parameter_map['C_own_mask'] = np.concatenate((~is_LCL, has_C))
+        parameter_map['K_abs'] = abs(self.get_incidence_matrix())
+        parameter_map['cable_C_idx'] = cable_idx + 2
+
+        parameter_map['A'].data[:], parameter_map['B'].data[:] = self._evaluate_parameter_map(parameter_map, theta)
+
+        return parameter_map
+
+    def _evaluate_parameter_map(self, parameter_map, theta):
+        """Evaluate the non-zero values of A and B for one or a stack of parameter vectors
+
+        Args:
+            parameter_map: Parameter map (see get_parameter_map)
+            theta: Parameter vector(s) (see get_parameter_vector) (len(theta),) or (K, len(theta))
+
+        Returns:
+            (A_data, B_data): Non-zero values of A and B in CSR order (nnz,) or (K, nnz)
+        """
+
+        C_cable_half = theta[..., parameter_map['cable_C_idx']] * 0.5
+        C_own = np.where(parameter_map['C_own_mask'], theta[..., parameter_map['C_own_idx']], 0)
+
+        C_node = C_own + (parameter_map['K_abs'] @ C_cable_half.T).T
+        C_col = C_node.copy()
+        C_col[..., self.num_source:] = C_own[..., self.num_source:] + C_cable_half.sum(axis=-1, keepdims=True)
+
+        z = np.concatenate((theta, C_node, C_col, np.ones(theta.shape[:-1] + (1,))), axis=-1)
+
+        A_data = parameter_map['A_coef'] * z[..., parameter_map['A_num']] / (z[..., parameter_map['A_den']] * z[..., parameter_map['A_den2']])
+        B_data = parameter_map['B_coef'] * z[..., parameter_map['B_num']] / (z[..., parameter_map['B_den']] * z[..., parameter_map['B_den2']])
+
+        return A_data, B_data
+
+    def get_sys_batch(self, parameters):
+        """Returns the state space matrices for K parameter sets of the same topology
+
+        All sets share the CM and the element types of this grid, so the values of all K systems are evaluated at once with the parameter map and scattered into stacked dense arrays.
+        The stacks can be discretized batched with dare.utils.discretization.zoh.
+
+        Args:
+            parameters: List of K parameter dicts (same format as parameter) or array of K parameter vectors (K, len(theta))
+
+        Returns:
+            (A, B, C, D): Stacked A (K, n, n) and B (K, n, num_source), C is the identity (n, n) and D is 0
+        """
+
+        parameter_map = self.get_parameter_map()
+
+        if isinstance(parameters, np.ndarray):
+            thetas = np.atleast_2d(parameters).astype(float)
+            assert thetas.shape[1] == len(parameter_map['theta']), (
+                f"Expect the parameter vectors to have {len(parameter_map['theta'])} entries, but got {thetas.shape[1]}.")
+        else:
+            thetas = np.stack([self.get_parameter_vector(parameter)[0] for parameter in parameters])
+
+        A_data, B_data = self._evaluate_parameter_map(parameter_map, thetas)
+
+        stacked = list()
+        for M, data in ((parameter_map['A'], A_data), (parameter_map['B'], B_data)):
+            rows = np.repeat(np.arange(M.shape[0]), np.diff(M.indptr))
+            M_batch = np.zeros((len(thetas),) + M.shape)
+            M_batch[:, rows, M.indices] = data
+            stacked.append(M_batch)
+
+        A, B = stacked
         C = self.generate_C()
         D = self.generate_D()
+
         return (A, B, C, D)
+
+    def update_parameters(self, source=None, cable=None, load=None):
+        """Set new component values for the fixed topology
+
+        Only the parameter store and the non-zero values of A and B are refilled, the sparsity pattern is kept. The values match get_sys up to rounding.
+        Every argument is a dict of field name and new values for all elements of this kind, e.g. cable={'R': R_new, 'C': C_new}.
+        Values of elements which do not have the field (e.g. L2 of an LC filter) are ignored.
+
+        Args:
+            source: New source values for the fields 'R', 'L1', 'L2', 'C' (num_source,)
+            cable: New cable values for the fields 'R', 'L', 'C' (num_connections,)
+            load: New load values for the fields 'R', 'L', 'C' (num_loads,)
+
+        Returns:
+            (A, B): Matrices in CSR format, the same objects as in get_parameter_map refilled in place
+        """
+
+        parameter_map = self.get_parameter_map()
+        store = self.parameter_store
+
+        for new, arrays, fields in ((source, store.source, store.SOURCE_FIELDS),
+                                    (cable, store.cable, store.CABLE_FIELDS),
+                                    (load, store.load, store.LOAD_FIELDS)):
+            if new is not None:
+                for field, values in new.items():
+                    assert field in fields, f"Expect field to be one of {fields}, but got {field}."
+
+                    values = np.broadcast_to(np.asarray(values, dtype=float), arrays[field].shape)
+                    valid = ~np.isnan(arrays[field])
+                    arrays[field][valid] = values[valid]
+
+        theta = store.get_vector()
+        parameter_map['theta'] = theta
+
+        # the dict view is outdated
+        self._parameter = None
+
+        # the lumped node capacitances changed
+        self.reset_adjacency()
+
+        parameter_map['A'].data[:], parameter_map['B'].data[:] = self._evaluate_parameter_map(parameter_map, theta)
+
+        return parameter_map['A'], parameter_map['B']
     
     def get_states(self):
+        """Returns the names of the states in the order of the state vector
+
+        Returns:
+            states: List of strings, e.g. 'i_f1', 'u_1', 'i_c3', 'u_l2', 'i_l2'
+        """
+
+        store = self.parameter_store
+
         states = list()
-        for s in range(1, self.num_source+1):
-            if s <= self.num_LCL:
-                states.append(f'i_f{s}')
-                states.append(f'u_f{s}')
-                states.append(f'i_{s}')
-                states.append(f'u_{s}')
-
-            elif s <= self.num_LCL+self.num_LC+self.num_L:
-                states.append(f'i_{s}')
-                states.append(f'u_{s}')
-        
-        for c in range(1, self.num_connections+1):
-            states.append(f'i_c{c}')
-        
-        for l in range(1, self.num_loads+1):
-            if l <= self.num_loads_RLC+self.num_loads_LC+self.num_loads_RL+self.num_loadss_L:
-                states.append(f'u_l{l}')
-                states.append(f'i_l{l}')
-            elif l <= self.num_loads_RLC+self.num_loads_LC+self.num_loads_RL+self.num_loadss_L+self.num_loads_RC+self.num_loads_C+self.num_loads_R:
+        for s, is_LCL in enumerate(store.is_fltr('LCL').tolist(), start=1):
+            if is_LCL:
+                states += [f'i_f{s}', f'u_f{s}', f'i_{s}', f'u_{s}']
+            else:
+                states += [f'i_{s}', f'u_{s}']
+
+        states += [f'i_c{c}' for c in range(1, self.num_connections+1)]
+
+        for l, has_L in enumerate(store.has_part('L').tolist(), start=1):
+            if has_L:
+                states += [f'u_l{l}', f'i_l{l}']
+            else:
                 states.append(f'u_l{l}')
+
         return states
     
     def draw_graph(self):
@@ -0,0 +1,231 @@
+import numpy as np
+
+
+class ParameterStore():
+    """Array backed container for the component parameters of a grid.
+
+    The parameters are stored per field in float arrays, the type of every source and load is stored as an integer code.
+    Fields an element does not have (e.g. L2 of an LC filter) are nan. The store round-trips to the dict format used by
+    the node constructors:
+
+        {'source': [{'fltr': 'LCL', 'R': ..., 'L1': ..., 'L2': ..., 'C': ...}, ...],
+         'cable': [{'R': ..., 'L': ..., 'C': ...}, ...],
+         'load': [{'impedance': 'RLC', 'R': ..., 'L': ..., 'C': ...}, ...]}
+
+    Attributes:
+        source: Dict of arrays with the entries 'fltr' (type codes) and 'R', 'L1', 'L2', 'C' (num_source,)
+        cable: Dict of arrays with the entries 'R', 'L', 'C' (num_connections,)
+        load: Dict of arrays with the entries 'impedance' (type codes) and 'R', 'L', 'C' (num_loads,)
+    """
+
+    FLTR_TYPES = ('LCL', 'LC', 'L')
+    LOAD_TYPES = ('RLC', 'LC', 'RL', 'L', 'RC', 'C', 'R')
+
+    SOURCE_FIELDS = ('R', 'L1', 'L2', 'C')
+    CABLE_FIELDS = ('R', 'L', 'C')
+    LOAD_FIELDS = ('R', 'L', 'C')
+
+    def __init__(self, fltr, num_connections, impedance):
+        """Creates a store for the given element types, all values are initialized with nan.
+
+        Args:
+            fltr: Filter type codes of the sources (index into FLTR_TYPES) (num_source,)
+            num_connections: Number of cables (1,)
+            impedance: Impedance type codes of the loads (index into LOAD_TYPES) (num_loads,)
+        """
+
+        fltr = np.asarray(fltr, dtype=np.int8)
+        impedance = np.asarray(impedance, dtype=np.int8)
+
+        assert np.all((fltr >= 0) & (fltr < len(self.FLTR_TYPES))), (
+            f"Expect the filter codes to be in [0, {len(self.FLTR_TYPES)}).")
+        assert np.all((impedance >= 0) & (impedance < len(self.LOAD_TYPES))), (
+            f"Expect the impedance codes to be in [0, {len(self.LOAD_TYPES)}).")
+
+        self.source = {'fltr': fltr}
+        for field in self.SOURCE_FIELDS:
+            self.source[field] = np.full(len(fltr), np.nan)
+
+        self.cable = dict()
+        for field in self.CABLE_FIELDS:
+            self.cable[field] = np.full(num_connections, np.nan)
+
+        self.load = {'impedance': impedance}
+        for field in self.LOAD_FIELDS:
+            self.load[field] = np.full(len(impedance), np.nan)
+
+    @property
+    def num_source(self):
+        return len(self.source['fltr'])
+
+    @property
+    def num_connections(self):
+        return len(self.cable['R'])
+
+    @property
+    def num_loads(self):
+        return len(self.load['impedance'])
+
+    @classmethod
+    def from_dict(cls, parameter):
+        """Create a store from a parameter dict
+
+        Args:
+            parameter: Dict with the entries 'source', 'cable' and 'load' (see class description)
+
+        Returns:
+            store: ParameterStore with the values of the dict
+        """
+
+        for source in parameter['source']:
+            if source['fltr'] not in cls.FLTR_TYPES:
+                raise ValueError(f"Expect filter to be 'LCL', 'LC' or 'L', not {source['fltr']}.")
+        for load in parameter['load']:
+            if load['impedance'] not in cls.LOAD_TYPES:
+                raise ValueError(f"Expect Impedance to be 'RLC', 'LC', 'RL', 'RC', 'L', 'C' or 'R', not {load['impedance']}.")
+
+        store = cls([cls.FLTR_TYPES.index(source['fltr']) for source in parameter['source']],
+                    len(parameter['cable']),
+                    [cls.LOAD_TYPES.index(load['impedance']) for load in parameter['load']])
+
+        for block, elements, fields in (('source', parameter['source'], cls.SOURCE_FIELDS),
+                                        ('cable', parameter['cable'], cls.CABLE_FIELDS),
+                                        ('load', parameter['load'], cls.LOAD_FIELDS)):
+            arrays = getattr(store, block)
+            for field in fields:
+                arrays[field][:] = [ele.get(field, np.nan) for ele in elements]
+
+        return store
+
+    def to_dict(self):
+        """Convert the store into the parameter dict format
+
+        Fields which are nan are left out.
+
+        Returns:
+            parameter: Dict with the entries 'source', 'cable' and 'load' (see class description)
+        """
+
+        parameter = dict()
+        parameter['source'] = self._to_list(self.source, self.SOURCE_FIELDS, 'fltr', self.FLTR_TYPES)
+        parameter['cable'] = self._to_list(self.cable, self.CABLE_FIELDS)
+        parameter['load'] = self._to_list(self.load, self.LOAD_FIELDS, 'impedance', self.LOAD_TYPES)
+
+        return parameter
+
+    @staticmethod
+    def _to_list(arrays, fields, type_key=None, types=None):
+        """Convert a block of arrays into a list of dicts"""
+
+        values = np.column_stack([arrays[field] for field in fields]).tolist()
+        valid = (~np.isnan(np.column_stack([arrays[field] for field in fields]))).tolist()
+
+        if type_key is None:
+            names = [None] * len(values)
+        else:
+            names = [types[code] for code in arrays[type_key].tolist()]
+
+        elements = list()
+        for name, row, row_valid in zip(names, values, valid):
+            ele = dict() if name is None else {type_key: name}
+            for field, value, is_valid in zip(fields, row, row_valid):
+                if is_valid:
+                    ele[field] = value
+            elements.append(ele)
+
+        return elements
+
+    def set_element(self, block, idx, element):
+        """Write the values of one element given in the dict format
+
+        Args:
+            block: 'source', 'cable' or 'load'
+            idx: Index of the element in the block (1,)
+            element: Dict with the values of the element, the type entry ('fltr' or 'impedance') is ignored
+        """
+
+        fields = {'source': self.SOURCE_FIELDS, 'cable': self.CABLE_FIELDS, 'load': self.LOAD_FIELDS}[block]
+        arrays = getattr(self, block)
+
+        for field in fields:
+            arrays[field][idx] = element.get(field, np.nan)
+
+    def copy(self):
+        """Returns a deep copy of the store"""
+
+        store = ParameterStore(self.source['fltr'].copy(), self.num_connections, self.load['impedance'].copy())
+        for block in ('source', 'cable', 'load'):
+            for field, values in getattr(self, block).items():
+                getattr(store, block)[field] = values.copy()
+
+        return store
+
+    def count_fltr(self):
+        """Count the filter types
+
+        Returns:
+            counts: Number of sources per type, ordered like FLTR_TYPES (len(FLTR_TYPES),)
+        """
+
+        return np.bincount(self.source['fltr'], minlength=len(self.FLTR_TYPES))
+
+    def count_loads(self):
+        """Count the load types
+
+        Returns:
+            counts: Number of loads per type, ordered like LOAD_TYPES (len(LOAD_TYPES),)
+        """
+
+        return np.bincount(self.load['impedance'], minlength=len(self.LOAD_TYPES))
+
+    def is_fltr(self, *types):
+        """Mask of the sources with one of the given filter types (num_source,)"""
+
+        return np.isin(self.source['fltr'], [self.FLTR_TYPES.index(t) for t in types])
+
+    def is_load(self, *types):
+        """Mask of the loads with one of the given impedance types (num_loads,)"""
+
+        return np.isin(self.load['impedance'], [self.LOAD_TYPES.index(t) for t in types])
+
+    def has_part(self, part):
+        """Mask of the loads whose impedance contains the part 'R', 'L' or 'C' (num_loads,)"""
+
+        return self.is_load(*[t for t in self.LOAD_TYPES if part in t])
+
+    def get_vector(self):
+        """Returns the flat parameter vector
+
+        The vector is ordered [source, cable, load], every element takes one entry per field (source: R, L1, L2, C; cable and load: R, L, C).
+
+        Returns:
+            theta: Parameter vector (4*num_source+3*num_connections+3*num_loads,)
+        """
+
+        return np.concatenate([np.column_stack([getattr(self, block)[field] for field in fields]).ravel()
+                               for block, fields in (('source', self.SOURCE_FIELDS),
+                                                     ('cable', self.CABLE_FIELDS),
+                                                     ('load', self.LOAD_FIELDS))])
+
+    def get_vector_names(self):
+        """Returns the names of the entries of the parameter vector, e.g. 'cable3_R'"""
+
+        names = list()
+        for block, fields, num in (('source', self.SOURCE_FIELDS, self.num_source),
+                                   ('cable', self.CABLE_FIELDS, self.num_connections),
+                                   ('load', self.LOAD_FIELDS, self.num_loads)):
+            names += [f'{block}{i+1}_{field}' for i in range(num) for field in fields]
+
+        return names
+
+    def set_vector(self, theta):
+        """Write a parameter vector (see get_vector) back into the arrays"""
+
+        offset = 0
+        for block, fields, num in (('source', self.SOURCE_FIELDS, self.num_source),
+                                   ('cable', self.CABLE_FIELDS, self.num_connections),
+                                   ('load', self.LOAD_FIELDS, self.num_loads)):
+            values = np.asarray(theta[offset:offset + len(fields)*num], dtype=float).reshape(num, len(fields))
+            for f, field in enumerate(fields):
+                getattr(self, block)[field][:] = values[:, f]
+            offset += len(fields)*num
@@ -0,0 +1,123 @@
+"""
+Closed form simulation for inputs which are constant over segments of samples (e.g. u_fix in timing_evaluation or the
+actions of Env_DARE held over a step).
+
+Over k samples with a constant input the state follows directly from x(0) without stepping through the samples,
+either with the squares of the augmented exponential (dare.utils.discretization.MultiRate, O(log k) matrix-vector
+products) or in the eigenbasis of A (dare.utils.modal.ModalSystem, O(n) for every k).
+"""
+
+from warnings import warn
+
+import numpy as np
+
+from .discretization import MultiRate
+from .modal import ModalSystem
+
+
+class PiecewiseConstantSolver():
+    """Simulation of x' = A x + B u for piecewise constant input samples
+
+    The input is interpolated linearly between the samples (FOH, like custom_control.forced_response) or held over a
+    sample (ZOH). Wherever consecutive samples are equal the input is constant, these segments are bridged in closed
+    form, a change of the input costs a single step.
+
+    Attributes:
+        basis: 'squaring' or 'modal', the method used for the segments
+    """
+
+    def __init__(self, A, B, ts, basis='squaring', cond_max=1e8):
+        """
+        Args:
+            A: System matrix, dense or sparse (n, n)
+            B: Input matrix, dense or sparse (n, m)
+            ts: Sampling time (1,)
+            basis: 'squaring' applies the squares E(ts*2^j) of the augmented exponential, valid for every A,
+                   'modal' uses the eigendecomposition of A, it falls back to 'squaring' if the eigenvectors are badly
+                   conditioned
+            cond_max: Maximal condition number of the eigenvectors for the modal basis (1,)
+        """
+
+        if basis not in ['squaring', 'modal']:
+            raise ValueError(f"Expect basis to be 'squaring' or 'modal', not {basis}.")
+
+        self.ts = ts
+        self.n = A.shape[0]
+        self.m = B.shape[1]
+
+        if basis == 'modal':
+            self.modal = ModalSystem(A, B, None, cond_max=cond_max)
+            if not self.modal.valid:
+                warn(f"eigenvectors of A are badly conditioned (cond = {self.modal.cond:.3g}), using the squaring basis")
+                basis = 'squaring'
+
+        if basis == 'squaring':
+            self.rates = MultiRate(A, B, ts)
+        else:
+            # coefficients of a single sample, most steps when all samples are requested
+            self._zoh = self.modal.get_discrete(ts, 'zoh')
+            self._foh = self.modal.get_discrete(ts, 'foh')
+
+        self.basis = basis
+
+    def _advance(self, state, u0, u1, k):
+        """Advance the (modal) state by k samples, the input is constant (u0 == u1) or goes linearly from u0 to u1 (k = 1)"""
+
+        if self.basis == 'modal':
+            if np.array_equal(u0, u1):
+                a, g, _ = self._zoh if k == 1 else self.modal.get_discrete(k * self.ts, 'zoh')
+                return a * state + g * (self.modal.B_modal @ u0)
+
+            a, g0, g1 = self._foh
+            return a * state + g0 * (self.modal.B_modal @ u0) + g1 * (self.modal.B_modal @ u1)
+
+        return self.rates.apply(k * self.ts, np.concatenate((state, u0, (u1 - u0) / self.ts)))[:self.n]
+
+    def simulate(self, x0, U, samples=None, hold='foh'):
+        """Simulate from x0 and return the states at the requested samples
+
+        Args:
+            x0: Initial state (n,)
+            U: Input samples (m, num_samples)
+            samples: Indices of the returned samples, if None all samples are returned (list)
+            hold: 'foh' interpolates the input linearly between the samples, 'zoh' holds U[:, k] until sample k+1
+
+        Returns:
+            xout: States at the requested samples (n, len(samples))
+        """
+
+        if hold not in ['foh', 'zoh']:
+            raise ValueError(f"Expect hold to be 'foh' or 'zoh', not {hold}.")
+
+        U = np.asarray(U, dtype=float)
+        num_samples = U.shape[1]
+        samples = np.arange(num_samples) if samples is None else np.asarray(samples)
+        order = np.argsort(samples, kind='stable')
+
+        # index of the next change of the input for every sample, the input is constant from sample i to change[i]
+        changes = np.flatnonzero(np.any(U[:, 1:] != U[:, :-1], axis=0)) + 1
+        change = np.append(changes, num_samples)[np.searchsorted(changes, np.arange(num_samples), side='right')]
+
+        state = self.modal.to_modal(x0) if self.basis == 'modal' else np.asarray(x0, dtype=float)
+        states = np.empty((len(state), len(samples)), dtype=state.dtype)
+
+        i = 0
+        for s in order:
+            target = samples[s]
+            while i < target:
+                if hold == 'zoh':
+                    # U[:, i] is held up to the next change
+                    k = min(change[i], target) - i
+                    state = self._advance(state, U[:, i], U[:, i], k)
+                elif change[i] > i + 1:
+                    # constant input up to the sample before the next change
+                    k = min(change[i] - 1, target) - i
+                    state = self._advance(state, U[:, i], U[:, i], k)
+                else:
+                    # linear transition to the next sample
+                    k = 1
+                    state = self._advance(state, U[:, i], U[:, i+1], k)
+                i += k
+            states[:, s] = state
+
+        return self.modal.to_states(states) if self.basis == 'modal' else states
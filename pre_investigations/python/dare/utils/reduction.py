@@ -0,0 +1,291 @@
+"""
+Model order reduction of the grids.
+
+The state vector of a generated grid contains every filter, cable and load state, while an agent observes only a few of
+them. The reduced system (A_r, B_r, C_r, D_r) of order r reproduces the selected outputs with a known error:
+
+    balanced truncation: keeps the states with the largest Hankel singular values, H-infinity error <= 2 * sum of the
+                         truncated Hankel singular values (needs a stable A)
+    modal truncation: keeps the slowest modes (smallest |lambda|), e.g. drops the fast cable modes
+
+With residualize=True the truncated states are not dropped but set to their steady state (singular perturbation), so
+the DC gain of the full system is kept and the truncated fast dynamics show up as a feedthrough D_r.
+"""
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+
+
+def get_output_indices(power_grid, outputs):
+    """Indices of outputs given as state names (see get_states of the node constructor) or indices
+
+    Args:
+        power_grid: Node constructor (e.g. NodeConstructorCableLoads)
+        outputs: State names or indices, if None all states (list)
+
+    Returns:
+        indices: Indices into the state vector (list)
+    """
+
+    if outputs is None:
+        return list(range(power_grid.get_sys()[0].shape[0]))
+
+    names = power_grid.get_states() if hasattr(power_grid, 'get_states') else []
+
+    indices = []
+    for output in outputs:
+        if isinstance(output, str):
+            if output not in names:
+                raise ValueError(f"Expect output {output} to be one of the states {names}.")
+            indices.append(names.index(output))
+        else:
+            indices.append(int(output))
+
+    return indices
+
+
+def balanced_truncation(A, B, C, D, order=None, tol=1e-6, residualize=False):
+    """Balanced truncation (square root method)
+
+    Args:
+        A: System matrix, has to be stable (n, n)
+        B: Input matrix (n, m)
+        C: Output matrix (p, n)
+        D: Feedthrough matrix (p, m)
+        order: Order of the reduced system, if None all states with a Hankel singular value above tol * the largest one
+               are kept (1,)
+        tol: Relative threshold of the Hankel singular values if order is None (1,)
+        residualize: Residualize the truncated states instead of dropping them
+
+    Returns:
+        (A_r, B_r, C_r, D_r): Reduced system
+        (T, Ti, hsv): Projection x ~ T x_r, x_r = Ti x (n, r), (r, n) and the Hankel singular values (n,)
+    """
+
+    A, B, C, D = [_to_dense(M) for M in [A, B, C, D]]
+
+    if np.linalg.eigvals(A).real.max() >= 0:
+        raise ValueError("Expect a stable A for balanced truncation, use modal truncation for grids with non-decaying "
+                         "modes (e.g. pure 'C' loads).")
+
+    # Gramians A P + P A^T + B B^T = 0, A^T Q + Q A + C^T C = 0
+    L_P = _get_factor(scipy.linalg.solve_continuous_lyapunov(A, -B @ B.T))
+    L_Q = _get_factor(scipy.linalg.solve_continuous_lyapunov(A.T, -C.T @ C))
+
+    U, hsv, Vt = scipy.linalg.svd(L_Q.T @ L_P)
+
+    # balancing transformation of the minimal part of the system
+    n_min = int(np.sum(hsv > 1e-14 * hsv[0]))
+    S = hsv[:n_min] ** -0.5
+    T = (L_P @ Vt[:n_min].T) * S
+    Ti = S[:, None] * (U[:, :n_min].T @ L_Q.T)
+
+    if order is None:
+        order = int(np.sum(hsv > tol * hsv[0]))
+    order = min(order, n_min)
+
+    reduced = _truncate(Ti @ A @ T, Ti @ B, C @ T, D, order, residualize)
+
+    return reduced, (T[:, :order], Ti[:order], hsv)
+
+
+def modal_truncation(A, B, C, D, order, residualize=False):
+    """Modal truncation, keeps the slowest modes
+
+    A is brought to an ordered real Schur form with the slow eigenvalues first, which is block diagonalized with a
+    Sylvester equation. Complex conjugated pairs are kept together, so the order can be one higher than requested.
+
+    Args:
+        A: System matrix (n, n)
+        B: Input matrix (n, m)
+        C: Output matrix (p, n)
+        D: Feedthrough matrix (p, m)
+        order: Order of the reduced system (1,)
+        residualize: Residualize the fast modes instead of dropping them
+
+    Returns:
+        (A_r, B_r, C_r, D_r): Reduced system
+        (T, Ti, eigenvalues): Projection x ~ T x_r, x_r = Ti x (n, r), (r, n) and the eigenvalues of A (n,)
+    """
+
+    A, B, C, D = [_to_dense(M) for M in [A, B, C, D]]
+    n = A.shape[0]
+
+    eigenvalues = np.linalg.eigvals(A)
+    if order >= n:
+        return (A, B, C, D), (np.identity(n), np.identity(n), eigenvalues)
+
+    # cutoff in the middle of the gap to the next faster mode, the reordering of the Schur form perturbs the eigenvalues
+    magnitudes = np.sort(np.abs(eigenvalues))
+    faster = magnitudes[magnitudes > magnitudes[order - 1] * (1 + 1e-6)]
+    if len(faster) == 0:
+        return (A, B, C, D), (np.identity(n), np.identity(n), eigenvalues)
+    cutoff = np.sqrt(magnitudes[order - 1] * faster[0])
+
+    A_s, Z, order = scipy.linalg.schur(A, output='real', sort=lambda re, im: np.hypot(re, im) <= cutoff)
+
+    # [[I, X], [0, I]] decouples the slow block A11 from the fast block A22: A11 X - X A22 + A12 = 0
+    X = scipy.linalg.solve_sylvester(A_s[:order, :order], -A_s[order:, order:], -A_s[:order, order:])
+
+    B_s = Z.T @ B
+    C_s = C @ Z
+
+    A_b = scipy.linalg.block_diag(A_s[:order, :order], A_s[order:, order:])
+    B_b = np.concatenate((B_s[:order] - X @ B_s[order:], B_s[order:]))
+    C_b = np.concatenate((C_s[:, :order], C_s[:, :order] @ X + C_s[:, order:]), axis=1)
+
+    reduced = _truncate(A_b, B_b, C_b, D, order, residualize)
+
+    T = Z[:, :order]
+    Ti = np.concatenate((np.identity(order), -X), axis=1) @ Z.T
+
+    return reduced, (T, Ti, eigenvalues)
+
+
+def get_error_report(full, reduced, num_frequencies=200, h2=True):
+    """Error of a reduced system
+
+    Args:
+        full: Full system (A, B, C, D), A may be sparse
+        reduced: Reduced system (A_r, B_r, C_r, D_r)
+        num_frequencies: Number of frequencies of the H-infinity sweep (1,)
+        h2: Compute the H2 norm of the error system (dense Lyapunov equation of order n+r)
+
+    Returns:
+        report: Dict with
+            hinf: max ||G(jw) - G_r(jw)||_2 on a logarithmic frequency grid between the slowest and the fastest
+                  eigenvalue (a lower estimate of the H-infinity norm)
+            hinf_relative: hinf / max ||G(jw)||_2
+            h2: H2 norm of the error system, inf if the feedthrough differs (residualization)
+            h2_relative: h2 / H2 norm of the full system
+    """
+
+    A, B, C, D = full
+    A_r, B_r, C_r, D_r = [_to_dense(M) for M in reduced]
+    B, C, D = [_to_dense(M) for M in [B, C, D]]
+
+    eigenvalues = np.linalg.eigvals(A_r)
+    w_min = max(np.abs(eigenvalues).min(), 1e-3) / 10
+    w_max = np.abs(eigenvalues).max() * 10
+    frequencies = np.concatenate(([0], np.logspace(np.log10(w_min), np.log10(w_max), num_frequencies)))
+
+    hinf = 0.
+    hinf_full = 0.
+    for w in frequencies:
+        G = C @ _solve_shifted(A, 1j * w, B) + D
+        G_r = C_r @ np.linalg.solve(1j * w * np.identity(A_r.shape[0]) - A_r, B_r) + D_r
+        hinf = max(hinf, np.linalg.norm(G - G_r, 2))
+        hinf_full = max(hinf_full, np.linalg.norm(G, 2))
+
+    report = {'hinf': hinf, 'hinf_relative': hinf / hinf_full if hinf_full > 0 else np.inf}
+
+    if h2:
+        if not np.allclose(D, D_r):
+            report['h2'], report['h2_relative'] = np.inf, np.inf
+        else:
+            A_e = scipy.linalg.block_diag(_to_dense(A), A_r)
+            B_e = np.concatenate((B, B_r))
+            C_e = np.concatenate((C, -C_r), axis=1)
+            P_e = scipy.linalg.solve_continuous_lyapunov(A_e, -B_e @ B_e.T)
+            h2_error = np.sqrt(max(np.trace(C_e @ P_e @ C_e.T), 0))
+
+            n = A.shape[0]
+            h2_full = np.sqrt(max(np.trace(C @ P_e[:n, :n] @ C.T), 0))
+
+            report['h2'] = h2_error
+            report['h2_relative'] = h2_error / h2_full if h2_full > 0 else np.inf
+
+    return report
+
+
+def reduce_grid(power_grid, order=None, method='balanced', outputs=None, residualize=False, tol=1e-6,
+                error_report=True):
+    """Reduced model of a grid for the selected outputs
+
+    Args:
+        power_grid: Node constructor (e.g. NodeConstructorCableLoads)
+        order: Order of the reduced system, for 'balanced' None selects it with tol (1,)
+        method: 'balanced' (balanced truncation) or 'modal' (modal truncation)
+        outputs: State names (see get_states of the node constructor) or indices of the outputs, if None all states
+        residualize: Residualize the truncated states instead of dropping them
+        tol: Relative threshold of the Hankel singular values for 'balanced' without order (1,)
+        error_report: Add the H-infinity and H2 error to the report
+
+    Returns:
+        (A_r, B_r, C_r, D_r): Reduced system with len(outputs) outputs
+        report: Dict with order, outputs (indices), the projection T, Ti (x ~ T x_r, x_r = Ti x) and
+                'balanced': the Hankel singular values hsv and the bound hinf_bound = 2 * sum of the truncated ones,
+                'modal': the eigenvalues of A,
+                plus the errors of get_error_report
+    """
+
+    if method not in ['balanced', 'modal']:
+        raise ValueError(f"Expect method to be 'balanced' or 'modal', not {method}.")
+
+    A, B, C, D = power_grid.get_sys(sparse=True)
+    indices = get_output_indices(power_grid, outputs)
+    C = C[indices]
+    D = np.zeros((len(indices), B.shape[1])) + D
+
+    if method == 'balanced':
+        reduced, (T, Ti, hsv) = balanced_truncation(A, B, C, D, order, tol, residualize)
+        report = {'hsv': hsv, 'hinf_bound': 2 * hsv[reduced[0].shape[0]:].sum()}
+    else:
+        if order is None:
+            raise ValueError("Expect an order for modal truncation.")
+        reduced, (T, Ti, eigenvalues) = modal_truncation(A, B, C, D, order, residualize)
+        report = {'eigenvalues': eigenvalues}
+
+    report.update({'method': method, 'order': reduced[0].shape[0], 'outputs': indices, 'T': T, 'Ti': Ti})
+
+    if error_report:
+        report.update(get_error_report((A, B, C, D), reduced))
+
+    return reduced, report
+
+
+def _truncate(A, B, C, D, order, residualize):
+    """Keep the first order states, the others are dropped or residualized (set to their steady state)"""
+
+    r = order
+    A11, A12, A21, A22 = A[:r, :r], A[:r, r:], A[r:, :r], A[r:, r:]
+
+    if not residualize or r == A.shape[0]:
+        return A11, B[:r], C[:, :r], D
+
+    # 0 = A21 x1 + A22 x2 + B2 u
+    A22_inv_A21 = np.linalg.solve(A22, A21)
+    A22_inv_B2 = np.linalg.solve(A22, B[r:])
+
+    return (A11 - A12 @ A22_inv_A21, B[:r] - A12 @ A22_inv_B2,
+            C[:, :r] - C[:, r:] @ A22_inv_A21, D - C[:, r:] @ A22_inv_B2)
+
+
+def _get_factor(P):
+    """L with P = L L^T for a symmetric positive semidefinite P (eigendecomposition, negative rounding errors are
+    clipped)"""
+
+    w, V = scipy.linalg.eigh((P + P.T) / 2)
+
+    return V * np.sqrt(np.maximum(w, 0))
+
+
+def _solve_shifted(A, s, B):
+    """(s I - A)^-1 B for a dense or sparse A"""
+
+    if scipy.sparse.issparse(A):
+        M = (s * scipy.sparse.identity(A.shape[0], format='csc') - A).tocsc()
+        return scipy.sparse.linalg.splu(M).solve(B.astype(complex))
+
+    return np.linalg.solve(s * np.identity(A.shape[0]) - A, B)
+
+
+def _to_dense(M):
+    """Dense float array of a dense or sparse matrix"""
+
+    if scipy.sparse.issparse(M):
+        return M.toarray().astype(float)
+
+    return np.asarray(M, dtype=float)
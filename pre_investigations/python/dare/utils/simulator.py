@@ -0,0 +1,203 @@
+"""
+Allocation free simulation of discrete state space systems.
+
+forced_response converts and checks T, U and X0 and allocates the trajectories on every call, and every step of the
+loop allocates the temporaries of Ad @ x + Bd0 @ u0 + Bd1 @ u1. The Simulator does the checks and the allocations once,
+when it is built, and afterwards only writes into its own buffers with the out= arguments of numpy, so repeated
+simulations (timing runs, episodes of Env_DARE) and single steps do not allocate.
+"""
+
+import numpy as np
+import scipy.sparse
+
+
+class Simulator():
+    """Reusable simulation of x[k+1] = A_d x[k] + B_d0 u[k] + B_d1 u[k+1], y[k] = C x[k] + D u[k]
+
+    The input matrices are fused to [B_d0 B_d1], so the input of a step is a single product with the stacked samples
+    [u[k]; u[k+1]]. step returns new arrays, or writes into the arrays passed as out for a loop without allocations.
+    The arrays returned by simulate are views of the internal buffers, they are overwritten by the next call and have
+    to be copied to be kept.
+
+    Example:
+        simulator = Simulator(*sys.get_discrete(ts, 'foh'), C=sys.C, num_steps=len(t))
+        xout, yout = simulator.simulate(x0, U)          # like forced_response, no allocations in the loop
+
+        simulator.reset(x0)
+        x, y = simulator.step(u0, u1)                   # one step, e.g. in Env_DARE.step
+        simulator.step(u0, u1, out=(x, y))              # one step into existing arrays, no allocations
+    """
+
+    def __init__(self, Ad, Bd0, Bd1=None, C=None, D=None, num_steps=2, dtype=np.float64, outputs=None):
+        """
+        Args:
+            Ad: Discrete system matrix (n, n)
+            Bd0: Input matrix of the sample at the start of a step (n, m)
+            Bd1: Input matrix of the sample at the end of a step (FOH), if None the input is held over the step (ZOH)
+                 (n, m)
+            C: Output matrix, if None the outputs are the states (p, n)
+            D: Feedthrough matrix, if None zero (p, m)
+            num_steps: Number of samples of simulate (1,)
+            dtype: Data type of the matrices and buffers (e.g. np.float32)
+            outputs: Indices of the states which are the outputs, replaces C and D, the rows are gathered instead of
+                     multiplied with C (list)
+        """
+
+        Ad, Bd0 = [_to_dense(M, dtype) for M in [Ad, Bd0]]
+        self.n, self.m = Bd0.shape
+        self.num_steps = num_steps
+        self.dtype = dtype
+        self.foh = Bd1 is not None
+
+        self.Ad = Ad
+        # [B_d0 B_d1] (n, 2m) for FOH, B_d0 for ZOH
+        self.Bd = np.ascontiguousarray(np.concatenate((Bd0, _to_dense(Bd1, dtype)), axis=1) if self.foh else Bd0)
+        self._Bd_T = np.ascontiguousarray(self.Bd.T)
+
+        self.outputs = None if outputs is None else np.asarray(outputs, dtype=int)
+
+        # the outputs are the states for C = I and D = 0 (the constructors return C = I)
+        self.identity_output = self.outputs is None and (C is None or (
+            C.shape == (self.n, self.n) and _is_zero(C - scipy.sparse.identity(self.n) if scipy.sparse.issparse(C)
+                                                     else np.asarray(C) - np.identity(self.n))
+            and (D is None or _is_zero(D))))
+
+        if self.identity_output:
+            self.p = self.n
+        elif self.outputs is not None:
+            self.p = len(self.outputs)
+            self.D = None
+        else:
+            self.C = _to_dense(C, dtype)
+            self.D = None if D is None or _is_zero(D) else _to_dense(D, dtype)
+            self._C_T = np.ascontiguousarray(self.C.T)
+            self._D_T = None if self.D is None else np.ascontiguousarray(self.D.T)
+            self.p = self.C.shape[0]
+
+        # buffers of step, x and x_next are swapped after every step
+        self.x = np.zeros(self.n, dtype=dtype)
+        self._x_next = np.empty(self.n, dtype=dtype)
+        self._u = np.zeros(self.Bd.shape[1], dtype=dtype)
+        self._input = np.empty(self.n, dtype=dtype)
+        self.y = self.x if self.identity_output else np.empty(self.p, dtype=dtype)
+        self._feedthrough = None if self.identity_output or self.D is None else np.empty(self.p, dtype=dtype)
+
+        # buffers of simulate, the samples row wise so every step writes a contiguous row
+        self._X = np.empty((num_steps, self.n), dtype=dtype)
+        self._W = np.empty((num_steps - 1, self.Bd.shape[1]), dtype=dtype)
+        self._F = np.empty((num_steps - 1, self.n), dtype=dtype)
+        self._Y = self._X if self.identity_output else np.empty((num_steps, self.p), dtype=dtype)
+        self._Y_feedthrough = None if self._feedthrough is None else np.empty((num_steps, self.p), dtype=dtype)
+
+    def reset(self, x0):
+        """Set the state of step to x0 (n,)"""
+
+        self.x[:] = x0
+        self._set_output(feedthrough=False)
+
+    def step(self, u0, u1=None, out=None):
+        """Advance the state by one step
+
+        Args:
+            u0: Input at the start of the step (m,)
+            u1: Input at the end of the step (FOH), if None u0 is held (m,)
+            out: Arrays (x, y) of shapes (n,), (p,) to write the state and the output into, if None new arrays are
+                 returned
+
+        Returns:
+            (x, y): State and output after the step (n,), (p,), the arrays of out if given
+        """
+
+        u1 = u0 if u1 is None else u1
+        self._u[:self.m] = u0
+        if self.foh:
+            self._u[self.m:] = u1
+
+        np.dot(self.Bd, self._u, out=self._input)
+        np.dot(self.Ad, self.x, out=self._x_next)
+        self._x_next += self._input
+        self.x, self._x_next = self._x_next, self.x
+
+        self._set_output(feedthrough=True)
+
+        # x and y are the internal buffers, which are swapped and overwritten by the next steps
+        if out is None:
+            return self.x.copy(), self.y.copy()
+
+        x_out, y_out = out
+        x_out[:] = self.x
+        y_out[:] = self.y
+
+        return x_out, y_out
+
+    def simulate(self, x0, U):
+        """Simulate num_steps samples from x0
+
+        Args:
+            x0: Initial state (n,)
+            U: Input samples (m, num_steps)
+
+        Returns:
+            (xout, yout): States (n, num_steps) and outputs (p, num_steps), views of the internal buffers
+        """
+
+        if U.shape != (self.m, self.num_steps):
+            raise ValueError(f"Expect U of shape {(self.m, self.num_steps)}, not {U.shape}.")
+
+        X, W, F = self._X, self._W, self._F
+
+        # input terms of all steps in one product, [u[k]; u[k+1]] @ [B_d0 B_d1]^T
+        W[:, :self.m] = U[:, :-1].T
+        if self.foh:
+            W[:, self.m:] = U[:, 1:].T
+        np.dot(W, self._Bd_T, out=F)
+
+        X[0] = x0
+        for i in range(1, self.num_steps):
+            np.dot(self.Ad, X[i - 1], out=X[i])
+            X[i] += F[i - 1]
+
+        if self.outputs is not None:
+            np.take(X, self.outputs, axis=1, out=self._Y)
+        elif not self.identity_output:
+            np.dot(X, self._C_T, out=self._Y)
+            if self.D is not None:
+                np.dot(U.T, self._D_T, out=self._Y_feedthrough)
+                self._Y += self._Y_feedthrough
+
+        return X.T, self._Y.T
+
+    def _set_output(self, feedthrough):
+        """y = C x (+ D u with the input at the end of the last step) in the step buffers"""
+
+        if self.identity_output:
+            self.y = self.x
+            return
+
+        if self.outputs is not None:
+            np.take(self.x, self.outputs, out=self.y)
+            return
+
+        np.dot(self.C, self.x, out=self.y)
+        if feedthrough and self.D is not None:
+            # the input at the end of the step, u1 for FOH and u0 for ZOH, is the last block of _u
+            np.dot(self.D, self._u[-self.m:], out=self._feedthrough)
+            self.y += self._feedthrough
+
+
+def _is_zero(M):
+    """True if all entries of a dense or sparse matrix are zero"""
+
+    if scipy.sparse.issparse(M):
+        return M.count_nonzero() == 0
+
+    return not np.any(M)
+
+
+def _to_dense(M, dtype):
+    """Contiguous dense array of a dense or sparse matrix"""
+
+    if scipy.sparse.issparse(M):
+        M = M.toarray()
+
+    return np.ascontiguousarray(M, dtype=dtype)
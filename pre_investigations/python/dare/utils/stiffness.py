@@ -0,0 +1,286 @@
+"""
+Stiffness analysis of the grids and recommendation of the sampling time and the solver.
+
+The extreme eigenvalues of A are estimated with ARPACK (implicitly restarted Arnoldi): the ones of largest magnitude
+for the fast end and, by shift-invert around 0, the ones closest to the origin for the slow end. From them follow the
+stiffness ratio, the largest stable step of the explicit Runge-Kutta methods and a sampling time which resolves every
+mode that is not damped out within one sample. The costs of the solvers and forced_response backends of
+timing_evaluation are estimated with rough flop counts, so the comparison is only meant to rule out runs which are far
+off.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+from .expm_action import ExpmAction
+from .syscache import SystemCache
+
+
+# stability polynomials R(z) of the explicit methods, stable for |R(h*lambda)| <= 1
+_STABILITY_POLYNOMIALS = {
+    'euler': [1, 1],
+    'RK23': [1, 1, 1/2, 1/6],                                 # Bogacki-Shampine
+    'RK45': [1, 1, 1/2, 1/6, 1/24, 1/120, 1/600],            # Dormand-Prince
+}
+
+# function evaluations per step
+_STAGES = {'euler': 1, 'RK23': 3, 'RK45': 6}
+
+# stability functions R(z) of the implicit backends of custom_control.forced_response, x[k+1] = R(h*lambda) x[k]
+_IMPLICIT_STABILITY = {
+    'trapezoidal': lambda z: (1 + z/2) / (1 - z/2),
+    'backward_euler': lambda z: 1 / (1 - z),
+}
+
+# flops which take about as long as one iteration of a Python loop or one call of a Python right-hand side
+_LOOP_OVERHEAD = 1e4
+
+
+def estimate_eigenvalues(A, k=6):
+    """Estimate the eigenvalues at both ends of the spectrum
+
+    Args:
+        A: System matrix, dense or sparse (n, n)
+        k: Number of eigenvalues per end (1,)
+
+    Returns:
+        (eig_fast, eig_slow): k eigenvalues of largest magnitude and k eigenvalues closest to 0 (k,) complex,
+                              for small systems all eigenvalues are computed densely
+    """
+
+    n = A.shape[0]
+
+    if n <= max(4 * k, 50):
+        eig = np.linalg.eigvals(A.toarray() if scipy.sparse.issparse(A) else np.asarray(A, dtype=float))
+        order = np.argsort(np.abs(eig))
+        return eig[order[::-1][:k]], eig[order[:k]]
+
+    A = scipy.sparse.csc_matrix(A, dtype=float)
+
+    try:
+        eig_fast = scipy.sparse.linalg.eigs(A, k=k, which='LM', return_eigenvectors=False)
+    except scipy.sparse.linalg.ArpackNoConvergence as e:
+        eig_fast = e.eigenvalues
+
+    try:
+        eig_slow = scipy.sparse.linalg.eigs(A, k=k, sigma=0, which='LM', return_eigenvectors=False)
+    except scipy.sparse.linalg.ArpackNoConvergence as e:
+        # a subclass of RuntimeError, so it has to be caught first, the converged eigenvalues are kept
+        eig_slow = e.eigenvalues
+    except scipy.sparse.linalg.ArpackError:
+        raise
+    except RuntimeError:
+        # the LU factorization of the shift-invert failed, A is singular (e.g. pure 'C' loads), the slowest mode does
+        # not decay
+        eig_slow = np.zeros(1, dtype=complex)
+
+    return eig_fast[np.argsort(-np.abs(eig_fast))], eig_slow[np.argsort(np.abs(eig_slow))]
+
+
+def get_stable_step(eigenvalues, method='RK45'):
+    """Largest step of an explicit method for which all decaying modes stay stable
+
+    Args:
+        eigenvalues: Eigenvalues of A (k,) complex
+        method: 'euler', 'RK23' or 'RK45'
+
+    Returns:
+        h: Largest stable step, inf if no mode decays (1,)
+    """
+
+    if method not in _STABILITY_POLYNOMIALS:
+        raise ValueError(f"Expect method to be one of {list(_STABILITY_POLYNOMIALS)}, not {method}.")
+
+    eigenvalues = np.asarray(eigenvalues)
+    eigenvalues = eigenvalues[eigenvalues.real < 0]
+    if len(eigenvalues) == 0:
+        return np.inf
+
+    coefficients = _STABILITY_POLYNOMIALS[method][::-1]
+
+    def is_stable(h):
+        return np.all(np.abs(np.polyval(coefficients, h * eigenvalues)) <= 1 + 1e-12)
+
+    # the stability regions are bounded by |z| < 6, bisection between 0 and 6/|lambda|_max
+    low, high = 0., 6 / np.abs(eigenvalues).max()
+    for _ in range(60):
+        mid = (low + high) / 2
+        if is_stable(mid):
+            low = mid
+        else:
+            high = mid
+
+    return low
+
+
+def get_sampling_time(eigenvalues, rtol=1e-3, ts_max=1e-2):
+    """Largest sampling time from the series 1, 2, 5 * 10^k which resolves the modes of A
+
+    A mode is resolved, if the linear interpolation between the samples is accurate, (|lambda| ts)^2 / 8 <= rtol, or if
+    it is damped below rtol within one sample, exp(Re(lambda) ts) <= rtol (the exact discretization covers it anyway).
+
+    Args:
+        eigenvalues: Eigenvalues of A (k,) complex
+        rtol: Relative accuracy (1,)
+        ts_max: Upper bound of the sampling time (1,)
+
+    Returns:
+        ts: Sampling time (1,)
+    """
+
+    eigenvalues = np.asarray(eigenvalues)
+    candidates = np.sort([c * 10.**e for e in range(-12, 3) for c in [1, 2, 5] if c * 10.**e <= ts_max])[::-1]
+
+    for ts in candidates:
+        resolved = (np.abs(eigenvalues) * ts)**2 / 8 <= rtol
+        damped = np.exp(eigenvalues.real * ts) <= rtol
+        if np.all(resolved | damped):
+            return ts
+
+    return candidates[-1]
+
+
+class StiffnessAnalyzer():
+    """Stiffness reports of grids, cached per topology and parameter hash (see SystemCache.get_grid_key)
+
+    Example:
+        analyzer = StiffnessAnalyzer()
+        report = analyzer.analyze(power_grid)
+        recommendation = analyzer.recommend(power_grid, t_end=0.1, rtol=1e-4)
+    """
+
+    def __init__(self, maxsize=128, k=6):
+        """
+        Args:
+            maxsize: Maximal number of cached reports (1,)
+            k: Number of estimated eigenvalues per end of the spectrum (1,)
+        """
+
+        self.maxsize = maxsize
+        self.k = k
+        self._reports = OrderedDict()
+
+    def analyze(self, power_grid):
+        """Stiffness report of a grid
+
+        Args:
+            power_grid: Node constructor (e.g. NodeConstructorCableLoads)
+
+        Returns:
+            report: Dict with
+                num_states: Number of states
+                nnz: Nonzero entries of A
+                eig_fast: Eigenvalues of largest magnitude (k,)
+                eig_slow: Eigenvalues closest to 0 (k,)
+                spectral_radius: max |lambda|
+                stiffness_ratio: max |Re(lambda)| / min |Re(lambda)|, inf if A is singular
+                h_stable: Largest stable step of the explicit methods (dict 'euler', 'RK23', 'RK45')
+        """
+
+        key = SystemCache.get_grid_key(power_grid)
+
+        if key in self._reports:
+            self._reports.move_to_end(key)
+            return self._reports[key]
+
+        A, B, _, _ = power_grid.get_sys(sparse=True)
+        eig_fast, eig_slow = estimate_eigenvalues(A, self.k)
+
+        re_min = np.abs(eig_slow.real).min()
+        report = {
+            'num_states': A.shape[0],
+            'num_inputs': B.shape[1],
+            'nnz': A.nnz,
+            'eig_fast': eig_fast,
+            'eig_slow': eig_slow,
+            'spectral_radius': np.abs(eig_fast).max(),
+            'stiffness_ratio': np.abs(eig_fast.real).max() / re_min if re_min > 0 else np.inf,
+            'h_stable': {method: get_stable_step(eig_fast, method) for method in _STABILITY_POLYNOMIALS},
+        }
+
+        self._reports[key] = report
+        while len(self._reports) > self.maxsize:
+            self._reports.popitem(last=False)
+
+        return report
+
+    def recommend(self, power_grid, t_end, rtol=1e-3, ts=None, sparse=False, lift_size=16):
+        """Recommend the sampling time and the cheapest solver for a simulation
+
+        The costs are rough flop counts plus _LOOP_OVERHEAD per iteration of a Python loop (or per call of the
+        right-hand side of the ODE solvers):
+            control.py: ZOH expm of the (n+m) augmented matrix and a dense step per sample
+            control.py_con: FOH expm of the (n+2m) augmented matrix and a dense step per sample
+            control.py_con, krylov: Taylor matrix-vector products per sample (dare.utils.expm_action)
+            control.py_con, modal: eigendecomposition of A and a diagonal step per sample plus the transformation back to
+                the states (dare.utils.modal), forced_response falls back to dense if the eigenvectors are badly
+                conditioned, which is not checked here
+            control.py_con, lifted: the FOH expm, the powers of A_d up to lift_size and one product per block of
+                lift_size samples, the same flops per sample as dense but fewer loop iterations (dare.utils.lifted)
+            control.py_con, trapezoidal/backward_euler: one sparse LU factorization (factors assumed about as sparse as
+                A) and a sparse product and two triangular solves per sample (dare.utils.implicit). They are not exact,
+                so their cost is inf if one step at ts is off by more than rtol, |R(lambda ts) - exp(lambda ts)| > rtol,
+                for one of the estimated eigenvalues (e.g. the stiff modes for the trapezoidal rule, which it does not
+                damp)
+            scipy_solve_ivp, RK23/RK45: explicit steps limited by stability to h_stable (and to ts for accuracy)
+            scipy_solve_ivp, LSODA: implicit steps at ts with a LU factorization every 20 steps
+
+        The piecewise backend is left out, its cost depends on how long the input is constant, which is not known here.
+
+        Args:
+            power_grid: Node constructor (e.g. NodeConstructorCableLoads)
+            t_end: Simulated time (1,)
+            rtol: Relative accuracy used for the sampling time and the implicit backends (1,)
+            ts: Sampling time, if None it is chosen with get_sampling_time (1,)
+            sparse: If True, the right-hand side of the ODE solvers is evaluated with the sparse A
+            lift_size: Samples per block of the lifted backend, like StateSpace.lift_size (1,)
+
+        Returns:
+            recommendation: Dict with ts, solver (methode, methode_args) like in timing_evaluation and the estimated
+                            costs of all solvers (dict (methode, methode_args) -> flops)
+        """
+
+        report = self.analyze(power_grid)
+        eigenvalues = np.concatenate((report['eig_fast'], report['eig_slow']))
+
+        if ts is None:
+            ts = get_sampling_time(eigenvalues, rtol)
+
+        n, m = report['num_states'], report['num_inputs']
+        num_samples = int(np.ceil(t_end / ts))
+        rhs = 2 * report['nnz'] if sparse else 2 * n**2
+        loops = num_samples * _LOOP_OVERHEAD
+
+        def expm_cost(size):
+            # Pade approximant of degree 13 (about 6 products and a solve) and the squarings
+            num_squarings = max(0, int(np.ceil(np.log2(report['spectral_radius'] * ts / 5.4))))
+            return 2 * (8 + num_squarings) * size**3
+
+        A, B, _, _ = power_grid.get_sys(sparse=True)
+        dense_step = 2 * (n**2 + 2 * n * m)
+
+        costs = {
+            ('control.py', None): expm_cost(n + m) + num_samples * 2 * (n**2 + n * m) + loops,
+            ('control.py_con', None): expm_cost(n + 2 * m) + num_samples * dense_step + loops,
+            ('control.py_con', 'krylov'): num_samples * ExpmAction(A, B, ts).get_num_matvecs() * 2 * A.nnz + loops,
+            # eig with eigenvectors about 25 n^3, per sample the modal step, the inputs and the states of half of the
+            # (complex) modes
+            ('control.py_con', 'modal'): 25 * n**3 + num_samples * (8 * n + 4 * n * m + 2 * n**2) + loops,
+            ('control.py_con', 'lifted'): (expm_cost(n + 2 * m) + 2 * lift_size * (n**3 + n**2 * m) +
+                                           num_samples * (2 * n**2 + 2 * n * (lift_size + 1) * m) + loops / lift_size),
+            ('scipy_solve_ivp', 'LSODA'): num_samples * (3 * rhs + 3 * _LOOP_OVERHEAD) + num_samples / 20 * 2/3 * n**3,
+        }
+        for method, stability in _IMPLICIT_STABILITY.items():
+            z = eigenvalues * ts
+            if np.all(np.abs(stability(z) - np.exp(z)) <= rtol):
+                costs[('control.py_con', method)] = 2 * (A.nnz + n) + num_samples * (6 * (A.nnz + n) + 4 * B.nnz) + loops
+            else:
+                costs[('control.py_con', method)] = np.inf
+        for method in ['RK23', 'RK45']:
+            h = min(report['h_stable'][method], ts)
+            costs[('scipy_solve_ivp', method)] = np.ceil(t_end / h) * _STAGES[method] * (rhs + _LOOP_OVERHEAD)
+
+        return {'ts': ts, 'solver': min(costs, key=costs.get), 'costs': costs}
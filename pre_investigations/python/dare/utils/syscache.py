@@ -0,0 +1,254 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse
+
+from .discretization import MultiRate, discretize
+
+
+class SystemCache():
+    """Content addressed cache for the state space matrices of a grid
+
+    The entries are keyed by a hash of the node constructor class, the CM, the parameters, the sampling time and the
+    discretization method, so a grid which was built before (in this process or, with a path, in an earlier run) does not
+    need get_sys and the matrix exponential again.
+
+    The ZOH and FOH matrices of a grid at further sampling times are derived from the exponential of the first one by
+    repeated squaring (see dare.utils.discretization.MultiRate). A sweep over ts costs a single expm if the planned
+    sampling times are passed as rates (or the smallest one is requested first), the exponential is then computed for
+    the smallest one and every multiple of it follows from its squares.
+
+    The entries are kept in memory with LRU eviction. If a path is given they are also stored on disk, one directory per
+    key with a .npy file per matrix, which are opened memory mapped.
+
+    Stored matrices:
+        method 'zoh', 'tustin': A, B, C, D, A_d, B_d
+        method 'foh': A, B, C, D, A_d, B_d0, B_d1
+    """
+
+    def __init__(self, maxsize=32, path=None):
+        """
+        Args:
+            maxsize: Maximal number of entries kept in memory (1,)
+            path: Directory of the on-disk cache, if None the entries are only kept in memory
+        """
+
+        self.maxsize = maxsize
+        self.path = path
+        self._entries = OrderedDict()
+        self._rates = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(power_grid, ts, method='zoh'):
+        """Hash of (node constructor class, CM, parameters, ts, method)
+
+        Args:
+            power_grid: Node constructor (e.g. NodeConstructorCableLoads)
+            ts: Sampling time (1,)
+            method: Discretization method
+
+        Returns:
+            key: Hex digest (str)
+        """
+
+        h = SystemCache._get_grid_hash(power_grid)
+        h.update(repr(float(ts)).encode())
+        h.update(method.encode())
+
+        return h.hexdigest()
+
+    @staticmethod
+    def get_grid_key(power_grid):
+        """Hash of (node constructor class, CM, parameters), the key of everything which does not depend on ts
+
+        Returns:
+            key: Hex digest (str)
+        """
+
+        return SystemCache._get_grid_hash(power_grid).hexdigest()
+
+    @staticmethod
+    def _get_grid_hash(power_grid):
+        """Hash object of (node constructor class, CM, parameters)"""
+
+        h = hashlib.sha256()
+        h.update(type(power_grid).__name__.encode())
+
+        CM = np.ascontiguousarray(power_grid.CM, dtype=np.int64)
+        h.update(str(CM.shape).encode())
+        h.update(CM.tobytes())
+
+        if hasattr(power_grid, 'parameter_store'):
+            store = power_grid.parameter_store
+            _update_hash(h, [store.source['fltr'], store.load['impedance'], store.get_vector()])
+        else:
+            _update_hash(h, power_grid.parameter)
+
+        return h
+
+    def get(self, key):
+        """Returns the entry of a key or None, the on-disk cache is checked if the key is not in memory"""
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        if self.path is not None:
+            directory = os.path.join(self.path, key)
+            if os.path.isdir(directory):
+                entry = {os.path.splitext(f)[0]: np.load(os.path.join(directory, f), mmap_mode='r')
+                         for f in os.listdir(directory) if f.endswith('.npy')}
+                self._insert(key, entry)
+                return entry
+
+        return None
+
+    def put(self, key, entry):
+        """Store an entry (dict of name and array), the stored arrays are read-only
+
+        Returns:
+            entry: Stored entry
+        """
+
+        entry = {name: _to_array(M) for name, M in entry.items()}
+        for M in entry.values():
+            M.flags.writeable = False
+        self._insert(key, entry)
+
+        if self.path is not None:
+            directory = os.path.join(self.path, key)
+            if not os.path.isdir(directory):
+                os.makedirs(self.path, exist_ok=True)
+
+                # write into a temporary directory first, so that other processes never see a partial entry
+                tmp = tempfile.mkdtemp(dir=self.path)
+                for name, M in entry.items():
+                    np.save(os.path.join(tmp, name + '.npy'), M)
+                try:
+                    os.rename(tmp, directory)
+                except OSError:
+                    # written by another process in the meantime
+                    for f in os.listdir(tmp):
+                        os.remove(os.path.join(tmp, f))
+                    os.rmdir(tmp)
+
+        return entry
+
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _get_rates(self, power_grid, A, B, ts):
+        """MultiRate of a grid, the same LRU eviction as for the entries
+
+        A stored MultiRate is kept if ts is an integer multiple of its base or larger (then it discretizes ts on its own),
+        a smaller ts replaces it by one with the base ts.
+        """
+
+        key = self.get_grid_key(power_grid)
+
+        if key in self._rates:
+            self._rates.move_to_end(key)
+            rates = self._rates[key]
+            if ts >= rates.ts or rates._get_multiple(ts) is not None:
+                return rates
+
+        rates = MultiRate(A, B, ts)
+        self._rates[key] = rates
+        while len(self._rates) > self.maxsize:
+            self._rates.popitem(last=False)
+
+        return rates
+
+    def clear(self):
+        """Clear the in-memory entries, the on-disk cache is kept"""
+
+        self._entries.clear()
+        self._rates.clear()
+
+    def get_system(self, power_grid, ts, method='zoh', sparse=False, rates=None):
+        """Returns the continuous and discrete matrices of a grid from the cache or builds and stores them
+
+        Args:
+            power_grid: Node constructor (e.g. NodeConstructorCableLoads)
+            ts: Sampling time (1,)
+            method: 'zoh', 'foh' or 'tustin' (see dare.utils.discretization.discretize)
+            sparse: Passed to get_sys and discretize, the stored matrices are dense in any case
+            rates: Sampling times of the planned sweep, the exponential is computed for the smallest one, so that ts
+                   and the other rates follow from its squares regardless of the order of the calls (list)
+
+        Returns:
+            entry: Dict with the matrices (see class description)
+        """
+
+        if method not in ['zoh', 'foh', 'tustin']:
+            raise ValueError(f"Expect method to be 'zoh', 'foh' or 'tustin', not {method}.")
+
+        key = self.get_key(power_grid, ts, method)
+        entry = self.get(key)
+
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+
+        A, B, C, D = power_grid.get_sys(sparse=sparse)
+        entry = {'A': A, 'B': B, 'C': C, 'D': D}
+
+        # base of the exponentials, the smallest planned sampling time
+        base = ts if rates is None else min(min(rates), ts)
+
+        if method == 'foh':
+            entry['A_d'], entry['B_d0'], entry['B_d1'] = self._get_rates(power_grid, A, B, base).discretize(ts, method)
+        elif method == 'zoh':
+            entry['A_d'], entry['B_d'] = self._get_rates(power_grid, A, B, base).discretize(ts, method)
+        else:
+            entry['A_d'], entry['B_d'] = discretize(A, B, ts, method)
+
+        return self.put(key, entry)
+
+
+def _to_array(M):
+    """Dense float array of a matrix or scalar"""
+
+    if scipy.sparse.issparse(M):
+        M = M.toarray()
+
+    return np.array(M, dtype=float)
+
+
+def _update_hash(h, obj):
+    """Feed a canonical representation of nested dicts, lists, arrays and numbers into a hash"""
+
+    if isinstance(obj, dict):
+        h.update(b'{')
+        for key in sorted(obj.keys(), key=str):
+            h.update(repr(key).encode())
+            _update_hash(h, obj[key])
+        h.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[')
+        for item in obj:
+            _update_hash(h, item)
+        h.update(b']')
+    elif isinstance(obj, np.ndarray):
+        obj = np.ascontiguousarray(obj)
+        h.update(f'{obj.dtype.str}{obj.shape}'.encode())
+        h.update(obj.tobytes())
+    elif isinstance(obj, (int, float, np.number)) and not isinstance(obj, bool):
+        h.update(repr(float(obj)).encode())
+    else:
+        h.update(repr(obj).encode())
+
+
+# in-memory cache shared by the environments of one process
+default_cache = SystemCache()
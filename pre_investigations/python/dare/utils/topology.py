@@ -0,0 +1,123 @@
+import numpy as np
+
+
+def generate_edges(num_source, num_loads, S2S_p=0.1, S2L_p=0.8, mean_degree=None, rng=None):
+    """Draw a random connected grid topology as edge list
+
+    Every pair of sources is connected with probability S2S_p, every other pair (source-load and load-load) with
+    probability S2L_p, like in NodeConstructorCableLoads.generate_CM. The pairs are drawn by skipping geometrically
+    distributed gaps, so the effort grows with the number of drawn cables and not with the number of pairs.
+    A random spanning tree is added to guarantee that the grid is connected.
+
+    Args:
+        num_source: Number of sources in the grid (1,)
+        num_loads: Number of loads in the grid (1,)
+        S2S_p: Probability that a source is connected to a source (1,)
+        S2L_p: Probability that a source is connected to a load (1,)
+        mean_degree: If given, both probabilities are scaled so that the expected mean number of cables per element
+                     (including the spanning tree) matches it (1,)
+        rng: np.random.Generator or seed, if None a new Generator is created
+
+    Returns:
+        edges: Connected elements (i, j) with i < j, sorted like the CM numbering (row by row), cable c+1 connects
+               edges[c] (num_connections, 2)
+    """
+
+    rng = np.random.default_rng(rng)
+    tot_ele = num_source + num_loads
+
+    # the upper triangle is enumerated column by column, column j holds the pairs (0, j) ... (j-1, j),
+    # so the pairs of the sources come first
+    num_pairs_S2S = num_source * (num_source-1) // 2
+    num_pairs = tot_ele * (tot_ele-1) // 2
+
+    if mean_degree is not None:
+        num_tree = max(tot_ele - 1, 0)
+        expected = S2S_p * num_pairs_S2S + S2L_p * (num_pairs - num_pairs_S2S)
+        target = max(mean_degree * tot_ele / 2 - num_tree, 0)
+        scale = target / expected if expected > 0 else 0
+        S2S_p = min(S2S_p * scale, 1)
+        S2L_p = min(S2L_p * scale, 1)
+
+    linear = np.concatenate((_bernoulli_indices(num_pairs_S2S, S2S_p, rng),
+                             num_pairs_S2S + _bernoulli_indices(num_pairs - num_pairs_S2S, S2L_p, rng)))
+
+    # random spanning tree, every element is attached to a random element drawn before it
+    order = rng.permutation(tot_ele)
+    parent = order[(rng.random(tot_ele-1) * np.arange(1, tot_ele)).astype(np.int64)] if tot_ele > 1 else order[:0]
+    child = order[1:]
+
+    col_start = np.arange(tot_ele, dtype=np.int64) * (np.arange(tot_ele, dtype=np.int64) - 1) // 2
+    tree = col_start[np.maximum(parent, child)] + np.minimum(parent, child)
+
+    linear = np.union1d(linear, tree)
+
+    j = np.searchsorted(col_start, linear, side='right') - 1
+    i = linear - col_start[j]
+
+    # number the cables row by row like the CM
+    order = np.lexsort((j, i))
+    edges = np.stack((i[order], j[order]), axis=1)
+
+    return edges
+
+
+def _bernoulli_indices(num, p, rng):
+    """Indices of num Bernoulli(p) trials which were successful (sorted)"""
+
+    if num == 0 or p <= 0:
+        return np.zeros(0, dtype=np.int64)
+    elif p >= 1:
+        return np.arange(num, dtype=np.int64)
+
+    chunks = list()
+    last = -1
+    while last < num:
+        # number of gaps to reach the end with high probability
+        size = int((num - last) * p + 4 * np.sqrt((num - last) * p) + 16)
+        positions = last + np.cumsum(rng.geometric(p, size=size))
+        chunks.append(positions[positions < num])
+        last = positions[-1]
+
+    return np.concatenate(chunks)
+
+
+def edges_to_CM(edges, tot_ele):
+    """Create the CM of an edge list
+
+    Args:
+        edges: Connected elements (i, j), cable c+1 connects edges[c] from i to j (num_connections, 2)
+        tot_ele: Total number of elements (1,)
+
+    Returns:
+        CM: Connection Matrix with CM[i, j] = c+1 and CM[j, i] = -(c+1) (tot_ele, tot_ele)
+    """
+
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    cables = np.arange(1, len(edges)+1)
+
+    CM = np.zeros((tot_ele, tot_ele))
+    CM[edges[:, 0], edges[:, 1]] = cables
+    CM[edges[:, 1], edges[:, 0]] = -cables
+
+    return CM
+
+
+def CM_to_edges(CM):
+    """Create the edge list of a CM
+
+    Args:
+        CM: Connection Matrix (tot_ele, tot_ele)
+
+    Returns:
+        edges: Connected elements (i, j) with CM[i, j] > 0, cable c+1 connects edges[c] (num_connections, 2)
+    """
+
+    i, j = np.nonzero(CM > 0)
+    cables = np.abs(CM[i, j]).astype(np.int64)
+
+    edges = np.zeros((int(cables.max(initial=0)), 2), dtype=np.int64)
+    edges[cables-1, 0] = i
+    edges[cables-1, 1] = j
+
+    return edges
@@ -0,0 +1,174 @@
+"""
+Binary CM corpus.
+
+The draws of one node count are stored in two .npy files next to each other:
+
+    CM_nodes{N}.edges.npy: Signed edge lists of all draws, one row (from, to, cable) per cable, i.e.
+                           CM[from, to] = cable and CM[to, from] = -cable (num_cables_total, 3) int32
+    CM_nodes{N}.index.npy: Offset index, the edges of draw c are edges[index[c, 0]:index[c, 1]] and the CM of the
+                           draw has index[c, 2] rows (num_draws, 3) int64
+
+Both files are opened memory mapped, so getting draw c of size N only reads the rows of this draw.
+If only the former CM_nodes{N}.json file exists, it is converted on first access.
+
+Convert all JSON files of a directory:
+    python cm_corpus.py --convert CM_matrices
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+
+import numpy as np
+
+
+def CM_to_signed_edges(CM):
+    """Create the signed edge list of a CM
+
+    Args:
+        CM: Connection Matrix (tot_ele, tot_ele)
+
+    Returns:
+        edges: Rows (from, to, cable) for every positive entry of the CM, sorted by cable (num_connections, 3)
+    """
+
+    CM = np.asarray(CM)
+    i, j = np.nonzero(CM > 0)
+    cables = CM[i, j].astype(np.int64)
+    order = np.argsort(cables, kind='stable')
+
+    return np.stack((i[order], j[order], cables[order]), axis=1).astype(np.int32)
+
+
+def signed_edges_to_CM(edges, tot_ele):
+    """Create the CM of a signed edge list (see CM_to_signed_edges)
+
+    Returns:
+        CM: Connection Matrix (tot_ele, tot_ele)
+    """
+
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 3)
+
+    CM = np.zeros((tot_ele, tot_ele), dtype=np.int64)
+    CM[edges[:, 0], edges[:, 1]] = edges[:, 2]
+    CM[edges[:, 1], edges[:, 0]] = -edges[:, 2]
+
+    return CM
+
+
+def write_corpus(path, nodes, edges, tot_ele):
+    """Write the draws of one node count in the binary format
+
+    Args:
+        path: Corpus directory
+        nodes: Node count (1,)
+        edges: List of signed edge lists of the draws (see CM_to_signed_edges) (num_connections, 3)
+        tot_ele: List of the CM sizes of the draws
+    """
+
+    os.makedirs(path, exist_ok=True)
+
+    counts = np.array([len(e) for e in edges], dtype=np.int64)
+
+    index = np.zeros((len(edges), 3), dtype=np.int64)
+    index[:, 1] = np.cumsum(counts)
+    index[:, 0] = index[:, 1] - counts
+    index[:, 2] = tot_ele
+
+    edges = np.concatenate(edges).astype(np.int32) if len(edges) else np.zeros((0, 3), dtype=np.int32)
+
+    # write the index last, it marks the corpus as complete
+    np.save(os.path.join(path, f'CM_nodes{nodes}.edges.npy'), edges)
+    np.save(os.path.join(path, f'CM_nodes{nodes}.index.npy'), index)
+
+
+def convert_json(path, nodes=None):
+    """Convert CM_nodes{N}.json files into the binary format
+
+    Args:
+        path: Directory with the JSON files
+        nodes: Node counts to convert, if None all JSON files of the directory are converted (list)
+
+    Returns:
+        nodes: Converted node counts (list)
+    """
+
+    if nodes is None:
+        files = glob.glob(os.path.join(path, 'CM_nodes*.json'))
+        nodes = sorted(int(re.search(r'CM_nodes(\d+)\.json$', f).group(1)) for f in files)
+
+    for N in nodes:
+        with open(os.path.join(path, f'CM_nodes{N}.json'), 'r') as infile:
+            CM_list = json.loads(infile.read())
+
+        write_corpus(path, N, [CM_to_signed_edges(CM) for CM in CM_list], [len(CM) for CM in CM_list])
+
+    return nodes
+
+
+class CMCorpus():
+    """Random access to the draws of a binary CM corpus
+
+    Example:
+        corpus = CMCorpus('pre_investigations/python/solver_investigations/CM_matrices')
+        CM = corpus.get_CM(30, 0)
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Corpus directory
+        """
+
+        self.path = path
+        self._files = dict()
+
+    def _open(self, nodes):
+        """Memory map the files of a node count, convert the JSON file if the binary files are missing"""
+
+        if nodes not in self._files:
+            edges_file = os.path.join(self.path, f'CM_nodes{nodes}.edges.npy')
+            index_file = os.path.join(self.path, f'CM_nodes{nodes}.index.npy')
+
+            if not os.path.exists(index_file):
+                if os.path.exists(os.path.join(self.path, f'CM_nodes{nodes}.json')):
+                    convert_json(self.path, [nodes])
+                else:
+                    raise FileNotFoundError(f"Expect a corpus for {nodes} nodes in {self.path}, but found none.")
+
+            self._files[nodes] = (np.load(edges_file, mmap_mode='r'), np.load(index_file, mmap_mode='r'))
+
+        return self._files[nodes]
+
+    def num_draws(self, nodes):
+        """Number of draws stored for a node count"""
+
+        return len(self._open(nodes)[1])
+
+    def get_edges(self, nodes, c):
+        """Returns the signed edge list of draw c (see CM_to_signed_edges)
+
+        Returns:
+            (edges, tot_ele): Memory mapped rows (from, to, cable) (num_connections, 3) and size of the CM
+        """
+
+        edges, index = self._open(nodes)
+        start, stop, tot_ele = index[c]
+
+        return edges[start:stop], int(tot_ele)
+
+    def get_CM(self, nodes, c):
+        """Returns the dense CM of draw c (tot_ele, tot_ele)"""
+
+        return signed_edges_to_CM(*self.get_edges(nodes, c))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert CM_nodes{N}.json files into the binary corpus format.')
+    parser.add_argument('--convert', default='CM_matrices', help='directory with the JSON files')
+    parser.add_argument('--nodes', type=int, nargs='+', default=None, help='node counts (default: all files)')
+    args = parser.parse_args()
+
+    print(f'converted {convert_json(args.convert, args.nodes)}')
@@ -7,13 +7,23 @@ from numpy.random import rand, randn
 from numpy.linalg import solve, eigvals, matrix_rank
 from numpy.linalg.linalg import LinAlgError
 import scipy as sp
+import scipy.sparse
 from scipy.signal import cont2discrete
 from scipy.signal import StateSpace as signalStateSpace
 from warnings import warn
 #from .lti import LTI, common_timebase, isdtime, _process_frequency_response
 #from . import config
+from collections import OrderedDict
 from copy import copy, deepcopy
 
+from pre_investigations.python.dare.utils.discretization import discretize
+from pre_investigations.python.dare.utils.expm_action import ExpmAction
+from pre_investigations.python.dare.utils.implicit import ImplicitStepper
+from pre_investigations.python.dare.utils.lifted import LiftedSystem
+from pre_investigations.python.dare.utils.modal import ModalSystem
+from pre_investigations.python.dare.utils.piecewise import PiecewiseConstantSolver
+from pre_investigations.python.dare.utils.simulator import Simulator
+
 
 
 __all__ = ['StateSpace', 'ss']
@@ -23,6 +33,10 @@ def _ssmatrix(data, axis=1, bit32=False):
     # Convert the data into an array or matrix, as configured
     # If data is passed as a string, use (deprecated?) matrix constructor
 
+    # sparse matrices are kept sparse (CSR) for the krylov backend of forced_response
+    if sp.sparse.issparse(data):
+        return sp.sparse.csr_matrix(data, dtype=np.float32 if bit32 else float)
+
     if bit32:
         arr = np.array(data, dtype=np.float32)
     else:
@@ -59,6 +73,21 @@ class StateSpace():
             self.use_cuda = kwargs['use_cuda']
         if 'offline_expm' in kwargs:
             self.offline_expm = kwargs['offline_expm']
+        if 'expm_dt' in kwargs:
+            self.expm_dt = kwargs['expm_dt']
+        if 'expm_cache_size' in kwargs:
+            self.expm_cache_size = kwargs['expm_cache_size']
+        if 'lift_size' in kwargs:
+            self.lift_size = kwargs['lift_size']
+        if 'state_labels' in kwargs:
+            self.state_labels = list(kwargs['state_labels'])
+
+        # discrete coefficients of continuous time systems per (method, dt), see get_discrete
+        self._expm_cache = OrderedDict()
+        self._modal = None
+        self._piecewise = None
+        self._implicit = None
+        self._lifted = None
 
         # first get A, B, C, D matrices
         if len(args) == 4:
@@ -128,15 +157,9 @@ class StateSpace():
         self.nstates = A.shape[1]
 
         if self.offline_expm and dt is not None and dt == 0:
-            test_dt = 1e-4
-            M = np.block([[A * test_dt, B * test_dt, np.zeros((self.nstates, self.ninputs))],
-                          [np.zeros((self.ninputs, self.nstates + self.ninputs)),
-                           np.identity(self.ninputs)],
-                          [np.zeros((self.ninputs, self.nstates + 2 * self.ninputs))]])
-            expM = sp.linalg.expm(M)
-            self.Ad = expM[:self.nstates, :self.nstates]
-            self.Bd1 = expM[:self.nstates, self.nstates + self.ninputs:]
-            self.Bd0 = expM[:self.nstates, self.nstates:self.nstates + self.ninputs] - self.Bd1
+            # fill the cache before the simulation, forced_response looks the coefficients up by its actual dt
+            for expm_dt in np.atleast_1d(self.expm_dt):
+                self.get_discrete(expm_dt, 'foh')
 
         if 0 == self.nstates:
             # static gain
@@ -168,9 +191,80 @@ class StateSpace():
     bit32 = False
     use_cuda = False
     offline_expm = False
-    Ad = []
-    Bd1 = []
-    Bd0 = []
+    expm_dt = 1e-4
+    expm_cache_size = 8
+    lift_size = 16
+    state_labels = None
+
+    def get_discrete(self, dt, method='foh'):
+        # Discrete coefficients of the continuous time system for the time step dt
+        #   'foh': (Ad, Bd0, Bd1) with x[k+1] = Ad x[k] + Bd0 u[k] + Bd1 u[k+1]
+        #   'zoh': (Ad, Bd) with x[k+1] = Ad x[k] + Bd u[k]
+        # The last expm_cache_size coefficient sets are kept (LRU), so repeated simulations with the same spacing of T
+        # skip the matrix exponential. dt is compared with 12 significant digits (float32 precision for bit32), since
+        # the spacing computed from T differs from the nominal one by rounding errors.
+        key = (method, float(np.float32(dt)) if self.bit32 else float('%.12g' % dt))
+
+        if key in self._expm_cache:
+            self._expm_cache.move_to_end(key)
+            return self._expm_cache[key]
+
+        coefficients = discretize(self.A, self.B, dt, method)
+
+        if self.expm_cache_size > 0:
+            self._expm_cache[key] = coefficients
+            while len(self._expm_cache) > self.expm_cache_size:
+                self._expm_cache.popitem(last=False)
+
+        return coefficients
+
+    def get_modal(self, cond_max=1e8):
+        # Eigendecomposition of the system for the modal backend of forced_response, computed once
+        if self._modal is None or self._modal.cond_max != cond_max:
+            self._modal = ModalSystem(self.A, self.B, self.C, self.D, cond_max=cond_max)
+
+        return self._modal
+
+    def get_piecewise(self, dt):
+        # Closed form solver for piecewise constant inputs of the piecewise backend of forced_response, the squares of
+        # the exponential are kept for the last dt
+        if self._piecewise is None or not np.isclose(self._piecewise.ts, dt, rtol=1e-12, atol=0):
+            self._piecewise = PiecewiseConstantSolver(self.A, self.B, dt)
+
+        return self._piecewise
+
+    def get_implicit(self, dt, method='trapezoidal'):
+        # Implicit stepper of the trapezoidal and backward_euler backends of forced_response, the sparse LU
+        # factorization is kept for the last dt and method
+        if self._implicit is None or self._implicit.method != method or \
+                not np.isclose(self._implicit.ts, dt, rtol=1e-12, atol=0):
+            self._implicit = ImplicitStepper(self.A, self.B, dt, method)
+
+        return self._implicit
+
+    def get_lifted(self, dt):
+        # Lifted FOH system of the lifted backend of forced_response, advances lift_size samples per product, kept for
+        # the last dt
+        if self._lifted is None or self._lifted[1].k != self.lift_size or \
+                not np.isclose(self._lifted[0], dt, rtol=1e-12, atol=0):
+            self._lifted = (dt, LiftedSystem(*self.get_discrete(dt, 'foh'), k=self.lift_size))
+
+        return self._lifted[1]
+
+    def get_simulator(self, dt=None, num_steps=2, outputs=None):
+        # Reusable simulator with preallocated buffers for num_steps samples (see dare.utils.simulator), continuous
+        # time systems are discretized with FOH for the time step dt like in forced_response, discrete time systems
+        # step with A and B. The checks of forced_response are done here once, not on every simulation.
+        # outputs: states selected as outputs by label (state_labels) or index, see forced_response
+        d_type = np.float32 if self.bit32 else np.float64
+        output_indices = _get_output_indices(self, outputs)
+        if self.isctime(strict=True):
+            if dt is None:
+                raise ValueError("Expect a time step dt for a continuous time system.")
+            return Simulator(*self.get_discrete(dt, 'foh'), C=self.C, D=self.D, num_steps=num_steps, dtype=d_type,
+                             outputs=output_indices)
+
+        return Simulator(self.A, self.B, C=self.C, D=self.D, num_steps=num_steps, dtype=d_type, outputs=output_indices)
 
     def issiso(self):
         '''Check to see if a system is single input, single output'''
@@ -209,7 +303,7 @@ class StateSpace():
     def _isstatic(self):
         """True if and only if the system has no dynamics, that is,
         if A and B are zero. """
-        return not np.any(self.A) and not np.any(self.B)
+        return all(M.count_nonzero() == 0 if sp.sparse.issparse(M) else not np.any(M) for M in [self.A, self.B])
 
 
 def ss(*args, **kwargs):
@@ -676,14 +770,47 @@ class TimeResponseData():
 
 # Forced response of a linear system
 def forced_response(sys, T=None, U=0., X0=0., transpose=False,
-                    interpolate=False, return_x=None, squeeze=None):
+                    interpolate=False, return_x=None, squeeze=None, backend='dense', outputs=None):
+    # backend: 'dense' steps with the dense discrete matrices, 'krylov' advances continuous time systems with the action
+    #          of the matrix exponential on the sparse A (see dare.utils.expm_action), A_d is never formed,
+    #          'modal' simulates continuous time systems in the eigenbasis of A with O(n) per step (see
+    #          dare.utils.modal), it falls back to 'dense' if the eigenvectors are badly conditioned,
+    #          'piecewise' bridges segments of constant input samples in closed form (see dare.utils.piecewise),
+    #          'trapezoidal' and 'backward_euler' integrate continuous time systems implicitly with one sparse LU
+    #          factorization of the sparse A (see dare.utils.implicit), unconditionally stable but only accurate for
+    #          modes which are resolved by the time step,
+    #          'lifted' advances continuous time systems by sys.lift_size samples per product (see dare.utils.lifted)
+    # outputs: states returned as outputs, given by label (sys.state_labels, e.g. the get_states of the node
+    #          constructor passed as cc.ss(..., state_labels=power_grid.get_states())) or by index. The rows are
+    #          gathered from the states instead of computing C @ x + D @ u, and the dense backend of continuous time
+    #          systems stores the full states only if return_x is True. The modal backend also transforms the states
+    #          back only if return_x is True or outputs are selected, otherwise the response has no states.
+
+    if backend not in ['dense', 'krylov', 'modal', 'piecewise', 'trapezoidal', 'backward_euler', 'lifted']:
+        raise ValueError(f"Expect backend to be 'dense', 'krylov', 'modal', 'piecewise', 'trapezoidal', "
+                         f"'backward_euler' or 'lifted', not {backend}.")
 
     # If return_x was not specified, figure out the default
     if return_x is None:
         return_x = False
 
-    A, B, C, D = np.asarray(sys.A), np.asarray(sys.B), np.asarray(sys.C), \
-        np.asarray(sys.D)
+    output_indices = _get_output_indices(sys, outputs)
+
+    if backend in ['krylov', 'modal', 'piecewise', 'trapezoidal', 'backward_euler', 'lifted']:
+        if not sys.isctime(strict=True):
+            raise ValueError(f"Expect a continuous time system for the {backend} backend.")
+        if sys.bit32 or sys.use_cuda:
+            raise ValueError(f"Expect bit32 and use_cuda to be False for the {backend} backend.")
+
+    if backend == 'modal' and not sys.get_modal().valid:
+        warn("eigenvectors of A are badly conditioned (cond = %.3g), "
+             "using the dense backend" % sys.get_modal().cond)
+        backend = 'dense'
+
+    if backend in ['krylov', 'trapezoidal', 'backward_euler']:
+        A, B, C, D = sys.A, sys.B, sys.C, sys.D
+    else:
+        A, B, C, D = [M.toarray() if sp.sparse.issparse(M) else np.asarray(M) for M in [sys.A, sys.B, sys.C, sys.D]]
     # d_type = A.dtype
     n_states = A.shape[0]
     n_inputs = B.shape[1]
@@ -706,13 +833,13 @@ def forced_response(sys, T=None, U=0., X0=0., transpose=False,
             if U.ndim == 1:
                 n_steps = U.shape[0]
             else:
-                n_steps = U.shape[1]
+                n_steps = U.shape[-1]
             dt = 1. if sys.dt in [True, None] else sys.dt
             T = np.array(range(n_steps)) * dt
         else:
             # Make sure the input vector and time vector have same length
             if (U.ndim == 1 and U.shape[0] != T.shape[0]) or \
-                    (U.ndim > 1 and U.shape[1] != T.shape[0]):
+                    (U.ndim > 1 and U.shape[-1] != T.shape[0]):
                 raise ValueError('Parameter ``T`` must have same elements as'
                                  ' the number of columns in input array ``U``')
             if U.ndim == 0:
@@ -735,6 +862,11 @@ def forced_response(sys, T=None, U=0., X0=0., transpose=False,
         raise ValueError("Parameter ``T``: time values must be equally "
                          "spaced.")
 
+    # several traces (X0 (n, K) or U (m, K, n_steps)) are simulated together
+    if np.ndim(U) == 3 or (np.ndim(X0) == 2 and np.shape(X0)[1] > 1):
+        return _forced_response_batch(sys, T, U, X0, dt, transpose=transpose, return_x=return_x, squeeze=squeeze,
+                                      backend=backend, output_indices=output_indices)
+
     # create X0 if not given, test if X0 has correct shape
     X0 = _check_convert_array(X0, [(n_states,), (n_states, 1)],
                               'Parameter ``X0``: ', squeeze=True)
@@ -752,6 +884,11 @@ def forced_response(sys, T=None, U=0., X0=0., transpose=False,
         if U.dtype != np.float32:
             U = U.astype(np.float32)
 
+    if output_indices is not None and sys.isctime(strict=True) and backend == 'dense' and not sys.use_cuda:
+        return _forced_response_selected(sys, T, U, X0, dt, output_indices, transpose=transpose, return_x=return_x,
+                                         squeeze=squeeze)
+
+    if sys.bit32:
         xout = np.zeros((n_states, n_steps), dtype=np.float32)
         yout = np.zeros((n_outputs, n_steps), dtype=np.float32)
         dt = dt.astype(np.float32)
@@ -766,11 +903,49 @@ def forced_response(sys, T=None, U=0., X0=0., transpose=False,
     if sys.isctime(strict=True):
         # Solve the differential equation, copied from scipy.signal.ltisys.
 
+        if backend == 'krylov':
+            if U.ndim == 1:
+                U = U.reshape(1, -1)
+
+            # input interpolated linearly between the samples like in the dense algorithm below
+            xout = ExpmAction(A, B, dt).simulate(X0, U, hold='foh')
+            yout = _get_outputs(C, D, xout, U, output_indices)
+
+        elif backend in ['trapezoidal', 'backward_euler']:
+            if U.ndim == 1:
+                U = U.reshape(1, -1)
+
+            xout = sys.get_implicit(dt, backend).simulate(X0, U)
+            yout = _get_outputs(C, D, xout, U, output_indices)
+
+        elif backend == 'lifted':
+            if U.ndim == 1:
+                U = U.reshape(1, -1)
+
+            xout = sys.get_lifted(dt).simulate(X0, U)
+            yout = _get_outputs(C, D, xout, U, output_indices)
+
+        elif backend == 'piecewise':
+            if U.ndim == 1:
+                U = U.reshape(1, -1)
+
+            xout = sys.get_piecewise(dt).simulate(X0, U, hold='foh')
+            yout = _get_outputs(C, D, xout, U, output_indices)
+
+        elif backend == 'modal':
+            if U.ndim == 1:
+                U = U.reshape(1, -1)
+
+            # the states are only transformed back if they are returned, otherwise the response has no states
+            yout, xout = sys.get_modal().simulate(X0, U, dt, 'foh', return_x=return_x or output_indices is not None)
+            if output_indices is not None:
+                yout = _get_outputs(C, D, xout, U, output_indices)
+
         # Faster algorithm if U is zero
         # (if not None, it was converted to array above)
-        if U is None or np.all(U == 0):
+        elif U is None or np.all(U == 0):
             # Solve using matrix exponential
-            expAdt = sp.linalg.expm(A * dt)
+            expAdt, _ = sys.get_discrete(dt, 'zoh')
             for i in range(1, n_steps):
                 xout[:, i] = expAdt @ xout[:, i-1]
             yout = C @ xout
@@ -791,19 +966,7 @@ def forced_response(sys, T=None, U=0., X0=0., transpose=False,
             #   [ u(dt) ] = exp [  0     0    I ] [  u0   ]
             #   [u1 - u0]       [  0     0    0 ] [u1 - u0]
 
-            if sys.offline_expm:
-                Ad = sys.Ad
-                Bd1 = sys.Bd1
-                Bd0 = sys.Bd0
-            else:
-                M = np.block([[A * dt, B * dt, np.zeros((n_states, n_inputs))],
-                             [np.zeros((n_inputs, n_states + n_inputs)),
-                              np.identity(n_inputs)],
-                             [np.zeros((n_inputs, n_states + 2 * n_inputs))]])
-                expM = sp.linalg.expm(M)
-                Ad = expM[:n_states, :n_states]
-                Bd1 = expM[:n_states, n_states+n_inputs:]
-                Bd0 = expM[:n_states, n_states:n_states + n_inputs] - Bd1
+            Ad, Bd0, Bd1 = sys.get_discrete(dt, 'foh')
 
             if sys.bit32:
                 Ad = Ad.astype(np.float32)
@@ -932,9 +1095,290 @@ def forced_response(sys, T=None, U=0., X0=0., transpose=False,
         yout = np.transpose(yout)
         U = np.transpose(U)
 
+        if output_indices is not None:
+            yout = xout[output_indices]
+
     if sys.use_cuda:
         cp.cuda.Device().synchronize()
 
+    if output_indices is not None:
+        return TimeResponseData(
+            tout, yout, xout, U, issiso=sys.ninputs == 1 and len(output_indices) == 1,
+            output_labels=_get_labels(sys, output_indices),
+            state_labels=None if xout is None else sys.state_labels,
+            transpose=transpose, return_x=return_x, squeeze=squeeze)
+
     return TimeResponseData(
         tout, yout, xout, U, issiso=sys.issiso(),
         transpose=transpose, return_x=return_x, squeeze=squeeze)
+
+
+def _get_output_indices(sys, outputs):
+    # Indices of the states selected as outputs, given by label (sys.state_labels) or by index, None for all outputs
+    if outputs is None:
+        return None
+
+    indices = []
+    for output in outputs:
+        if isinstance(output, str):
+            if sys.state_labels is None or output not in sys.state_labels:
+                raise ValueError(f"Expect output {output} to be one of the state labels {sys.state_labels}.")
+            indices.append(sys.state_labels.index(output))
+        else:
+            if not -sys.nstates <= output < sys.nstates:
+                raise ValueError(f"Expect output index {output} to be smaller than the number of states "
+                                 f"{sys.nstates}.")
+            indices.append(int(output) % sys.nstates)
+
+    return np.asarray(indices, dtype=int)
+
+
+def _get_labels(sys, indices):
+    # State labels of the selected outputs, None without labels
+    return None if sys.state_labels is None else [sys.state_labels[i] for i in indices]
+
+
+def _get_outputs(C, D, xout, U, output_indices):
+    # Outputs of the simulated states, the selected states or C @ xout + D @ U
+    if output_indices is not None:
+        return xout[output_indices]
+
+    return C @ xout + D @ U
+
+
+def _forced_response_selected(sys, T, U, X0, dt, output_indices, transpose=False, return_x=False, squeeze=None):
+    # Dense FOH simulation of a continuous time system which stores only the selected states, called by
+    # forced_response for outputs. The memory is O(len(outputs) * n_steps) instead of O(n * n_steps), the full states
+    # are only stored if return_x is True.
+    d_type = np.float32 if sys.bit32 else np.float64
+    n_steps = T.shape[0]
+    if U.ndim == 1:
+        U = U.reshape(1, -1)
+
+    Ad, Bd0, Bd1 = [M.astype(d_type) for M in sys.get_discrete(dt, 'foh')]
+    # fused input matrix [Bd0 Bd1] and the stacked samples [u[i-1]; u[i]] row wise
+    Bd = np.concatenate((Bd0, Bd1), axis=1)
+    W = np.concatenate((U[:, :-1], U[:, 1:])).T.astype(d_type)
+
+    yout = np.empty((len(output_indices), n_steps), dtype=d_type)
+    xout = np.empty((sys.nstates, n_steps), dtype=d_type) if return_x else None
+
+    x = np.array(X0, dtype=d_type)
+    x_next = np.empty_like(x)
+    u_term = np.empty_like(x)
+    yout[:, 0] = x[output_indices]
+    if return_x:
+        xout[:, 0] = x
+
+    for i in range(1, n_steps):
+        np.dot(Ad, x, out=x_next)
+        np.dot(Bd, W[i - 1], out=u_term)
+        x_next += u_term
+        x, x_next = x_next, x
+        yout[:, i] = x[output_indices]
+        if return_x:
+            xout[:, i] = x
+
+    return TimeResponseData(
+        T, yout, xout, U, issiso=sys.ninputs == 1 and len(output_indices) == 1,
+        output_labels=_get_labels(sys, output_indices), state_labels=None if xout is None else sys.state_labels,
+        transpose=transpose, return_x=return_x, squeeze=squeeze)
+
+
+def _forced_response_batch(sys, T, U, X0, dt, transpose=False, return_x=False, squeeze=None, backend='dense',
+                           output_indices=None):
+    # Forced response of K traces in one pass, called by forced_response for X0 (n, K) or U (m, K, n_steps). X0 (n,)
+    # and U (m, n_steps) are shared by all traces. The states of all traces are advanced with one matrix-matrix
+    # product per step and the input terms of all steps are computed before the loop. The result is a multi trace
+    # TimeResponseData with outputs (p, K, n_steps), states (n, K, n_steps) and inputs (m, K, n_steps).
+    if backend not in ['dense', 'krylov', 'trapezoidal', 'backward_euler']:
+        raise ValueError(f"Expect backend to be 'dense', 'krylov', 'trapezoidal' or 'backward_euler' for multiple "
+                         f"traces, not {backend}.")
+    if sys.use_cuda:
+        raise ValueError("Expect use_cuda to be False for multiple traces.")
+
+    if backend == 'dense':
+        C, D = [M.toarray() if sp.sparse.issparse(M) else np.asarray(M) for M in [sys.C, sys.D]]
+    else:
+        C, D = sys.C, sys.D
+    n_states, n_inputs, n_outputs = sys.nstates, sys.ninputs, sys.noutputs
+    n_steps = T.shape[0]
+    d_type = np.float32 if sys.bit32 else np.float64
+
+    U = np.asarray(U, dtype=d_type)
+    X0 = np.asarray(X0, dtype=d_type)
+    if transpose:
+        # (n_steps, K, m) -> (m, K, n_steps)
+        U = np.transpose(U)
+    if U.ndim == 0:
+        U = np.full((n_inputs, n_steps), U)
+    elif U.ndim == 1 and n_inputs == 1:
+        U = U.reshape(1, -1)
+    if X0.ndim == 0:
+        X0 = np.full((n_states,), X0)
+
+    n_traces = U.shape[1] if U.ndim == 3 else X0.shape[1]
+    if U.ndim == 2:
+        U = np.repeat(U[:, None, :], n_traces, axis=1)
+    if X0.ndim == 1:
+        X0 = np.repeat(X0[:, None], n_traces, axis=1)
+
+    if U.shape != (n_inputs, n_traces, n_steps):
+        raise ValueError(f"Parameter ``U``: Expect shape {(n_inputs, n_traces, n_steps)}, but got {U.shape}.")
+    if X0.shape != (n_states, n_traces):
+        raise ValueError(f"Parameter ``X0``: Expect shape {(n_states, n_traces)}, but got {X0.shape}.")
+
+    # states as (n_steps, n, K), every step writes a contiguous block
+    X = np.empty((n_steps, n_states, n_traces), dtype=d_type)
+    X[0] = X0
+
+    if sys.isctime(strict=True):
+        if backend == 'krylov':
+            expm_action = ExpmAction(sys.A, sys.B, dt)
+            for i in range(1, n_steps):
+                X[i] = expm_action.step(X[i-1], U[:, :, i-1], U[:, :, i])
+
+        elif backend in ['trapezoidal', 'backward_euler']:
+            implicit = sys.get_implicit(dt, backend)
+            for i in range(1, n_steps):
+                X[i] = implicit.step(X[i-1], U[:, :, i-1], U[:, :, i])
+
+        else:
+            # input interpolated linearly between the samples (FOH) like in forced_response
+            Ad, Bd0, Bd1 = [M.astype(d_type) for M in sys.get_discrete(dt, 'foh')]
+            U_steps = U.reshape(n_inputs, -1)
+            F = (Bd0 @ U_steps).reshape(n_states, n_traces, n_steps)[:, :, :-1] + \
+                (Bd1 @ U_steps).reshape(n_states, n_traces, n_steps)[:, :, 1:]
+            F = np.ascontiguousarray(np.moveaxis(F, -1, 0))
+
+            for i in range(1, n_steps):
+                np.dot(Ad, X[i-1], out=X[i])
+                X[i] += F[i-1]
+
+    else:
+        if backend != 'dense':
+            raise ValueError(f"Expect a continuous time system for the {backend} backend.")
+        if sys.dt is not True and sys.dt is not None and not np.isclose(dt, sys.dt):
+            raise ValueError("Time steps ``T`` must match sampling time for multiple traces")
+
+        A, B = [(M.toarray() if sp.sparse.issparse(M) else np.asarray(M)).astype(d_type) for M in [sys.A, sys.B]]
+        F = np.ascontiguousarray(np.moveaxis((B @ U.reshape(n_inputs, -1)).reshape(n_states, n_traces, n_steps), -1, 0))
+
+        for i in range(1, n_steps):
+            np.dot(A, X[i-1], out=X[i])
+            X[i] += F[i-1]
+
+    # (n_steps, n, K) -> (n, K, n_steps)
+    xout = np.ascontiguousarray(np.moveaxis(X, 0, -1))
+    if output_indices is not None:
+        return TimeResponseData(
+            T, xout[output_indices], xout, U, issiso=n_inputs == 1 and len(output_indices) == 1,
+            output_labels=_get_labels(sys, output_indices),
+            state_labels=None if xout is None else sys.state_labels,
+            transpose=transpose, return_x=return_x, squeeze=squeeze, multi_trace=True)
+
+    yout = np.asarray(C @ xout.reshape(n_states, -1) + D @ U.reshape(n_inputs, -1))
+    yout = yout.reshape(n_outputs, n_traces, n_steps)
+
+    return TimeResponseData(
+        T, yout, xout, U, issiso=sys.issiso(),
+        transpose=transpose, return_x=return_x, squeeze=squeeze, multi_trace=True)
+
+
+def forced_response_chunks(sys, T, U=0., X0=0., chunk_size=1024, backend='dense', outputs=None):
+    # Generator variant of forced_response for long simulations in bounded memory. The state is carried across chunks
+    # of chunk_size samples and every chunk is yielded as (t_chunk, x_chunk, y_chunk) with x_chunk (n, k) and y_chunk
+    # (p, k), k <= chunk_size. The chunks are views of buffers which are reused for the next chunk, so they have to be
+    # reduced or written (e.g. np.save) before the generator is resumed, or copied. If C is the identity and D is zero,
+    # y_chunk is x_chunk and no second copy of the states is made.
+    # backend: 'dense' (FOH for continuous time systems, like forced_response), 'krylov', 'trapezoidal' or
+    #          'backward_euler', see forced_response
+    # outputs: states yielded as y_chunk, given by label (sys.state_labels) or by index, see forced_response
+    if backend not in ['dense', 'krylov', 'trapezoidal', 'backward_euler']:
+        raise ValueError(f"Expect backend to be 'dense', 'krylov', 'trapezoidal' or 'backward_euler', not {backend}.")
+    if sys.use_cuda:
+        raise ValueError("Expect use_cuda to be False for chunked simulation.")
+    if chunk_size < 1:
+        raise ValueError(f"Expect chunk_size to be at least 1, not {chunk_size}.")
+
+    T = _check_convert_array(T, [('any',), (1, 'any')], 'Parameter ``T``: ', squeeze=True)
+    n_steps = T.shape[0]
+    dt = (T[-1] - T[0]) / (n_steps - 1)
+    if not np.allclose(np.diff(T), dt):
+        raise ValueError("Parameter ``T``: time values must be equally spaced.")
+
+    n_states, n_inputs, n_outputs = sys.nstates, sys.ninputs, sys.noutputs
+    d_type = np.float32 if sys.bit32 else np.float64
+
+    X0 = _check_convert_array(X0, [(n_states,), (n_states, 1)], 'Parameter ``X0``: ', squeeze=True)
+    legal_shapes = [(n_steps,), (1, n_steps)] if n_inputs == 1 else [(n_inputs, n_steps)]
+    U = _check_convert_array(U, legal_shapes, 'Parameter ``U``: ', squeeze=False).astype(d_type)
+    if U.ndim == 1:
+        U = U.reshape(1, -1)
+
+    if sys.isctime(strict=True):
+        if backend == 'krylov':
+            expm_action = ExpmAction(sys.A, sys.B, dt)
+            step = expm_action.step
+        elif backend in ['trapezoidal', 'backward_euler']:
+            step = sys.get_implicit(dt, backend).step
+        else:
+            Ad, Bd0, Bd1 = [M.astype(d_type) for M in sys.get_discrete(dt, 'foh')]
+    else:
+        if backend != 'dense':
+            raise ValueError(f"Expect a continuous time system for the {backend} backend.")
+        if sys.dt is not True and sys.dt is not None and not np.isclose(dt, sys.dt):
+            raise ValueError("Time steps ``T`` must match sampling time for chunked simulation")
+        # x[k+1] = A x[k] + B u[k] in the form of the FOH step
+        Ad, Bd0 = [(M.toarray() if sp.sparse.issparse(M) else np.asarray(M)).astype(d_type) for M in [sys.A, sys.B]]
+        Bd1 = np.zeros_like(Bd0)
+
+    output_indices = _get_output_indices(sys, outputs)
+    if output_indices is not None:
+        n_outputs = len(output_indices)
+
+    C, D = sys.C, sys.D
+    identity_output = output_indices is None and n_outputs == n_states and \
+        (abs(C - sp.sparse.identity(n_states)).max() if sp.sparse.issparse(C) else
+         np.abs(np.asarray(C) - np.eye(n_states)).max()) == 0 and \
+        (D.count_nonzero() == 0 if sp.sparse.issparse(D) else not np.any(D))
+
+    # buffers reused for all chunks, the states are stored row wise so every step writes a contiguous row
+    X = np.empty((chunk_size, n_states), dtype=d_type)
+    Y = X if identity_output else np.empty((chunk_size, n_outputs), dtype=d_type)
+    if backend == 'dense':
+        F = np.empty((chunk_size, n_states), dtype=d_type)
+
+    x = np.asarray(X0, dtype=d_type)
+    for start in range(0, n_steps, chunk_size):
+        stop = min(start + chunk_size, n_steps)
+        k = stop - start
+
+        if start == 0:
+            X[0] = x
+            first = 1
+        else:
+            first = 0
+
+        if backend == 'dense':
+            # input terms of the chunk, F[j] belongs to the step from sample start+j-1 to start+j
+            np.dot(U[:, start + first - 1:stop - 1].T, Bd0.T, out=F[first:k])
+            F[first:k] += U[:, start + first:stop].T @ Bd1.T
+            for j in range(first, k):
+                np.dot(Ad, x, out=X[j])
+                X[j] += F[j]
+                x = X[j]
+        else:
+            for j in range(first, k):
+                X[j] = step(x, U[:, start + j - 1], U[:, start + j])
+                x = X[j]
+
+        # the carried state must not be overwritten by the next chunk
+        x = X[k - 1].copy()
+
+        if output_indices is not None:
+            np.take(X[:k], output_indices, axis=1, out=Y[:k])
+        elif not identity_output:
+            Y[:k] = np.asarray(C @ X[:k].T + D @ U[:, start:stop]).T
+
+        yield T[start:stop], X[:k].T, Y[:k].T
@@ -1,60 +1,135 @@
+"""
+Builds the CM corpus for the timing experiments.
+
+Every grid has the given number of sources and the same number of loads (like NodeConstructor(nodes, nodes)).
+The grid of (nodes, draw) is drawn from its own SeedSequence stream, so the corpus only depends on the seed and not on
+the number of workers or on the other node counts. The grids are appended to CM_matrices/CM_corpus.jsonl as soon as
+they are drawn together with the generation parameters, grids which are already in the file with the same seed and
+parameters are skipped (an interrupted build can be continued, other parameters draw a new corpus in the same file).
+Afterwards the binary corpus read by the timing harness (see cm_corpus.py) is written, optionally also the former
+dense CM_nodes{N}.json files.
+
+Example:
+    python generate_CM.py --nodes 2 4 6 8 10 --loops 30 --workers 8
+"""
+
+import argparse
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from os import makedirs
 
 import numpy as np
-from pre_investigations.python.dare.utils.nodeconstructor import NodeConstructor
+from pre_investigations.python.dare.utils.topology import generate_edges, edges_to_CM
+from pre_investigations.python.solver_investigations.cm_corpus import write_corpus
 
 
-"""
-asd
-"""
+def draw_CM(task):
+    """Draw the edge list of one grid of the corpus
+
+    Args:
+        task: Tuple (seed, nodes, draw, S2S_p, S2L_p, mean_degree)
 
-makedirs('CM_matrices', exist_ok=True)
-
-# define parameters
-R = 0.4
-L = 2.3e-3
-C = 10e-6
-LT = 2.3e-3
-R_load = 14
-
-parameter = dict()
-parameter['R_source'] = R
-parameter['L_source'] = L
-parameter['C_source'] = C
-parameter['L_cable'] = LT
-parameter['R_cable'] = R
-parameter['R_load'] = R_load
-
-# set up CM
-#An entry in the CM reads as follows: Object x (row) is connected to object y (column) via connection line z:
-# x ---z---> y
-CM = np.array([[0, 0, 1],
-               [0, 0, 2],
-               [-1, -2, 0]])
-
-num_nodes = [2, 4, 6, 8, 10]
-loops = 30
-for nodes in num_nodes:
-    CM_array = []
-    for loop in range(loops):
-        # grid with 2 sources, 1 load and a total of 2 connections
-        power_grid = NodeConstructor(nodes, nodes, parameter=parameter, CM = None)
-        #power_grid.draw_graph()
-
-        #print(power_grid.CM)
-
-        CM_array.append(power_grid.CM.tolist())
-
-    with open('CM_matrices/CM_nodes'+str(nodes)+'.json', 'w') as \
-            outfile: json.dump(CM_array, outfile)
+    Returns:
+        (nodes, draw, edges): Node count, draw number and edge list (see dare.utils.topology.generate_edges)
     """
-    f = open('CM_matrices/CM_nodes'+str(nodes)+'.json', "r")
-    # Reading from file
-    CM_load = json.loads(f.read())
 
-    for CM_load_use in CM_array:
-        power_grid_2 = NodeConstructor(nodes, nodes, parameter=parameter, CM=np.array(CM_load_use))
-        power_grid_2.draw_graph()
+    seed, nodes, draw, S2S_p, S2L_p, mean_degree = task
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(nodes, draw)))
+
+    edges = generate_edges(nodes, nodes, S2S_p, S2L_p, mean_degree, rng)
+
+    return nodes, draw, edges
+
+
+def read_corpus(path):
+    """Read the grids of a corpus file
+
+    Returns:
+        corpus: Dict (seed, nodes, draw, S2S_p, S2L_p, mean_degree) -> edge list (num_connections, 2), the parameters
+                are None for entries written without them
     """
 
+    corpus = dict()
+
+    if os.path.exists(path):
+        with open(path, 'r') as infile:
+            for line in infile:
+                entry = json.loads(line)
+                key = (entry['seed'], entry['nodes'], entry['draw'],
+                       entry.get('S2S_p'), entry.get('S2L_p'), entry.get('mean_degree'))
+                corpus[key] = np.array(entry['edges'], dtype=np.int64).reshape(-1, 2)
+
+    return corpus
+
+
+def build_corpus(num_nodes, loops, path='CM_matrices', seed=0, workers=None, S2S_p=0.1, S2L_p=0.8, mean_degree=None,
+                 export_json=False):
+    """Draw loops grids for every node count in a process pool
+
+    Args:
+        num_nodes: Node counts, each grid has nodes sources and nodes loads (list)
+        loops: Number of draws per node count (1,)
+        path: Output directory
+        seed: Root seed of the corpus (1,)
+        workers: Number of processes, if None all cores are used
+        S2S_p: Probability that a source is connected to a source (1,)
+        S2L_p: Probability that a source is connected to a load (1,)
+        mean_degree: Target mean number of cables per element, if None S2S_p and S2L_p are used as they are (1,)
+        export_json: Also write the dense CM_nodes{N}.json files
+
+    Returns:
+        corpus: Dict nodes -> edge lists of the draws (see dare.utils.topology.generate_edges) (list)
+    """
+
+    makedirs(path, exist_ok=True)
+    corpus_file = os.path.join(path, 'CM_corpus.jsonl')
+
+    # a grid is only reused if it was drawn with the same parameters, so corpora of other settings are never mixed
+    params = (S2S_p, S2L_p, mean_degree)
+    done = read_corpus(corpus_file).keys()
+    tasks = [(seed, nodes, draw) + params
+             for nodes in num_nodes for draw in range(loops) if (seed, nodes, draw) + params not in done]
+
+    if tasks:
+        workers = workers or os.cpu_count()
+        chunksize = max(1, len(tasks) // (4*workers))
+
+        # map returns the grids in the order of the tasks, so the file is identical for every number of workers
+        with ProcessPoolExecutor(workers) as pool, open(corpus_file, 'a') as outfile:
+            for nodes, draw, edges in pool.map(draw_CM, tasks, chunksize=chunksize):
+                outfile.write(json.dumps({'seed': seed, 'nodes': nodes, 'draw': draw, 'S2S_p': S2S_p, 'S2L_p': S2L_p,
+                                          'mean_degree': mean_degree, 'edges': edges.tolist()}) + '\n')
+                outfile.flush()
+
+    corpus = read_corpus(corpus_file)
+    drawn = dict()
+    for nodes in num_nodes:
+        edges = [corpus[(seed, nodes, draw) + params] for draw in range(loops)]
+        drawn[nodes] = edges
+        write_corpus(path, nodes, [np.column_stack((e, np.arange(1, len(e)+1))) for e in edges], [2*nodes] * loops)
+
+        if export_json:
+            CM_array = [edges_to_CM(e, 2*nodes).astype(int).tolist() for e in edges]
+
+            with open(os.path.join(path, 'CM_nodes'+str(nodes)+'.json'), 'w') as \
+                    outfile: json.dump(CM_array, outfile)
+
+    return drawn
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the CM corpus for the timing experiments.')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[2, 4, 6, 8, 10], help='node counts')
+    parser.add_argument('--loops', type=int, default=30, help='draws per node count')
+    parser.add_argument('--path', default='CM_matrices', help='output directory')
+    parser.add_argument('--seed', type=int, default=0, help='root seed of the corpus')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--S2S_p', type=float, default=0.1, help='probability of a source-source connection')
+    parser.add_argument('--S2L_p', type=float, default=0.8, help='probability of all other connections')
+    parser.add_argument('--mean_degree', type=float, default=None, help='target mean number of cables per element')
+    parser.add_argument('--json', action='store_true', help='also export the dense CM_nodes{N}.json files')
+    args = parser.parse_args()
+
+    build_corpus(args.nodes, args.loops, args.path, args.seed, args.workers, args.S2S_p, args.S2L_p, args.mean_degree,
+                 export_json=args.json)
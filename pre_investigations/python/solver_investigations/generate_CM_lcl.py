@@ -1,58 +1,65 @@
-import json
-from os import makedirs
-
-import numpy as np
-from pre_investigations.python.dare.utils.nodeconstructor import NodeConstructor
-from pre_investigations.python.dare.utils.nodeconstructorcable import NodeConstructorCable
+"""
+Builds the CM corpus of the grids with LCL filters (NodeConstructorCable) and their parameters.
 
+The CMs are drawn with generate_CM.build_corpus into CM_matrices_lcl, so they come from the same SeedSequence streams,
+are keyed by the same generation parameters and can be continued like the corpus of generate_CM. The parameters of the
+grid (nodes, draw) (cable lengths) are drawn from a further stream of the root seed, so CM_nodes{N}.json and
+parameter_nodes{N}.json only depend on the seed and the generation parameters.
 
-"""
-asd
+Example:
+    python generate_CM_lcl.py --nodes 2 4 6 8 10 --loops 1 --workers 8
 """
 
-makedirs('CM_matrices', exist_ok=True)
+import argparse
+import json
+import os
 
-# define parameters
-R = 0.4
-L = 2.3e-3
-C = 10e-6
-LT = 2.3e-3
-R_load = 14
+import numpy as np
+from pre_investigations.python.dare.utils.nodeconstructorcable import NodeConstructorCable
+from pre_investigations.python.dare.utils.topology import edges_to_CM
+from pre_investigations.python.solver_investigations.generate_CM import build_corpus
 
-parameter = dict()
-parameter['R_source'] = R
-parameter['L_source'] = L
-parameter['C_source'] = C
-parameter['L_cable'] = LT
-parameter['R_cable'] = R
-parameter['R_load'] = R_load
 
-# set up CM
-#An entry in the CM reads as follows: Object x (row) is connected to object y (column) via connection line z:
-# x ---z---> y
-CM = np.array([[0, 0, 1],
-               [0, 0, 2],
-               [-1, -2, 0]])
+def build_lcl_corpus(num_nodes, loops, path='CM_matrices_lcl', seed=0, workers=None, S2S_p=0.1, S2L_p=0.8,
+                     mean_degree=None):
+    """Draw loops grids with LCL filters for every node count and write their CMs and parameters
 
-num_nodes = [2, 4, 6, 8, 10]
-loops = 1
-for nodes in num_nodes:
-    CM_array = []
-    parameter_array = []
-    for loop in range(loops):
-        # grid with 2 sources, 1 load and a total of 2 connections
-        power_grid = NodeConstructorCable(nodes, nodes,  CM = None)
-        #power_grid.draw_graph()
+    Args:
+        num_nodes: Node counts, each grid has nodes sources and nodes loads (list)
+        loops: Number of draws per node count (1,)
+        path: Output directory
+        seed: Root seed of the corpus (1,)
+        workers: Number of processes, if None all cores are used
+        S2S_p: Probability that a source is connected to a source (1,)
+        S2L_p: Probability that a source is connected to a load (1,)
+        mean_degree: Target mean number of cables per element, if None S2S_p and S2L_p are used as they are (1,)
+    """
 
-        #print(power_grid.CM)
+    corpus = build_corpus(num_nodes, loops, path, seed, workers, S2S_p, S2L_p, mean_degree, export_json=True)
 
-        CM_array.append(power_grid.CM.tolist())
-        parameter_array.append(power_grid.parameter)
+    for nodes in num_nodes:
+        parameter_array = []
+        for draw, edges in enumerate(corpus[nodes]):
+            # the stream (nodes, draw, 1) is independent of the one of the CM (nodes, draw)
+            rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(nodes, draw, 1)))
+            power_grid = NodeConstructorCable(nodes, nodes, CM=edges_to_CM(edges, 2*nodes), rng=rng)
+            parameter_array.append(power_grid.parameter)
 
-    with open('CM_matrices_lcl/CM_nodes'+str(nodes)+'.json', 'w') as \
-            outfile: json.dump(CM_array, outfile)
+        with open(os.path.join(path, 'parameter_nodes'+str(nodes)+'.json'), 'w') as \
+                outfile: json.dump(parameter_array, outfile)
 
-    with open('CM_matrices_lcl/parameter_nodes'+str(nodes)+'.json', 'w') as \
-            outfile: json.dump(parameter_array, outfile)
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the CM corpus of the grids with LCL filters.')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[2, 4, 6, 8, 10], help='node counts')
+    parser.add_argument('--loops', type=int, default=1, help='draws per node count')
+    parser.add_argument('--path', default='CM_matrices_lcl', help='output directory')
+    parser.add_argument('--seed', type=int, default=0, help='root seed of the corpus')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--S2S_p', type=float, default=0.1, help='probability of a source-source connection')
+    parser.add_argument('--S2L_p', type=float, default=0.8, help='probability of all other connections')
+    parser.add_argument('--mean_degree', type=float, default=None, help='target mean number of cables per element')
+    args = parser.parse_args()
 
+    build_lcl_corpus(args.nodes, args.loops, args.path, args.seed, args.workers, args.S2S_p, args.S2L_p,
+                     args.mean_degree)
@@ -8,6 +8,8 @@ from pyinstrument import Profiler
 
 from pre_investigations.python.dare.utils.nodeconstructor import NodeConstructor
 import pre_investigations.python.solver_investigations.custom_control as cc
+from pre_investigations.python.solver_investigations.cm_corpus import CMCorpus
+from pre_investigations.python.dare.utils.discretization import discretize
 
 
 num_nodes = 30
@@ -30,17 +32,13 @@ parameter['V_dc'] = 300
 
 t = np.arange(0, 0.03 + ts, ts)
 
-f = open('pre_investigations/python/solver_investigations/CM_matrices/CM_nodes' + str(num_nodes) + '.json', "r")
-CM_list = json.loads(f.read())
-CM = np.array(CM_list[numcm])
+CM = CMCorpus('pre_investigations/python/solver_investigations/CM_matrices').get_CM(num_nodes, numcm)
 
 power_grid = NodeConstructor(num_nodes, num_nodes, parameter, CM=CM)
 
 A_sys, B_sys, C_sys, D_sys = power_grid.get_sys()
 
-A_d = scipy.linalg.expm(A_sys * ts)
-A_inv = scipy.linalg.inv(A_sys)
-B_d = A_inv @ (A_d - np.eye(A_sys.shape[0])) @ B_sys
+A_d, B_d = discretize(A_sys, B_sys, ts, 'zoh')
 C_d = copy.copy(C_sys)
 
 if discrete:
@@ -48,7 +46,7 @@ if discrete:
 else:
     dt = 0
 
-sys = cc.ss(A_d, B_d, C_d, 0, dt=dt, bit32=bit32, offline_expm=offline_expm)
+sys = cc.ss(A_d, B_d, C_d, 0, dt=dt, bit32=bit32, offline_expm=offline_expm, expm_dt=ts)
 
 u_fix = np.array([230] * power_grid.num_source)[:, None] * np.ones(
                                 (power_grid.num_source, len(t)))
@@ -78,7 +76,8 @@ if create_tv:
     test_variables['C'] = C_d.tolist()
     test_variables['D'] = np.zeros((C_d.shape[0], B_d.shape[1])).tolist()
     test_variables['u_fix'] = u_fix.tolist()
-    test_variables['A_d_foh'] = sys.Ad.tolist()
-    test_variables['B1_d_foh'] = sys.Bd1.tolist()
-    test_variables['B0_d_foh'] = sys.Bd0.tolist()
+    A_d_foh, B0_d_foh, B1_d_foh = sys.get_discrete(ts, 'foh')
+    test_variables['A_d_foh'] = A_d_foh.tolist()
+    test_variables['B1_d_foh'] = B1_d_foh.tolist()
+    test_variables['B0_d_foh'] = B0_d_foh.tolist()
     with open('pre_investigations/python/solver_investigations/test_variables.json', 'w') as tv_outfile: json.dump(test_variables, tv_outfile)
\ No newline at end of file
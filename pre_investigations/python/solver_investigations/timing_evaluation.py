@@ -20,6 +20,7 @@ from threadpoolctl import threadpool_limits, threadpool_info
 import numpy as np
 import pandas as pd
 import scipy
+import scipy.sparse
 from scipy.integrate import ode, odeint, solve_ivp
 from stable_baselines3 import DDPG
 from stable_baselines3.common.noise import NormalActionNoise
@@ -31,6 +32,8 @@ import pre_investigations.python.solver_investigations.custom_control as cc
 
 # time measure based on https://note.nkmk.me/en/python-timeit-measure/
 from pre_investigations.python.solver_investigations.visualize import plot_result
+from pre_investigations.python.solver_investigations.cm_corpus import CMCorpus
+from pre_investigations.python.dare.utils.syscache import default_cache
 
 
 def timing_experiment_simulation(repeat: int = 5, loops: int = 10, num_nodes: list[int] = np.arange(2, 12, 2).tolist(),
@@ -41,7 +44,8 @@ def timing_experiment_simulation(repeat: int = 5, loops: int = 10, num_nodes: li
                                  limits: dict = None,
                                  save_data: bool = False,
                                  save_folder_name='saves',
-                                 debug=False):
+                                 debug=False,
+                                 sparse=False):
 
     steps = int(1 / ts)
     makedirs(save_folder_name, exist_ok=True)
@@ -165,8 +169,7 @@ def timing_experiment_simulation(repeat: int = 5, loops: int = 10, num_nodes: li
         for k in range(len(num_nodes)):
 
             # load Cm (num_nodes[k]) [c]
-            f = open('pre_investigations/python/solver_investigations/CM_matrices/CM_nodes' + str(num_nodes[k]) + '.json', "r")
-            CM_list = json.loads(f.read())
+            CM_corpus = CMCorpus('pre_investigations/python/solver_investigations/CM_matrices')
 
             for l in range(len(t_end)):
                 # define time vector
@@ -175,7 +178,7 @@ def timing_experiment_simulation(repeat: int = 5, loops: int = 10, num_nodes: li
 
                 for c in range(num_cm):
 
-                    CM = np.array(CM_list[c])
+                    CM = CM_corpus.get_CM(num_nodes[k], c)
                     power_grid = NodeConstructor(num_nodes[k], num_nodes[k], parameter, CM=CM)
 
                     if methode[n] in ['env_standalone', 'env_agent_interaction']:
@@ -189,17 +192,22 @@ def timing_experiment_simulation(repeat: int = 5, loops: int = 10, num_nodes: li
 
                     else:
 
-                        A_sys, B_sys, C_sys, D_sys = power_grid.get_sys()
+                        # continuous matrices, only the discrete methods below discretize the grid
+                        A_sys, B_sys, C_sys, D_sys = power_grid.get_sys(sparse=sparse)
 
                         use_cuda = False
                         if methode_args[n] == 'cuda':
                             use_cuda = True
 
+                        # simulation backend of custom_control.forced_response
+                        backend = 'dense'
+                        if methode_args[n] in ['krylov', 'modal', 'piecewise', 'trapezoidal', 'backward_euler', 'lifted']:
+                            backend = methode_args[n]
+
                         if methode[n] in ['control.py', 'control.py32']:
-                            A_d = scipy.linalg.expm(A_sys * ts)
-                            A_inv = scipy.linalg.inv(A_sys)
-                            B_d = A_inv @ (A_d - np.eye(A_sys.shape[0])) @ B_sys
-                            C_d = copy.copy(C_sys)
+                            # the system of a grid is discretized once, the other t_end use the cache
+                            system = default_cache.get_system(power_grid, ts, 'zoh', sparse=sparse)
+                            A_d, B_d, C_d = system['A_d'], system['B_d'], system['C']
 
                             if methode[n] in ['control.py32']:
                                 sys = cc.ss(A_d, B_d, C_d, 0, dt=True, bit32=True, use_cuda=use_cuda)
@@ -207,10 +215,20 @@ def timing_experiment_simulation(repeat: int = 5, loops: int = 10, num_nodes: li
                                 sys = cc.ss(A_d, B_d, C_d, 0, dt=True, use_cuda=use_cuda)
 
                         elif methode[n] in ['control.py_con', 'control.py_con32']:
+                            if scipy.sparse.issparse(A_sys) and backend not in ['krylov', 'trapezoidal', 'backward_euler']:
+                                # densify once, the dense backend of custom_control would do it on every call
+                                A_con, B_con, C_con = A_sys.toarray(), B_sys.toarray(), C_sys.toarray()
+                            else:
+                                A_con, B_con, C_con = A_sys, B_sys, C_sys
+                            # only the dense and the lifted backend use the FOH exponential which offline_expm computes
+                            # in advance, the other backends would pay for an unused (dense) expm
+                            offline_expm = backend in ['dense', 'lifted']
                             if methode[n] in ['control.py_con32']:
-                                sys = cc.ss(A_sys, B_sys, C_sys, D_sys, bit32=True, offline_expm=True, use_cuda=use_cuda)
+                                sys = cc.ss(A_con, B_con, C_con, D_sys, bit32=True, offline_expm=offline_expm,
+                                            expm_dt=ts, use_cuda=use_cuda)
                             else:
-                                sys = cc.ss(A_sys, B_sys, C_sys, D_sys, offline_expm=True, use_cuda=use_cuda)
+                                sys = cc.ss(A_con, B_con, C_con, D_sys, offline_expm=offline_expm, expm_dt=ts,
+                                            use_cuda=use_cuda)
 
                         # generate init state
                         x0 = np.zeros((A_sys.shape[0],))
@@ -251,7 +269,8 @@ def timing_experiment_simulation(repeat: int = 5, loops: int = 10, num_nodes: li
                             with threadpool_limits(limits=limit):
                                 #pprint(threadpool_info())
                                 res_list = timeit.repeat(
-                                lambda: cc.forced_response(sys, T=t, U=u_fix, X0=x0, return_x=True, squeeze=True)
+                                lambda: cc.forced_response(sys, T=t, U=u_fix, X0=x0, return_x=True, squeeze=True,
+                                                           backend=backend)
                                 , repeat=repeat, number=loops)
 
                     if methode[n] in ['scipy_ode']: